@@ -123,6 +123,25 @@ CREATE TABLE IF NOT EXISTS reglas_fraude (
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- ===== TABLA PUNTUACIONES DEL MODELO =====
+-- Puntuaciones precalculadas por versión del modelo (servicio fraude, puntuación incremental)
+CREATE TABLE IF NOT EXISTS puntuaciones_transacciones (
+    transaccion_id INTEGER NOT NULL REFERENCES transacciones(id) ON DELETE CASCADE,
+    version_modelo VARCHAR(50) NOT NULL,
+    probabilidad_fraude REAL NOT NULL,
+    nivel_riesgo VARCHAR(10) NOT NULL,
+    prediccion_fraude BOOLEAN NOT NULL,
+    fecha_puntuacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (transaccion_id, version_modelo)
+);
+
+-- Watermark: último id de transacción puntuado por versión del modelo
+CREATE TABLE IF NOT EXISTS progreso_puntuacion (
+    version_modelo VARCHAR(50) PRIMARY KEY,
+    ultimo_transaccion_id INTEGER NOT NULL DEFAULT 0,
+    fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
 -- ===== FUNCIONES AUXILIARES =====
 
 -- Función para actualizar perfil de usuario
@@ -226,6 +245,9 @@ CREATE TRIGGER trigger_actualizar_comerciante
     FOR EACH ROW
     EXECUTE FUNCTION calcular_riesgo_comerciante();
 
+-- El trigger que notifica las inserciones (trigger_notificar_transacciones) no va aquí:
+-- lo crea el servicio de fraude al arrancar sólo si FRAUDE_REALTIME_SCORING=true
+
 -- ===== FOREIGN KEYS =====
 ALTER TABLE transacciones 
     ADD CONSTRAINT fk_transacciones_cuenta_origen 
@@ -256,5 +278,6 @@ CREATE INDEX IF NOT EXISTS idx_comerciantes_riesgo ON comerciantes(nivel_riesgo)
 CREATE INDEX IF NOT EXISTS idx_alertas_transaccion ON alertas_fraude(transaccion_id);
 CREATE INDEX IF NOT EXISTS idx_alertas_nivel ON alertas_fraude(nivel_riesgo);
 CREATE INDEX IF NOT EXISTS idx_perfiles_cuenta ON perfiles_usuario(cuenta_id);
+CREATE INDEX IF NOT EXISTS idx_puntuaciones_version_probabilidad ON puntuaciones_transacciones(version_modelo, probabilidad_fraude DESC, transaccion_id);
 
 \echo '✅ Esquema bank_transactions configurado exitosamente';
\ No newline at end of file
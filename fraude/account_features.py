@@ -0,0 +1,414 @@
+"""
+Características de comportamiento por cuenta
+============================================
+Almacén en memoria, indexado por `cuenta_origen_id`, con agregados móviles de
+1h, 24h y 7 días: cantidad de transacciones, media y varianza del monto, y
+comercios y países distintos. Cada ventana se guarda como un anillo de
+buckets de tiempo (12 de 5 minutos, 24 de 1 hora, 7 de 1 día) en arreglos
+numpy de (cuentas x buckets), así que consultar o actualizar una cuenta cuesta
+O(buckets) sin importar cuántas transacciones tenga.
+
+Las ventanas avanzan por bucket: la de 1h cubre el bucket de 5 minutos actual
+y los 11 anteriores. Los distintos se estiman con un bitmap de 64 bits por
+bucket (cada comercio o país enciende un bit según su hash), así que con
+muchos valores distintos puede haber colisiones; el entrenamiento usa el
+mismo estimador, por lo que el modelo ve exactamente lo que ve la inferencia.
+
+Las sumas se guardan desplazadas por el primer monto visto de cada cuenta, así
+la varianza no pierde precisión cuando los montos son grandes y parecidos. La
+reproducción vectorizada y el camino en línea suman en distinto orden, así que
+sus varianzas difieren en el redondeo; `window_variance` (compartida por ambos)
+descarta todo lo que esté dentro de ese error, de modo que una ventana sin
+dispersión da 0 en los dos caminos.
+
+Las características de una transacción sólo incluyen las transacciones
+anteriores de su cuenta. `features` las calcula para una secuencia completa
+(cada fila ve el estado previo más las filas anteriores de la secuencia) y
+luego incorpora la secuencia al estado; es lo que usan el entrenamiento (con
+un almacén vacío), los análisis de la base y las predicciones en línea. El
+lock del almacén sólo cubre copiar las filas de las cuentas del bloque y
+actualizarlas, no el cálculo, así que un bloque grande no frena las lecturas
+de `features_one`.
+"""
+
+import threading
+import zlib
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+# (sufijo, ancho del bucket en segundos, cantidad de buckets)
+WINDOWS: Tuple[Tuple[str, int, int], ...] = (
+    ('1h', 300, 12),
+    ('24h', 3600, 24),
+    ('7d', 86400, 7),
+)
+
+# Características por ventana, en el orden de las columnas de `features`
+WINDOW_FEATURES = ('account_tx_count', 'account_amount_mean', 'account_amount_var', 'account_merchants', 'account_countries')
+FEATURE_NAMES: List[str] = [f'{name}_{suffix}' for suffix, _, _ in WINDOWS for name in WINDOW_FEATURES]
+
+# Duración de la ventana más larga: lo que hay que recorrer para sembrar el almacén
+HISTORY_SECONDS = max(width * buckets for _, width, buckets in WINDOWS)
+
+# Los montos tienen centavos: una varianza real nunca baja de 2.5e-5, lo menor es
+# redondeo de las sumas (y el scaler lo amplificaría si casi siempre es 0)
+MIN_VARIANCE = 1e-6
+# Error de E[x²] - media² por el orden de las sumas, relativo a E[x²]: unos pocos ulp en el
+# camino en línea y la diferencia de sumas prefijas (en precisión extendida) en la reproducción
+VARIANCE_RELATIVE_TOLERANCE = 1e-9
+
+_EMPTY_BUCKET = np.iinfo(np.int64).min // 2
+# Arreglos (cuentas x buckets) del estado; `_shifts` es (cuentas,)
+_STATE = ('_bucket_ids', '_counts', '_sums', '_squares', '_merchants', '_countries')
+_INITIAL_CAPACITY = 1024
+
+def value_bit(value: Any) -> int:
+    """Bit (un solo bit encendido de 64) que representa un valor en los bitmaps de distintos"""
+    text = '' if value is None or (isinstance(value, float) and value != value) else str(value)
+    return 1 << (zlib.crc32(text.encode('utf-8')) & 63)
+
+def value_bits(values: Any) -> np.ndarray:
+    """value_bit de cada elemento de una columna, hasheando cada valor distinto una sola vez"""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object), use_na_sentinel=True)
+    unique_bits = np.array([value_bit(value) for value in uniques] + [value_bit(None)], dtype=np.uint64)
+    return unique_bits[codes]  # El código -1 (nulo) toma el último elemento
+
+def window_variance(count: np.ndarray, total: np.ndarray, squares: np.ndarray) -> np.ndarray:
+    """
+    Varianza de los montos de cada ventana a partir de sus sumas desplazadas
+
+    La usan los dos caminos: lo que queda por debajo de MIN_VARIANCE o de
+    VARIANCE_RELATIVE_TOLERANCE · E[x²] es redondeo y vale 0.
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_square = np.where(count > 0, squares / count, 0.0)
+        shifted_mean = np.where(count > 0, total / count, 0.0)
+        variance = mean_square - shifted_mean * shifted_mean
+    variance[variance < np.maximum(MIN_VARIANCE, VARIANCE_RELATIVE_TOLERANCE * mean_square)] = 0.0
+    return variance
+
+def _sequential_sum(values: np.ndarray) -> np.ndarray:
+    """Suma de cada fila de izquierda a derecha (`sum` puede agrupar distinto según la forma del arreglo)"""
+    return np.cumsum(values, axis=1)[:, -1]
+
+def popcount(bits: np.ndarray) -> np.ndarray:
+    """Bits encendidos de cada uint64"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(bits).astype(np.int64)
+    as_bytes = np.ascontiguousarray(bits, dtype=np.uint64).view(np.uint8).reshape(-1, 8)
+    return np.unpackbits(as_bytes, axis=1).sum(axis=1, dtype=np.int64)
+
+def _range_or(bits: np.ndarray, starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """OR de bits[start:end] para cada par, con una sparse table (O(n log n))"""
+    result = np.zeros(len(starts), dtype=np.uint64)
+    lengths = ends - starts
+    max_length = int(lengths.max()) if len(lengths) else 0
+    if max_length == 0:
+        return result
+
+    # table[k][j] = OR de bits[j : j + 2^k]
+    table = [bits]
+    while (1 << len(table)) <= max_length:
+        previous, step = table[-1], 1 << (len(table) - 1)
+        level = previous.copy()
+        level[:-step] |= previous[step:]
+        table.append(level)
+
+    present = np.flatnonzero(lengths > 0)
+    levels = np.floor(np.log2(lengths[present])).astype(np.int64)
+    for k in np.unique(levels):
+        rows = present[levels == k]
+        result[rows] = table[k][starts[rows]] | table[k][ends[rows] - (1 << int(k))]
+    return result
+
+class AccountFeatureStore:
+    """Agregados móviles por cuenta en anillos de buckets de tiempo"""
+
+    def __init__(self, capacity: int = _INITIAL_CAPACITY):
+        self.columns = sum(buckets for _, _, buckets in WINDOWS)
+        self._offsets = np.cumsum([0] + [buckets for _, _, buckets in WINDOWS])
+        self._slots: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        # Id de transacción más alto de la base ya incorporado (lo mantiene quien lo siembra)
+        self.last_transaction_id = 0
+        self._lowest_offsets = np.repeat(np.array([buckets - 1 for _, _, buckets in WINDOWS]), [b for _, _, b in WINDOWS])
+        self._widths = np.repeat(np.array([width for _, width, _ in WINDOWS]), [b for _, _, b in WINDOWS])
+        # Celdas de una fila del almacén dentro de una matriz (ventana x bucket) rellena con ceros
+        self._padded_cells = np.arange(max(b for _, _, b in WINDOWS))[None, :] < np.array([b for _, _, b in WINDOWS])[:, None]
+        self._allocate(max(capacity, 1))
+
+    @property
+    def accounts(self) -> int:
+        return len(self._slots)
+
+    def info(self) -> Dict[str, Any]:
+        """Resumen del almacén para logs y respuestas de la API"""
+        arrays = (self._bucket_ids, self._counts, self._sums, self._squares, self._merchants, self._countries, self._shifts)
+        return {
+            'cuentas': self.accounts,
+            'capacidad': len(self._counts),
+            'memoria_mb': round(sum(array.nbytes for array in arrays) / 2**20, 2),
+            'ventanas': [suffix for suffix, _, _ in WINDOWS]
+        }
+
+    def features(self, accounts: np.ndarray, timestamps: np.ndarray, amounts: np.ndarray,
+                 merchant_bits: np.ndarray, country_bits: np.ndarray, update: bool = True) -> np.ndarray:
+        """
+        Características (n, len(FEATURE_NAMES)) de una secuencia de transacciones
+
+        `timestamps` en segundos; `merchant_bits` y `country_bits` vienen de
+        `value_bits`. Cada fila ve el estado actual más las filas anteriores
+        (por timestamp y luego por posición) de su misma cuenta.
+        """
+        accounts = np.asarray(accounts, dtype=np.int64)
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        amounts = np.asarray(amounts, dtype=np.float64)
+        merchant_bits = np.asarray(merchant_bits, dtype=np.uint64)
+        country_bits = np.asarray(country_bits, dtype=np.uint64)
+        n = len(accounts)
+        if n == 0:
+            return np.empty((0, len(FEATURE_NAMES)))
+
+        # Orden por cuenta y tiempo: las transacciones previas de cada fila quedan contiguas
+        order = np.lexsort((np.arange(n), timestamps, accounts))
+        sorted_accounts = accounts[order]
+        group_start = np.flatnonzero(np.r_[True, sorted_accounts[1:] != sorted_accounts[:-1]])
+        group_of = np.repeat(np.arange(len(group_start)), np.diff(np.r_[group_start, n]))
+        positions = np.arange(n)
+
+        # Bajo el lock sólo se copian las filas de las cuentas del bloque: el cálculo (que en
+        # bloques grandes tarda) no frena a features_one ni a otros bloques
+        with self._lock:
+            slots = np.array([self._slots.get(account, -1) for account in sorted_accounts.tolist()], dtype=np.int64)
+            rows, slots[slots >= 0] = np.unique(slots[slots >= 0], return_inverse=True)
+            state = tuple(getattr(self, name)[rows] for name in _STATE)
+            stored_shifts = self._shifts[rows]
+        result = np.empty((n, len(FEATURE_NAMES)))
+
+        # Desplazamiento: el guardado de la cuenta o, si es nueva, su primer monto de la secuencia
+        sorted_amounts = amounts[order]
+        shifts = sorted_amounts[group_start][group_of]
+        shifts[slots >= 0] = stored_shifts[slots[slots >= 0]]
+        shifted = sorted_amounts - shifts
+        values = {'count': np.ones(n), 'sum': shifted, 'square': shifted * shifted}
+        # Sumas prefijas en precisión extendida: sus diferencias no arrastran el error del total acumulado
+        prefix = {name: np.r_[0.0, np.cumsum(column, dtype=np.longdouble)] for name, column in values.items()}
+
+        for index, (_, width, buckets) in enumerate(WINDOWS):
+            bucket = timestamps[order] // width
+            lowest = bucket - buckets + 1
+
+            # Filas previas de la secuencia dentro de la ventana: [start, posición)
+            span = int(bucket.max() - min(lowest.min(), bucket.min())) + 2
+            keys = group_of * span + (bucket - lowest.min())
+            start = np.maximum(np.searchsorted(keys, group_of * span + (lowest - lowest.min()), side='left'),
+                               group_start[group_of])
+
+            count = (prefix['count'][positions] - prefix['count'][start]).astype(np.float64)
+            total = (prefix['sum'][positions] - prefix['sum'][start]).astype(np.float64)
+            squares = (prefix['square'][positions] - prefix['square'][start]).astype(np.float64)
+            merchants = _range_or(merchant_bits[order], start, positions)
+            countries = _range_or(country_bits[order], start, positions)
+
+            # Más lo que ya estaba en el almacén para esas cuentas
+            stored = self._window_totals(state, slots, lowest, index)
+            count = count + stored[0]
+            total = total + stored[1]
+            squares = squares + stored[2]
+            merchants |= stored[3]
+            countries |= stored[4]
+
+            column = index * len(WINDOW_FEATURES)
+            result[order, column:column + len(WINDOW_FEATURES)] = self._finish(
+                count, total, squares, shifts, popcount(merchants), popcount(countries)
+            )
+
+        if update:
+            with self._lock:
+                self._update(accounts, timestamps, amounts, merchant_bits, country_bits)
+
+        return result
+
+    def features_one(self, account: int, timestamp: int, amount: float,
+                     merchant_bit: int, country_bit: int, update: bool = True) -> np.ndarray:
+        """
+        Camino rápido de `features` para una sola transacción (predicción individual)
+
+        Lee la fila de la cuenta completa de una vez en lugar de ventana por
+        ventana; el resultado es el mismo que el de una secuencia de una fila.
+        """
+        result = np.zeros(len(FEATURE_NAMES))
+        with self._lock:
+            slot = self._slots.get(int(account))
+            if slot is not None:
+                lowest = np.asarray(timestamp, dtype=np.int64) // self._widths - self._lowest_offsets
+                valid = self._bucket_ids[slot] >= lowest
+                starts = self._offsets[:-1]
+                count, total, squares = self._window_sums(
+                    np.where(valid, [self._counts[slot], self._sums[slot], self._squares[slot]], 0.0)
+                )
+                merchants = np.bitwise_or.reduceat(np.where(valid, self._merchants[slot], np.uint64(0)), starts)
+                countries = np.bitwise_or.reduceat(np.where(valid, self._countries[slot], np.uint64(0)), starts)
+                result[:] = self._finish(
+                    count, total, squares, self._shifts[slot], popcount(merchants), popcount(countries)
+                ).reshape(-1)
+
+            if update:
+                self._update_one(int(account), int(timestamp), float(amount), int(merchant_bit), int(country_bit))
+        return result
+
+    def update(self, accounts: np.ndarray, timestamps: np.ndarray, amounts: np.ndarray,
+               merchant_bits: np.ndarray, country_bits: np.ndarray):
+        """Incorporar transacciones al estado sin calcular características (siembra)"""
+        with self._lock:
+            self._update(
+                np.asarray(accounts, dtype=np.int64), np.asarray(timestamps, dtype=np.int64),
+                np.asarray(amounts, dtype=np.float64), np.asarray(merchant_bits, dtype=np.uint64),
+                np.asarray(country_bits, dtype=np.uint64)
+            )
+
+    @staticmethod
+    def _finish(count, total, squares, shifts, merchants, countries) -> np.ndarray:
+        """Columnas (cantidad, media, varianza, comercios, países) a partir de las sumas desplazadas"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(count > 0, total / count + shifts, 0.0)
+        return np.column_stack([count, mean, window_variance(count, total, squares), merchants, countries])
+
+    def clear(self):
+        with self._lock:
+            self._slots = {}
+            self.last_transaction_id = 0
+            self._allocate(_INITIAL_CAPACITY)
+
+    def _allocate(self, capacity: int):
+        self._bucket_ids = np.full((capacity, self.columns), _EMPTY_BUCKET, dtype=np.int64)
+        self._counts = np.zeros((capacity, self.columns), dtype=np.int32)
+        self._sums = np.zeros((capacity, self.columns))
+        self._squares = np.zeros((capacity, self.columns))
+        self._merchants = np.zeros((capacity, self.columns), dtype=np.uint64)
+        self._countries = np.zeros((capacity, self.columns), dtype=np.uint64)
+        self._shifts = np.zeros(capacity)
+
+    def _grow(self, needed: int):
+        """Duplicar la capacidad conservando las filas existentes"""
+        capacity = len(self._counts)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        names = _STATE + ('_shifts',)
+        old = [getattr(self, name) for name in names]
+        self._allocate(new_capacity)
+        for name, previous in zip(names, old):
+            getattr(self, name)[:capacity] = previous
+
+    def _window_totals(self, state: Tuple[np.ndarray, ...], slots: np.ndarray, lowest: np.ndarray,
+                       index: int) -> Tuple[np.ndarray, ...]:
+        """Totales guardados de una ventana para cada fila (ceros si la cuenta no tiene historia)
+
+        `state` son los arreglos de `_STATE` (o una copia de algunas de sus filas) y `slots`, filas de `state`.
+        """
+        n = len(slots)
+        known = np.flatnonzero(slots >= 0)
+        count, total, squares = np.zeros(n), np.zeros(n), np.zeros(n)
+        merchants, countries = np.zeros(n, dtype=np.uint64), np.zeros(n, dtype=np.uint64)
+        if len(known) == 0:
+            return count, total, squares, merchants, countries
+
+        columns = slice(self._offsets[index], self._offsets[index + 1])
+        rows = slots[known]
+        valid = state[0][rows, columns] >= lowest[known, None]
+        count[known], total[known], squares[known], merchants[known], countries[known] = \
+            self._stored_totals(state, rows, columns, valid)
+        return count, total, squares, merchants, countries
+
+    def _window_sums(self, rows: np.ndarray) -> np.ndarray:
+        """Suma de cada ventana de filas del almacén (k, columnas) -> (k, ventanas), en el mismo orden que `_stored_totals`"""
+        padded = np.zeros((len(rows),) + self._padded_cells.shape)
+        padded[:, self._padded_cells] = rows
+        return np.cumsum(padded, axis=2)[:, :, -1]
+
+    @staticmethod
+    def _stored_totals(state: Tuple[np.ndarray, ...], rows: np.ndarray, columns: slice,
+                       valid: np.ndarray) -> Tuple[np.ndarray, ...]:
+        """Sumas y OR de los buckets válidos de una ventana para las filas dadas de `state`"""
+        _, counts, sums, squares, merchants, countries = state
+        return (
+            _sequential_sum(np.where(valid, counts[rows, columns], 0.0)),
+            _sequential_sum(np.where(valid, sums[rows, columns], 0.0)),
+            _sequential_sum(np.where(valid, squares[rows, columns], 0.0)),
+            np.bitwise_or.reduce(np.where(valid, merchants[rows, columns], np.uint64(0)), axis=1),
+            np.bitwise_or.reduce(np.where(valid, countries[rows, columns], np.uint64(0)), axis=1),
+        )
+
+    def _update_one(self, account: int, timestamp: int, amount: float, merchant_bit: int, country_bit: int):
+        """`_update` de una sola transacción, sin operaciones vectorizadas"""
+        slot = self._slots.get(account)
+        if slot is None:
+            slot = len(self._slots)
+            self._grow(slot + 1)
+            self._slots[account] = slot
+            self._shifts[slot] = amount
+        shifted = amount - float(self._shifts[slot])
+
+        for index, (_, width, buckets) in enumerate(WINDOWS):
+            bucket = timestamp // width
+            column = int(self._offsets[index]) + bucket % buckets
+            current = int(self._bucket_ids[slot, column])
+            if bucket < current:
+                continue  # Su bucket ya fue reemplazado en el anillo: fuera de toda ventana
+            if bucket > current:
+                self._bucket_ids[slot, column] = bucket
+                self._counts[slot, column] = 0
+                self._sums[slot, column] = 0.0
+                self._squares[slot, column] = 0.0
+                self._merchants[slot, column] = 0
+                self._countries[slot, column] = 0
+            self._counts[slot, column] += 1
+            self._sums[slot, column] += shifted
+            self._squares[slot, column] += shifted * shifted
+            self._merchants[slot, column] |= np.uint64(merchant_bit)
+            self._countries[slot, column] |= np.uint64(country_bit)
+
+    def _update(self, accounts: np.ndarray, timestamps: np.ndarray, amounts: np.ndarray,
+                merchant_bits: np.ndarray, country_bits: np.ndarray):
+        if len(accounts) == 0:
+            return
+
+        # Asignar filas a las cuentas nuevas; su desplazamiento es su primer monto (en orden de tiempo)
+        order = np.lexsort((np.arange(len(accounts)), timestamps, accounts))
+        first = order[np.r_[True, accounts[order][1:] != accounts[order][:-1]]]
+        new_accounts = [(account, amounts[i]) for account, i in zip(accounts[first].tolist(), first) if account not in self._slots]
+        self._grow(len(self._slots) + len(new_accounts))
+        for account, amount in new_accounts:
+            self._slots[account] = len(self._slots)
+            self._shifts[self._slots[account]] = amount
+        slots = np.array([self._slots[account] for account in accounts.tolist()], dtype=np.int64)
+        shifted = amounts - self._shifts[slots]
+
+        bucket_ids, counts, sums = self._bucket_ids.reshape(-1), self._counts.reshape(-1), self._sums.reshape(-1)
+        squares, merchants, countries = self._squares.reshape(-1), self._merchants.reshape(-1), self._countries.reshape(-1)
+
+        for index, (_, width, buckets) in enumerate(WINDOWS):
+            bucket = timestamps // width
+            cells = slots * self.columns + self._offsets[index] + bucket % buckets
+
+            # Cada celda del anillo queda con el bucket más reciente; si cambió, se vacía
+            previous = bucket_ids[cells].copy()
+            np.maximum.at(bucket_ids, cells, bucket)
+            current = bucket_ids[cells]
+            stale = cells[previous != current]
+            counts[stale] = 0
+            sums[stale] = 0.0
+            squares[stale] = 0.0
+            merchants[stale] = 0
+            countries[stale] = 0
+
+            # Las filas de un bucket ya reemplazado en su celda quedaron fuera de toda ventana
+            keep = bucket == current
+            np.add.at(counts, cells[keep], 1)
+            np.add.at(sums, cells[keep], shifted[keep])
+            np.add.at(squares, cells[keep], shifted[keep] * shifted[keep])
+            np.bitwise_or.at(merchants, cells[keep], merchant_bits[keep])
+            np.bitwise_or.at(countries, cells[keep], country_bits[keep])
@@ -14,27 +14,70 @@ Características principales:
 
 import os
 import sys
+import asyncio
+import copy
 import logging
+import multiprocessing
+import uuid
 import numpy as np
 import pandas as pd
 import joblib
 import warnings
-from datetime import datetime, time, date
-from typing import Dict, List, Optional, Tuple, Any
+from datetime import datetime, time, date, timezone
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Any, Union
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import io
 import json
+import pickle
+import shutil
+import threading
 from pathlib import Path
 
 # Importar TOON encoder
 sys.path.append(str(Path(__file__).parent.parent))
 from shared.toon_encoder import encode, estimate_token_savings
 
+# Snapshot local de datos de entrenamiento
+from training_snapshot import TrainingSnapshot
+
+# Evaluación del Random Forest sobre arreglos planos
+from compiled_forest import CompiledForest
+
+# Un solo entrenamiento a la vez entre todos los workers
+from training_lock import TrainingLock
+
+# Agregados móviles por cuenta (velocidad, montos, comercios y países distintos)
+from account_features import AccountFeatureStore, HISTORY_SECONDS, value_bit, value_bits
+from account_features import FEATURE_NAMES as ACCOUNT_FEATURE_NAMES
+
+# Caché LRU + TTL de perfiles de usuario
+from profile_cache import ProfileCache
+
+# Riesgo de comerciantes en memoria (reemplaza el JOIN con `comerciantes`)
+from merchant_risk import MerchantRiskTable
+
+# Reglas de `reglas_fraude` compiladas a predicados vectorizados
+from rules_engine import CompiledRule, RuleInputs, RuleMatches, RulesEngine
+
+# Serialización por columnas de las transacciones marcadas (orjson si está instalado)
+import result_serializer
+
+# Top-N por riesgo y paginación por cursor de los análisis masivos
+from risk_ranking import Cursor, StaleCursorError, decode_cursor, encode_cursor, top_risk_positions
+
+# Reportes ya codificados en memoria, con ETag y refresco por cambio de datos
+from report_cache import ReportCache, etag_matches
+
 # FastAPI y dependencias web
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
 import uvicorn
 
 # Machine Learning
+import sklearn
 from sklearn.model_selection import train_test_split
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.preprocessing import LabelEncoder, StandardScaler
@@ -68,10 +111,21 @@ class Config:
     
     # ML Models
     MODEL_PATH = 'models/'
+    MODEL_BUNDLE_FILE = 'model_bundle.joblib'  # Bundle único por versión (manifiesto + artefactos)
+    SKLEARN_MODEL_FILE = 'random_forest.joblib'  # Random Forest de sklearn, fuera del bundle (sólo para reentrenar)
+    BUNDLE_FORMAT = 2
+    
+    # Archivos separados de versiones anteriores al bundle (sólo lectura)
     FRAUD_MODEL_FILE = 'fraud_detection_model.pkl'
     ENCODERS_FILE = 'label_encoders.pkl'
     SCALER_FILE = 'feature_scaler.pkl'
     FEATURES_FILE = 'feature_names.pkl'
+    STATS_FILE = 'feature_stats.pkl'
+    VERSION_FILE = 'model_version.json'
+    COMPILED_FOREST_FILE = 'compiled_forest.npz'
+    VERSIONS_DIR = 'versions'  # Un directorio de artefactos por versión del modelo
+    CURRENT_VERSION_FILE = 'current_version.json'  # Puntero a la versión en servicio
+    MODEL_VERSIONS_TO_KEEP = int(os.getenv('FRAUDE_MODEL_VERSIONS_TO_KEEP', '3'))
     
     # Configuración del modelo
     RANDOM_STATE = 42
@@ -81,6 +135,104 @@ class Config:
     # Umbrales de detección
     HIGH_RISK_THRESHOLD = 0.7
     MEDIUM_RISK_THRESHOLD = 0.3
+    
+    # Bosque compilado en arreglos planos: se usa para todos los lotes, así los workers
+    # comparten sus arreglos (mmap) en lugar de deserializar cada uno el Random Forest
+    COMPILED_FOREST = os.getenv('FRAUDE_COMPILED_FOREST', 'true').lower() == 'true'
+    COMPILED_FOREST_TOLERANCE = 1e-6
+    
+    # Contribuciones por característica (?explain=true, sobre el bosque compilado): las
+    # EXPLAIN_TOP_FEATURES de mayor valor absoluto por transacción. En /predict_batch se
+    # explican bloques de EXPLAIN_BLOCK_ROWS filas hasta agotar EXPLAIN_BUDGET_MS
+    EXPLAIN_TOP_FEATURES = int(os.getenv('FRAUDE_EXPLAIN_TOP_FEATURES', '5'))
+    EXPLAIN_BUDGET_MS = float(os.getenv('FRAUDE_EXPLAIN_BUDGET_MS', '50'))
+    EXPLAIN_BLOCK_ROWS = 256
+    
+    # Micro-batching de predicciones individuales concurrentes
+    BATCH_WINDOW_MS = float(os.getenv('FRAUDE_BATCH_WINDOW_MS', '2'))
+    BATCH_MAX_SIZE = int(os.getenv('FRAUDE_BATCH_MAX_SIZE', '64'))
+    
+    # Pools de hilos para el trabajo bloqueante: predicciones (light) y análisis de tabla completa (heavy)
+    LIGHT_POOL_WORKERS = int(os.getenv('FRAUDE_LIGHT_POOL_WORKERS', '4'))
+    LIGHT_POOL_MAX_IN_FLIGHT = int(os.getenv('FRAUDE_LIGHT_POOL_MAX_IN_FLIGHT', '256'))
+    HEAVY_POOL_WORKERS = int(os.getenv('FRAUDE_HEAVY_POOL_WORKERS', '2'))
+    HEAVY_POOL_MAX_IN_FLIGHT = int(os.getenv('FRAUDE_HEAVY_POOL_MAX_IN_FLIGHT', '2'))
+    HEAVY_POOL_RETRY_AFTER = int(os.getenv('FRAUDE_HEAVY_POOL_RETRY_AFTER', '30'))
+    
+    # Tamaño máximo de /predict_batch
+    MAX_BATCH_TRANSACTIONS = int(os.getenv('FRAUDE_MAX_BATCH_TRANSACTIONS', '10000'))
+    
+    # Filas por bloque en el análisis por streaming de la base de datos
+    STREAM_CHUNK_SIZE = int(os.getenv('FRAUDE_STREAM_CHUNK_SIZE', '50000'))
+    
+    # Extracción de datos de entrenamiento: 'copy' (COPY ... TO STDOUT) o 'read_sql'
+    TRAINING_EXTRACTION = os.getenv('FRAUDE_TRAINING_EXTRACTION', 'copy')
+    
+    # Snapshot columnar local de los datos de entrenamiento (bajo MODEL_PATH)
+    TRAINING_SNAPSHOT = os.getenv('FRAUDE_TRAINING_SNAPSHOT', 'true').lower() == 'true'
+    SNAPSHOT_DIR = 'training_snapshot'
+    SNAPSHOT_MAX_SEGMENTS = int(os.getenv('FRAUDE_SNAPSHOT_MAX_SEGMENTS', '16'))
+    # Ids por debajo del máximo del snapshot que se vuelven a pedir en cada refresco (como
+    # SCORING_WATERMARK_LOOKBACK): un SERIAL puede confirmar fuera de orden
+    SNAPSHOT_LOOKBACK = int(os.getenv('FRAUDE_SNAPSHOT_LOOKBACK', '1000'))
+    
+    # Puntuación incremental: ids por debajo del watermark que se revisan por si
+    # una transacción con id menor confirmó después de la última corrida
+    SCORING_WATERMARK_LOOKBACK = int(os.getenv('FRAUDE_SCORING_WATERMARK_LOOKBACK', '1000'))
+    
+    # Puntuación en tiempo real: un trigger notifica cada INSERT en `transacciones` y un
+    # consumidor (uno solo entre todos los workers) puntúa lotes nuevos y crea alertas.
+    # Sólo se alerta sobre transacciones insertadas hace menos de REALTIME_ALERT_MAX_AGE_SECONDS
+    # (la repuntuación de la historia con un modelo nuevo no genera alertas)
+    REALTIME_SCORING = os.getenv('FRAUDE_REALTIME_SCORING', 'false').lower() == 'true'
+    REALTIME_CHANNEL = 'transacciones_nuevas'
+    REALTIME_BATCH_SIZE = int(os.getenv('FRAUDE_REALTIME_BATCH_SIZE', '5000'))
+    REALTIME_POLL_SECONDS = float(os.getenv('FRAUDE_REALTIME_POLL_SECONDS', '5'))
+    REALTIME_ALERT_MAX_AGE_SECONDS = float(os.getenv('FRAUDE_REALTIME_ALERT_MAX_AGE_SECONDS', '3600'))
+    
+    # Características de comportamiento por cuenta (1h/24h/7d) en memoria, sembradas desde la base al arrancar
+    ACCOUNT_FEATURES = os.getenv('FRAUDE_ACCOUNT_FEATURES', 'true').lower() == 'true'
+    
+    # Cada cuántos segundos se vuelve a leer `comerciantes` (nivel de riesgo, categoría, tasa de fraude)
+    MERCHANT_REFRESH_SECONDS = float(os.getenv('FRAUDE_MERCHANT_REFRESH_SECONDS', '300'))
+    
+    # Reglas de `reglas_fraude`: se evalúan sobre cada lote y sus ids acompañan los resultados.
+    # Con RULES_SHORT_CIRCUIT, las filas cuya puntuación de reglas (1 - Π(1 - peso) de las
+    # activadas) alcanza RULES_SHORT_CIRCUIT_SCORE se deciden sin pasar por el modelo
+    RULES_ENGINE = os.getenv('FRAUDE_RULES_ENGINE', 'true').lower() == 'true'
+    RULES_SHORT_CIRCUIT = os.getenv('FRAUDE_RULES_SHORT_CIRCUIT', 'false').lower() == 'true'
+    RULES_SHORT_CIRCUIT_SCORE = float(os.getenv('FRAUDE_RULES_SHORT_CIRCUIT_SCORE', '0.95'))
+    RULES_REFRESH_SECONDS = float(os.getenv('FRAUDE_RULES_REFRESH_SECONDS', '60'))
+    
+    # Caché de perfiles de usuario (por worker): máximo de cuentas y segundos de vigencia
+    PROFILE_CACHE_SIZE = int(os.getenv('FRAUDE_PROFILE_CACHE_SIZE', '10000'))
+    PROFILE_CACHE_TTL_SECONDS = float(os.getenv('FRAUDE_PROFILE_CACHE_TTL_SECONDS', '300'))
+    
+    # Reporte TOON (/fraud_report_toon): se sirve desde memoria y cada tantos segundos se
+    # regenera si llegaron o se puntuaron transacciones; un reporte guardado por cada `limit`
+    TOON_REPORT_REFRESH_SECONDS = float(os.getenv('FRAUDE_TOON_REPORT_REFRESH_SECONDS', '30'))
+    TOON_REPORT_CACHE_ENTRIES = int(os.getenv('FRAUDE_TOON_REPORT_CACHE_ENTRIES', '8'))
+    
+    # Servidor (`python app.py`): procesos de uvicorn y recarga automática (sólo desarrollo,
+    # incompatible con WORKERS > 1)
+    WORKERS = int(os.getenv('FRAUDE_WORKERS', '1'))
+    RELOAD = os.getenv('FRAUDE_RELOAD', 'false').lower() == 'true'
+    
+    # Coordinación entre workers: lock de entrenamiento (bajo MODEL_PATH) y cada cuántos
+    # segundos se revisa si otro proceso publicó una versión nueva del modelo
+    TRAINING_LOCK_FILE = 'training.lock'
+    MODEL_POLL_SECONDS = float(os.getenv('FRAUDE_MODEL_POLL_SECONDS', '5'))
+    
+    # Actualización incremental (/train_model?incremental=true): INCREMENTAL_TREES árboles nuevos
+    # ajustados (warm_start) sólo con las transacciones posteriores a la versión en servicio, y
+    # otros tantos descartados según INCREMENTAL_DROP_POLICY ('oldest' o 'least_useful'). La
+    # versión se promueve si el AUC en validación no cae más de INCREMENTAL_MAX_AUC_DROP.
+    # Con INCREMENTAL_UPDATE_SECONDS > 0 se lanza sola cada tantos segundos
+    INCREMENTAL_TREES = int(os.getenv('FRAUDE_INCREMENTAL_TREES', '10'))
+    INCREMENTAL_DROP_POLICY = os.getenv('FRAUDE_INCREMENTAL_DROP_POLICY', 'oldest')
+    INCREMENTAL_MIN_SAMPLES = int(os.getenv('FRAUDE_INCREMENTAL_MIN_SAMPLES', '500'))
+    INCREMENTAL_MAX_AUC_DROP = float(os.getenv('FRAUDE_INCREMENTAL_MAX_AUC_DROP', '0.005'))
+    INCREMENTAL_UPDATE_SECONDS = float(os.getenv('FRAUDE_INCREMENTAL_UPDATE_SECONDS', '0'))
 
 # Instancia de configuración
 config = Config()
@@ -96,12 +248,16 @@ class TransactionInput(BaseModel):
     ubicacion: str = Field(..., description="Ubicación de la transacción")
     tipo_tarjeta: str = Field(..., description="Tipo de tarjeta: Débito, Crédito, Prepaga")
     horario_transaccion: str = Field(..., description="Horario en formato HH:MM:SS")
-    cuenta_origen_id: Optional[int] = Field(1001, description="ID de cuenta origen (opcional)")
+    cuenta_origen_id: Optional[int] = Field(None, description="ID de cuenta origen (opcional; sin cuenta no hay historia por cuenta)")
     categoria_comerciante: Optional[str] = Field("Varios", description="Categoría del comerciante")
     ciudad: Optional[str] = Field("Buenos Aires", description="Ciudad")
     pais: Optional[str] = Field("Argentina", description="País")
     canal: Optional[str] = Field("online", description="Canal de la transacción")
 
+class BatchTransactionInput(TransactionInput):
+    """Transacción dentro de un lote, con identificador opcional del sistema de origen"""
+    id: Optional[Union[int, str]] = Field(None, description="Identificador de la transacción (por defecto, su posición)")
+
 class PredictionResponse(BaseModel):
     """Respuesta para predicción individual"""
     prediccion_fraude: bool
@@ -112,6 +268,23 @@ class PredictionResponse(BaseModel):
     timestamp: str
     razones_deteccion: List[str]
     confianza_modelo: float
+    reglas_activadas: List[int] = []
+    contribuciones: Optional[Dict[str, float]] = None  # Con explain=true: característica -> aporte a la probabilidad
+    contribucion_base: Optional[float] = None  # Probabilidad base del bosque (base + Σ aportes = probabilidad)
+
+class BatchPredictionResponse(BaseModel):
+    """Respuesta columnar para predicción por lotes"""
+    total_transacciones: int
+    fraudes_detectados: int
+    tiempo_procesamiento: float
+    timestamp: str
+    ids: List[Union[int, str]]
+    probabilidades: List[float]
+    niveles_riesgo: List[str]
+    razones_deteccion: Optional[List[List[str]]] = None
+    reglas_activadas: Optional[List[List[int]]] = None
+    contribuciones: Optional[List[Optional[Dict[str, float]]]] = None  # None en las filas sin explicar
+    contribucion_base: Optional[float] = None
 
 class DatabaseAnalysisResponse(BaseModel):
     """Respuesta para análisis de base de datos"""
@@ -119,8 +292,9 @@ class DatabaseAnalysisResponse(BaseModel):
     total_transacciones_analizadas: int
     tiempo_procesamiento: float
     timestamp: str
-    resultados: List[Dict]
+    resultados: Union[List[Dict], Dict[str, Any]]  # Registros o, con columnar=true, {columns, rows}
     resumen_estadisticas: Dict
+    siguiente_cursor: Optional[str] = None  # Con `limit`: cursor de la página siguiente (None si no hay más)
 
 # =====================================================
 # GESTOR DE BASE DE DATOS
@@ -136,6 +310,9 @@ class DatabaseManager:
             f"{config.DB_HOST}:{config.DB_PORT}/{config.DB_NAME}"
         )
         self.engine = create_engine(self.connection_string)
+        self.profile_cache = ProfileCache(config.PROFILE_CACHE_SIZE, config.PROFILE_CACHE_TTL_SECONDS)
+        self.merchant_risk = MerchantRiskTable()
+        self.fraud_rules = RulesEngine()
     
     def test_connection(self) -> bool:
         """Probar conexión a la base de datos"""
@@ -148,90 +325,657 @@ class DatabaseManager:
             logger.error(f"❌ Error conectando a base de datos: {e}")
             return False
     
+    # Transacciones sin JOIN: los datos de riesgo del comerciante los agrega `with_merchant_risk`
+    TRANSACTIONS_QUERY = """
+        SELECT t.*
+        FROM transacciones t
+    """
+    
+    MERCHANTS_QUERY = "SELECT codigo_comerciante, nivel_riesgo, categoria, tasa_fraude FROM comerciantes"
+    
+    def refresh_merchant_risk(self):
+        """Volver a leer `comerciantes` y reemplazar la tabla en memoria"""
+        merchants = pd.read_sql(self.MERCHANTS_QUERY, self.engine)
+        self.merchant_risk.load(merchants)
+        logger.info(f"🏪 Tabla de riesgo de comerciantes cargada: {len(self.merchant_risk)} comerciantes")
+    
+    RULES_QUERY = "SELECT id, nombre, descripcion, condicion, peso FROM reglas_fraude WHERE activa ORDER BY id"
+    
+    def refresh_fraud_rules(self):
+        """Volver a leer las reglas activas de `reglas_fraude` y recompilarlas"""
+        self.fraud_rules.load(pd.read_sql(self.RULES_QUERY, self.engine))
+        skipped = f" ({len(self.fraud_rules.skipped)} ignoradas)" if self.fraud_rules.skipped else ""
+        logger.info(f"📏 Reglas de fraude compiladas: {len(self.fraud_rules)}{skipped}")
+    
+    def with_merchant_risk(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Agregar las columnas comerciante_* (nivel de riesgo, categoría y tasa de fraude) desde memoria"""
+        if not self.merchant_risk.loaded:
+            self.refresh_merchant_risk()
+        return self.merchant_risk.attach(df)
+    
     def get_all_transactions(self) -> pd.DataFrame:
         """Obtener todas las transacciones para entrenamiento"""
-        query = """
-        SELECT 
-            t.*,
-            c.nivel_riesgo as comerciante_nivel_riesgo,
-            c.categoria as comerciante_categoria_real,
-            c.tasa_fraude as comerciante_tasa_fraude
-        FROM transacciones t
-        LEFT JOIN comerciantes c ON t.comerciante = c.codigo_comerciante
+        query = self.TRANSACTIONS_QUERY + """
         ORDER BY t.fecha_transaccion DESC, t.horario_transaccion DESC
         """
         
         try:
-            df = pd.read_sql(query, self.engine)
+            df = self.with_merchant_risk(pd.read_sql(query, self.engine))
             logger.info(f"📊 Cargadas {len(df)} transacciones de la base de datos")
             return df
         except Exception as e:
             logger.error(f"❌ Error cargando transacciones: {e}")
             raise
     
+    # Columnas que usa el entrenamiento y su dtype compacto al leer el COPY.
+    # Los montos quedan en float64: DECIMAL(15,2) no cabe en float32 sin perder
+    # centavos y la inferencia los recibe en float64.
+    TRAINING_COLUMNS: Dict[str, Any] = {
+        't.id': np.int32,
+        't.cuenta_origen_id': np.int32,
+        't.monto': np.float64,
+        't.comerciante': 'category',
+        't.categoria_comerciante': 'category',
+        't.ubicacion': 'category',
+        't.ciudad': 'category',
+        't.pais': 'category',
+        't.tipo_tarjeta': 'category',
+        't.canal': 'category',
+        't.horario_transaccion': 'category',
+        't.fecha_transaccion': 'category',
+        't.es_fraude': bool,
+        't.monto_cuenta_origen': np.float64,
+        't.distancia_ubicacion_usual': np.float32,
+    }
+    
+    def get_training_transactions(self) -> pd.DataFrame:
+        """Transacciones para entrenamiento por la vía configurada (COPY por defecto)"""
+        if self.config.TRAINING_EXTRACTION == 'copy':
+            return self.with_merchant_risk(self.copy_transactions())
+        return self.get_all_transactions()
+    
+    def copy_transactions(self, since_id: Optional[int] = None) -> pd.DataFrame:
+        """
+        Obtener las transacciones de entrenamiento con COPY (SELECT ...) TO STDOUT
+        
+        El CSV que produce PostgreSQL se lee directamente desde un pipe con el
+        parser en C de pandas, sin crear objetos Decimal/str por fila, y cada
+        columna se carga con un dtype compacto (int32, float32, category).
+        Con `since_id` sólo se copian las transacciones posteriores, en orden de id.
+        No incluye las columnas comerciante_* (ver `with_merchant_risk`).
+        """
+        columns = ',\n'.join(self.TRAINING_COLUMNS)
+        if since_id is None:
+            filter_sql = "ORDER BY t.fecha_transaccion DESC, t.horario_transaccion DESC"
+        else:
+            filter_sql = f"WHERE t.id > {int(since_id)} ORDER BY t.id"
+        copy_sql = f"""
+        COPY (
+            SELECT {columns}
+            FROM transacciones t
+            {filter_sql}
+        ) TO STDOUT WITH (FORMAT csv, HEADER true)
+        """
+        
+        read_fd, write_fd = os.pipe()
+        copy_error: List[BaseException] = []
+        conn = self.engine.raw_connection()
+        
+        def produce():
+            try:
+                with os.fdopen(write_fd, 'wb') as sink, conn.cursor() as cur:
+                    cur.copy_expert(copy_sql, sink)
+            except BaseException as e:
+                copy_error.append(e)
+        
+        producer = threading.Thread(target=produce, name="copy-transactions", daemon=True)
+        try:
+            producer.start()
+            try:
+                with os.fdopen(read_fd, 'rb') as source:
+                    df = self.read_copy_csv(source)
+            finally:
+                # Cerrar el extremo de lectura desbloquea al productor si el parser falló
+                producer.join()
+            if copy_error:
+                raise copy_error[0]
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(f"❌ Error copiando transacciones: {e}")
+            raise
+        finally:
+            conn.close()
+        
+        logger.info(f"📊 Copiadas {len(df)} transacciones de la base de datos ({df.memory_usage(deep=True).sum() / 2**20:.1f} MB)")
+        return df
+    
+    @classmethod
+    def read_copy_csv(cls, source) -> pd.DataFrame:
+        """Parsear la salida CSV de COPY con los dtypes de TRAINING_COLUMNS"""
+        dtypes = {column.split('.')[-1]: dtype for column, dtype in cls.TRAINING_COLUMNS.items()}
+        return pd.read_csv(
+            source,
+            dtype={name: dtype for name, dtype in dtypes.items() if dtype is not bool},
+            true_values=['t'], false_values=['f'],
+            engine='c', low_memory=False
+        )
+    
+    def iter_transactions(self, chunk_size: int) -> Iterator[pd.DataFrame]:
+        """
+        Recorrer todas las transacciones en bloques de `chunk_size` filas
+        
+        Usa un cursor del lado del servidor (stream_results), así que sólo un bloque
+        vive en memoria a la vez. El orden por id aprovecha la clave primaria y
+        permite empezar a emitir filas sin ordenar la tabla completa.
+        """
+        query = sqlalchemy.text(self.TRANSACTIONS_QUERY + " ORDER BY t.id")
+        
+        with self.engine.connect().execution_options(stream_results=True, max_row_buffer=chunk_size) as conn:
+            for chunk in pd.read_sql(query, conn, chunksize=chunk_size):
+                yield self.with_merchant_risk(chunk)
+    
+    # Almacén de puntuaciones precalculadas (también en 01-schema.sql para bases nuevas)
+    SCORING_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS puntuaciones_transacciones (
+            transaccion_id INTEGER NOT NULL REFERENCES transacciones(id) ON DELETE CASCADE,
+            version_modelo VARCHAR(50) NOT NULL,
+            probabilidad_fraude REAL NOT NULL,
+            nivel_riesgo VARCHAR(10) NOT NULL,
+            prediccion_fraude BOOLEAN NOT NULL,
+            fecha_puntuacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (transaccion_id, version_modelo)
+        );
+        CREATE INDEX IF NOT EXISTS idx_puntuaciones_version_probabilidad
+            ON puntuaciones_transacciones(version_modelo, probabilidad_fraude DESC, transaccion_id);
+        CREATE TABLE IF NOT EXISTS progreso_puntuacion (
+            version_modelo VARCHAR(50) PRIMARY KEY,
+            ultimo_transaccion_id INTEGER NOT NULL DEFAULT 0,
+            fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """
+    
+    def ensure_scoring_tables(self):
+        """Crear las tablas de puntuación si la base se inicializó antes de que existieran"""
+        with self.engine.begin() as conn:
+            conn.execute(sqlalchemy.text(self.SCORING_SCHEMA))
+    
+    # Trigger de la puntuación en tiempo real (también en 01-schema.sql para bases nuevas).
+    # Por sentencia y sin payload: un INSERT masivo produce una sola notificación
+    REALTIME_TRIGGER_SCHEMA = """
+        CREATE OR REPLACE FUNCTION notificar_transacciones_nuevas()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            PERFORM pg_notify('{channel}', '');
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+        
+        CREATE OR REPLACE TRIGGER trigger_notificar_transacciones
+            AFTER INSERT ON transacciones
+            FOR EACH STATEMENT
+            EXECUTE FUNCTION notificar_transacciones_nuevas();
+    """
+    
+    def ensure_realtime_trigger(self):
+        """Instalar (o actualizar) el trigger que notifica las transacciones nuevas"""
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(self.REALTIME_TRIGGER_SCHEMA.format(channel=self.config.REALTIME_CHANNEL))
+    
+    def drop_realtime_trigger(self) -> bool:
+        """
+        Quitar el trigger de notificación si quedó de cuando la puntuación en tiempo real estaba activa
+        
+        Se consulta pg_trigger antes: el DROP bloquea `transacciones` y en el caso
+        normal (sin trigger) no hace falta tomar ese lock.
+        """
+        with self.engine.begin() as conn:
+            installed = conn.execute(sqlalchemy.text(
+                "SELECT 1 FROM pg_trigger "
+                "WHERE tgname = 'trigger_notificar_transacciones' AND tgrelid = 'transacciones'::regclass"
+            )).fetchone() is not None
+            if installed:
+                conn.execute(sqlalchemy.text("DROP TRIGGER IF EXISTS trigger_notificar_transacciones ON transacciones"))
+        return installed
+    
+    def listener_connect_kwargs(self) -> Dict[str, Any]:
+        """Parámetros de psycopg2.connect para la conexión dedicada de LISTEN"""
+        return {
+            'host': self.config.DB_HOST, 'port': self.config.DB_PORT, 'user': self.config.DB_USER,
+            'password': self.config.DB_PASSWORD, 'dbname': self.config.DB_NAME
+        }
+    
+    def get_scoring_watermark(self, version: str) -> int:
+        """Último id de transacción puntuado con una versión del modelo (0 si nunca)"""
+        query = "SELECT ultimo_transaccion_id FROM progreso_puntuacion WHERE version_modelo = :version"
+        with self.engine.connect() as conn:
+            result = conn.execute(sqlalchemy.text(query), {"version": version}).fetchone()
+        return int(result[0]) if result else 0
+    
+    # Transacciones con id > since_id aún sin puntuación para una versión
+    UNSCORED_FILTER = """
+        WHERE t.id > :since_id
+          AND NOT EXISTS (
+              SELECT 1 FROM puntuaciones_transacciones p
+              WHERE p.transaccion_id = t.id AND p.version_modelo = :version
+          )
+        ORDER BY t.id
+    """
+    
+    def iter_unscored_transactions(self, version: str, since_id: int, chunk_size: int) -> Iterator[pd.DataFrame]:
+        """Recorrer en bloques las transacciones con id > since_id aún sin puntuación para `version`"""
+        query = sqlalchemy.text(self.TRANSACTIONS_QUERY + self.UNSCORED_FILTER)
+        
+        with self.engine.connect().execution_options(stream_results=True, max_row_buffer=chunk_size) as conn:
+            for chunk in pd.read_sql(query, conn, params={"since_id": since_id, "version": version}, chunksize=chunk_size):
+                yield self.with_merchant_risk(chunk)
+    
+    def get_unscored_batch(self, version: str, since_id: int, limit: int) -> pd.DataFrame:
+        """
+        Siguientes `limit` transacciones sin puntuación para `version`, en orden de id
+        
+        Incluye `segundos_desde_insercion` (según el reloj de la base) para medir el retraso.
+        """
+        query = sqlalchemy.text("""
+        SELECT t.*, EXTRACT(EPOCH FROM (LOCALTIMESTAMP - t.created_at))::float8 AS segundos_desde_insercion
+        FROM transacciones t
+        """ + self.UNSCORED_FILTER + " LIMIT :limit")
+        df = pd.read_sql(query, self.engine, params={"since_id": since_id, "version": version, "limit": int(limit)})
+        return self.with_merchant_risk(df)
+    
+    def get_max_transaction_id(self) -> int:
+        with self.engine.connect() as conn:
+            return int(conn.execute(sqlalchemy.text("SELECT COALESCE(MAX(id), 0) FROM transacciones")).scalar())
+    
+    def get_scoring_state(self, version: str) -> Tuple[int, int]:
+        """(último id de transacción, watermark de `version`) en una consulta: cambia si llegan o se puntúan transacciones"""
+        query = """
+        SELECT (SELECT COALESCE(MAX(id), 0) FROM transacciones),
+               COALESCE((SELECT ultimo_transaccion_id FROM progreso_puntuacion WHERE version_modelo = :version), 0)
+        """
+        with self.engine.connect() as conn:
+            latest_id, watermark = conn.execute(sqlalchemy.text(query), {"version": version}).fetchone()
+        return int(latest_id), int(watermark)
+    
+    # Alertas para las puntuaciones recién insertadas (RETURNING de tmp_puntuaciones):
+    # sólo transacciones marcadas e insertadas hace menos de `max_age` segundos
+    ALERTS_FROM_SCORES = """
+        WITH nuevas AS (
+            INSERT INTO puntuaciones_transacciones SELECT * FROM tmp_puntuaciones
+            ON CONFLICT (transaccion_id, version_modelo) DO NOTHING
+            RETURNING transaccion_id, probabilidad_fraude, nivel_riesgo, prediccion_fraude
+        )
+        INSERT INTO alertas_fraude (transaccion_id, tipo_alerta, nivel_riesgo, puntuacion_riesgo, descripcion)
+        SELECT 
+            n.transaccion_id,
+            'modelo_ml_tiempo_real',
+            CASE n.nivel_riesgo WHEN 'HIGH' THEN 'alto' WHEN 'MEDIUM' THEN 'medio' ELSE 'bajo' END,
+            ROUND(n.probabilidad_fraude::numeric, 2),
+            'Probabilidad de fraude ' || to_char(n.probabilidad_fraude * 100, 'FM990.0') || '%% (modelo ' || %(version)s || ')'
+        FROM nuevas n
+        JOIN transacciones t ON t.id = n.transaccion_id
+        WHERE n.prediccion_fraude
+          AND t.created_at >= LOCALTIMESTAMP - make_interval(secs => %(max_age)s)
+    """
+    
+    def save_scores(self, version: str, scores: pd.DataFrame, alert_max_age_seconds: Optional[float] = None) -> int:
+        """
+        Guardar puntuaciones con COPY y avanzar el watermark en la misma transacción
+        
+        `scores` debe tener las columnas transaccion_id, probabilidad_fraude,
+        nivel_riesgo y prediccion_fraude. Con `alert_max_age_seconds` también se
+        crean, en la misma transacción, alertas en `alertas_fraude` para las
+        transacciones marcadas recientes cuya puntuación no existía (así una
+        transacción puntuada dos veces no genera dos alertas). Devuelve la
+        cantidad de alertas creadas.
+        """
+        if scores.empty:
+            return 0
+        alerts = 0
+        
+        buffer = io.StringIO()
+        scores.assign(version_modelo=version)[
+            ['transaccion_id', 'version_modelo', 'probabilidad_fraude', 'nivel_riesgo', 'prediccion_fraude']
+        ].to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+        
+        conn = self.engine.raw_connection()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    CREATE TEMP TABLE tmp_puntuaciones
+                    (LIKE puntuaciones_transacciones INCLUDING DEFAULTS) ON COMMIT DROP
+                """)
+                cur.copy_expert("""
+                    COPY tmp_puntuaciones (transaccion_id, version_modelo, probabilidad_fraude, nivel_riesgo, prediccion_fraude)
+                    FROM STDIN WITH (FORMAT csv)
+                """, buffer)
+                if alert_max_age_seconds is None:
+                    cur.execute("""
+                        INSERT INTO puntuaciones_transacciones SELECT * FROM tmp_puntuaciones
+                        ON CONFLICT (transaccion_id, version_modelo) DO NOTHING
+                    """)
+                else:
+                    cur.execute(self.ALERTS_FROM_SCORES, {"version": version, "max_age": float(alert_max_age_seconds)})
+                    alerts = cur.rowcount
+                cur.execute("""
+                    INSERT INTO progreso_puntuacion (version_modelo, ultimo_transaccion_id)
+                    VALUES (%s, %s)
+                    ON CONFLICT (version_modelo) DO UPDATE SET
+                        ultimo_transaccion_id = GREATEST(progreso_puntuacion.ultimo_transaccion_id, EXCLUDED.ultimo_transaccion_id),
+                        fecha_actualizacion = CURRENT_TIMESTAMP
+                """, (version, int(scores['transaccion_id'].max())))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return alerts
+    
+    def prune_scores(self, keep_version: str) -> int:
+        """Eliminar puntuaciones y watermarks de versiones anteriores del modelo"""
+        with self.engine.begin() as conn:
+            deleted = conn.execute(sqlalchemy.text(
+                "DELETE FROM puntuaciones_transacciones WHERE version_modelo <> :version"
+            ), {"version": keep_version}).rowcount
+            conn.execute(sqlalchemy.text(
+                "DELETE FROM progreso_puntuacion WHERE version_modelo <> :version"
+            ), {"version": keep_version})
+        return deleted
+    
+    def get_scored_flagged(self, version: str, min_probability: float = 0.5, limit: Optional[int] = None,
+                           after: Optional[Cursor] = None) -> pd.DataFrame:
+        """
+        Transacciones con probabilidad guardada >= min_probability, de mayor a menor riesgo
+        
+        Recorre idx_puntuaciones_version_probabilidad: con `limit` se leen sólo esas
+        filas y `after` (probabilidad, id) arranca el recorrido después de la última
+        fila de la página anterior, sin OFFSET.
+        """
+        params: Dict[str, Any] = {"version": version, "min_probability": min_probability}
+        keyset = ""
+        if after is not None:
+            # La cota `<=` posiciona el recorrido del índice; el OR sólo descarta los empates ya devueltos
+            keyset = """
+            AND p.probabilidad_fraude <= :after_probability
+            AND (p.probabilidad_fraude < :after_probability OR p.transaccion_id > :after_id)"""
+            params.update(after_probability=after[0], after_id=after[1])
+        page = ""
+        if limit is not None:
+            page = "LIMIT :limit"
+            params["limit"] = limit
+        
+        query = sqlalchemy.text(f"""
+        SELECT 
+            t.id, t.cuenta_origen_id, t.cuenta_destino_id, t.monto, t.comerciante,
+            t.ubicacion, t.tipo_tarjeta, t.fecha_transaccion, t.horario_transaccion, t.es_fraude,
+            t.pais, t.distancia_ubicacion_usual, p.probabilidad_fraude, p.nivel_riesgo,
+            CASE WHEN p.prediccion_fraude THEN 'FRAUDE' ELSE 'NORMAL' END AS prediccion
+        FROM puntuaciones_transacciones p
+        JOIN transacciones t ON t.id = p.transaccion_id
+        WHERE p.version_modelo = :version AND p.probabilidad_fraude >= :min_probability{keyset}
+        ORDER BY p.probabilidad_fraude DESC, p.transaccion_id
+        {page}
+        """)
+        return pd.read_sql(query, self.engine, params=params)
+    
+    def get_score_summary(self, version: str, min_probability: float = 0.5) -> Dict[str, int]:
+        """Conteos agregados de las puntuaciones guardadas para una versión"""
+        query = sqlalchemy.text("""
+        SELECT 
+            COUNT(*) AS total,
+            COUNT(*) FILTER (WHERE p.probabilidad_fraude >= :min_probability) AS detectados,
+            COUNT(*) FILTER (WHERE t.es_fraude) AS fraudes_reales
+        FROM puntuaciones_transacciones p
+        JOIN transacciones t ON t.id = p.transaccion_id
+        WHERE p.version_modelo = :version
+        """)
+        with self.engine.connect() as conn:
+            row = conn.execute(query, {"version": version, "min_probability": min_probability}).fetchone()
+        return {'total': int(row[0]), 'detectados': int(row[1]), 'fraudes_reales': int(row[2])}
+    
+    def get_account_activity(self, since_date: date, until_id: int) -> pd.DataFrame:
+        """Transacciones desde `since_date` con id <= until_id (la historia por cuenta que precede a las nuevas)"""
+        query = sqlalchemy.text("""
+        SELECT t.id, t.cuenta_origen_id, t.monto, t.comerciante, t.pais, t.fecha_transaccion, t.horario_transaccion
+        FROM transacciones t
+        WHERE t.fecha_transaccion >= :since_date AND t.id <= :until_id
+        ORDER BY t.id
+        """)
+        return pd.read_sql(query, self.engine, params={"since_date": since_date, "until_id": int(until_id)})
+    
+    def get_recent_activity(self, days: int) -> pd.DataFrame:
+        """Transacciones de los últimos `days` días (respecto de la más reciente) para sembrar el almacén por cuenta"""
+        query = sqlalchemy.text("""
+        SELECT t.id, t.cuenta_origen_id, t.monto, t.comerciante, t.pais, t.fecha_transaccion, t.horario_transaccion
+        FROM transacciones t
+        WHERE t.fecha_transaccion >= (SELECT MAX(fecha_transaccion) FROM transacciones) - :days
+        ORDER BY t.id
+        """)
+        return pd.read_sql(query, self.engine, params={"days": int(days)})
+    
     def get_user_profile(self, cuenta_id: int) -> Optional[Dict]:
         """Obtener perfil de comportamiento del usuario"""
-        query = """
-        SELECT * FROM perfiles_usuario WHERE cuenta_id = %s
+        return self.get_user_profiles([cuenta_id]).get(int(cuenta_id))
+    
+    def get_user_profiles(self, cuenta_ids: Iterable[int]) -> Dict[int, Optional[Dict]]:
+        """
+        Perfiles de varias cuentas con una sola consulta para las que no están en caché
+        
+        Devuelve un perfil (o None si la cuenta no tiene) por cada id pedido. Si la
+        consulta falla, las cuentas afectadas quedan en None y no se guardan en caché.
         """
+        profiles, missing = self.profile_cache.get_many(int(cuenta_id) for cuenta_id in cuenta_ids)
+        if not missing:
+            return profiles
         
+        query = sqlalchemy.text("SELECT * FROM perfiles_usuario WHERE cuenta_id = ANY(:cuenta_ids)")
         try:
             with self.engine.connect() as conn:
-                result = conn.execute(sqlalchemy.text(query), {"cuenta_id": cuenta_id}).fetchone()
-                if result:
-                    return dict(result._mapping)
-                return None
+                rows = conn.execute(query, {"cuenta_ids": missing}).fetchall()
         except Exception as e:
-            logger.warning(f"⚠️ No se pudo obtener perfil del usuario {cuenta_id}: {e}")
-            return None
+            logger.warning(f"⚠️ No se pudieron obtener perfiles de {len(missing)} cuentas: {e}")
+            profiles.update(dict.fromkeys(missing))
+            return profiles
+        
+        fetched = dict.fromkeys(missing)
+        fetched.update({row._mapping['cuenta_id']: dict(row._mapping) for row in rows})
+        self.profile_cache.put_many(fetched)
+        profiles.update(fetched)
+        return profiles
 
 # =====================================================
 # INGENIERO DE CARACTERÍSTICAS (FEATURE ENGINEERING)
 # =====================================================
 
+# Horario por defecto cuando falta o no se puede interpretar
+DEFAULT_HOUR = 14
+DEFAULT_MINUTE = 30
+
+# Código reservado para categorías no vistas durante el entrenamiento
+UNSEEN_CATEGORY_CODE = -1
+
+# Columnas categóricas codificadas con LabelEncoder
+CATEGORICAL_COLUMNS = ['tipo_tarjeta', 'canal', 'categoria_comerciante', 'pais', 'ciudad']
+
+# Valores de riesgo usados por create_merchant_features
+MERCHANT_RISK_LEVELS = {'bajo': 0, 'medio': 1, 'alto': 2, 'crítico': 3}
+DEFAULT_MERCHANT_RISK = 1  # Medio por defecto
+RISK_CATEGORIES = ['Financiero', 'E-commerce', 'Criptomonedas', 'Casinos']
+RISK_COUNTRIES = ['Nigeria', 'Rusia', 'Malta', 'USA']
+RISK_LOCATIONS = ['Online', 'Desconocida']
+
+# Códigos Unicode usados por el parser vectorizado de horarios
+_CHAR_ZERO, _CHAR_NINE, _CHAR_COLON, _CHAR_DOT = ord('0'), ord('9'), ord(':'), ord('.')
+
+def parse_time_parts(value: Any) -> Tuple[int, int]:
+    """Extraer (hora, minuto) de un horario individual con los valores por defecto ante errores"""
+    if value is None or (not isinstance(value, (time, str)) and pd.isna(value)):
+        return DEFAULT_HOUR, DEFAULT_MINUTE
+
+    if isinstance(value, time):
+        return value.hour, value.minute
+
+    try:
+        time_str = str(value).strip()
+        if '.' in time_str:
+            time_str = time_str.split('.')[0]  # Remover microsegundos
+
+        parts = time_str.split(':')
+        hour = int(parts[0]) if len(parts) > 0 else DEFAULT_HOUR
+        minute = int(parts[1]) if len(parts) > 1 else DEFAULT_MINUTE
+        second = int(parts[2]) if len(parts) > 2 else 0
+
+        parsed = time(hour, minute, second)  # Valida rangos
+        return parsed.hour, parsed.minute
+    except Exception:
+        return DEFAULT_HOUR, DEFAULT_MINUTE
+
+def _decode_time_strings(raw: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Decodificar horarios en texto 'HH:MM[:SS[.ffffff]]' sobre sus códigos de carácter"""
+    hours = np.full(len(raw), DEFAULT_HOUR, dtype=np.int64)
+    minutes = np.full(len(raw), DEFAULT_MINUTE, dtype=np.int64)
+
+    # 9 caracteres bastan para validar el formato canónico (el noveno debe ser fin o '.')
+    chars = raw.astype('U9').view(np.uint32).reshape(-1, 9).astype(np.int64)
+    digits = chars - _CHAR_ZERO
+    is_digit = (chars >= _CHAR_ZERO) & (chars <= _CHAR_NINE)
+
+    hh_mm = is_digit[:, 0] & is_digit[:, 1] & (chars[:, 2] == _CHAR_COLON) & is_digit[:, 3] & is_digit[:, 4]
+    with_seconds = (
+        hh_mm & (chars[:, 5] == _CHAR_COLON) & is_digit[:, 6] & is_digit[:, 7]
+        & ((chars[:, 8] == 0) | (chars[:, 8] == _CHAR_DOT))
+    )
+    without_seconds = hh_mm & (chars[:, 5] == 0)
+    canonical = with_seconds | without_seconds
+
+    hour = digits[:, 0] * 10 + digits[:, 1]
+    minute = digits[:, 3] * 10 + digits[:, 4]
+    second = np.where(with_seconds, digits[:, 6] * 10 + digits[:, 7], 0)
+    in_range = canonical & (hour < 24) & (minute < 60) & (second < 60)
+    hours[in_range] = hour[in_range]
+    minutes[in_range] = minute[in_range]
+
+    # Formatos no canónicos (espacios, horas de un dígito, basura): parser escalar
+    for position in np.flatnonzero(~canonical):
+        hours[position], minutes[position] = parse_time_parts(raw[position])
+
+    return hours, minutes
+
+def extract_hour_minute(values: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Extraer hora y minuto de una columna de horarios de forma vectorizada
+
+    Soporta columnas timedelta, objetos datetime.time (lo que devuelve psycopg2
+    para TIME), strings 'HH:MM[:SS[.ffffff]]' y categóricas de cualquiera de
+    ellos. Los valores nulos o inválidos reciben el mismo horario por defecto
+    que parse_time_parts.
+    """
+    n = len(values)
+    hours = np.full(n, DEFAULT_HOUR, dtype=np.int64)
+    minutes = np.full(n, DEFAULT_MINUTE, dtype=np.int64)
+    if n == 0:
+        return hours, minutes
+    
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Decodificar cada horario distinto una sola vez y expandir por código
+        category_hours, category_minutes = extract_hour_minute(pd.Series(values.cat.categories))
+        codes = values.cat.codes.to_numpy()
+        present = codes >= 0
+        hours[present] = category_hours[codes[present]]
+        minutes[present] = category_minutes[codes[present]]
+        return hours, minutes
+
+    if pd.api.types.is_timedelta64_dtype(values.dtype):
+        seconds = values.dt.total_seconds().to_numpy()
+        valid = np.isfinite(seconds) & (seconds >= 0) & (seconds < 86400)
+        whole_seconds = seconds[valid].astype(np.int64)
+        hours[valid] = whole_seconds // 3600
+        minutes[valid] = (whole_seconds // 60) % 60
+        return hours, minutes
+
+    present = np.flatnonzero(values.notna().to_numpy())
+    if len(present) == 0:
+        return hours, minutes
+
+    raw = values.to_numpy(dtype=object)[present]
+    pending = np.arange(len(raw))
+
+    if isinstance(raw[0], time):
+        # TIME nativo: leer atributos es mucho más barato que formatear a texto
+        minute_of_day = np.fromiter(
+            (v.hour * 60 + v.minute if type(v) is time else -1 for v in raw),
+            dtype=np.int64, count=len(raw)
+        )
+        is_time = minute_of_day >= 0
+        hours[present[is_time]] = minute_of_day[is_time] // 60
+        minutes[present[is_time]] = minute_of_day[is_time] % 60
+        pending = np.flatnonzero(~is_time)
+
+    if len(pending):
+        hours[present[pending]], minutes[present[pending]] = _decode_time_strings(raw[pending])
+
+    return hours, minutes
+
+def transaction_timestamps(df: pd.DataFrame) -> np.ndarray:
+    """Segundos desde epoch de fecha_transaccion + horario (hora y minuto) de cada fila"""
+    if 'fecha_transaccion' in df.columns:
+        days = pd.to_datetime(df['fecha_transaccion'], errors='coerce').fillna(pd.Timestamp(date.today()))
+    else:
+        days = pd.Series(pd.Timestamp(date.today()), index=df.index)
+    day_seconds = days.dt.normalize().to_numpy().astype('datetime64[s]').astype(np.int64)
+    
+    if 'horario_transaccion' in df.columns:
+        hours, minutes = extract_hour_minute(df['horario_transaccion'])
+    else:
+        hours, minutes = np.full(len(df), DEFAULT_HOUR), np.full(len(df), DEFAULT_MINUTE)
+    return day_seconds + hours * 3600 + minutes * 60
+
+def transaction_timestamp(record: Dict[str, Any]) -> int:
+    """transaction_timestamps para una transacción individual, sin pandas"""
+    fecha = record.get('fecha_transaccion')
+    if not isinstance(fecha, date):
+        fecha = pd.to_datetime(fecha, errors='coerce')
+        fecha = date.today() if pd.isna(fecha) else fecha.date()
+    hour, minute = parse_time_parts(record.get('horario_transaccion'))
+    return int(datetime(fecha.year, fecha.month, fecha.day).replace(tzinfo=timezone.utc).timestamp()) + hour * 3600 + minute * 60
+
+def _fill_unknown(values: pd.Series) -> pd.Series:
+    """fillna('unknown') que también acepta columnas categóricas"""
+    if isinstance(values.dtype, pd.CategoricalDtype) and 'unknown' not in values.cat.categories:
+        if not values.hasnans:
+            return values
+        values = values.cat.add_categories('unknown')
+    return values.fillna('unknown')
+
 class FeatureEngineer:
     """Clase para crear y transformar características para el modelo ML"""
     
     def __init__(self):
         self.label_encoders = {}
+        self.category_codes = {}  # Tablas valor -> código compiladas desde label_encoders
+        self.feature_stats = {}   # Estadísticas congeladas al entrenar (montos y medianas)
         self.scaler = StandardScaler()
         self.fitted = False
     
+    def compile_category_codes(self):
+        """Compilar los LabelEncoder ajustados en tablas hash valor -> código"""
+        self.category_codes = {
+            col: {str(value): code for code, value in enumerate(encoder.classes_)}
+            for col, encoder in self.label_encoders.items()
+        }
+    
     def create_time_features(self, df: pd.DataFrame) -> pd.DataFrame:
         """Crear características basadas en tiempo"""
         df = df.copy()
         
-        # Convertir horario a datetime para extraer características
+        # Extraer hora y minuto sin pasar por objetos Python fila a fila
         if 'horario_transaccion' in df.columns:
-            # Manejar diferentes formatos de tiempo
-            def parse_time(time_str):
-                if pd.isna(time_str):
-                    return time(14, 30)  # Tiempo por defecto
-                
-                if isinstance(time_str, time):
-                    return time_str
-                
-                try:
-                    # Si es string, intentar parsear
-                    time_str = str(time_str).strip()
-                    if '.' in time_str:
-                        time_str = time_str.split('.')[0]  # Remover microsegundos
-                    
-                    parts = time_str.split(':')
-                    hour = int(parts[0]) if len(parts) > 0 else 14
-                    minute = int(parts[1]) if len(parts) > 1 else 30
-                    second = int(parts[2]) if len(parts) > 2 else 0
-                    
-                    return time(hour, minute, second)
-                except:
-                    return time(14, 30)  # Tiempo por defecto en caso de error
-            
-            df['horario_parsed'] = df['horario_transaccion'].apply(parse_time)
-            df['hour'] = df['horario_parsed'].apply(lambda x: x.hour)
-            df['minute'] = df['horario_parsed'].apply(lambda x: x.minute)
+            df['hour'], df['minute'] = extract_hour_minute(df['horario_transaccion'])
         else:
-            df['hour'] = 14  # Hora por defecto
-            df['minute'] = 30
+            df['hour'] = DEFAULT_HOUR  # Hora por defecto
+            df['minute'] = DEFAULT_MINUTE
         
         # Características de tiempo
         df['is_weekend'] = pd.to_datetime(df['fecha_transaccion']).dt.dayofweek >= 5
@@ -242,15 +986,28 @@ class FeatureEngineer:
         
         return df
     
-    def create_amount_features(self, df: pd.DataFrame) -> pd.DataFrame:
+    def create_amount_features(self, df: pd.DataFrame, fit: bool = False) -> pd.DataFrame:
         """Crear características basadas en montos"""
         df = df.copy()
         
+        # Estadísticas de monto: se calculan al entrenar y se reutilizan en inferencia
+        if fit or 'monto_mean' not in self.feature_stats:
+            stats = {
+                'monto_p95': float(df['monto'].quantile(0.95)),
+                'monto_p05': float(df['monto'].quantile(0.05)),
+                'monto_mean': float(df['monto'].mean()),
+                'monto_std': float(df['monto'].std()),
+            }
+            if fit:
+                self.feature_stats.update(stats)
+        else:
+            stats = self.feature_stats
+        
         # Características de monto
         df['monto_log'] = np.log1p(df['monto'])
-        df['is_high_amount'] = df['monto'] > df['monto'].quantile(0.95)
-        df['is_low_amount'] = df['monto'] < df['monto'].quantile(0.05)
-        df['amount_zscore'] = (df['monto'] - df['monto'].mean()) / df['monto'].std()
+        df['is_high_amount'] = df['monto'] > stats['monto_p95']
+        df['is_low_amount'] = df['monto'] < stats['monto_p05']
+        df['amount_zscore'] = (df['monto'] - stats['monto_mean']) / stats['monto_std']
         
         # Relación con saldo de cuenta
         if 'monto_cuenta_origen' in df.columns:
@@ -268,20 +1025,17 @@ class FeatureEngineer:
         df = df.copy()
         
         # Características de comerciante
-        df['merchant_risk_encoded'] = df['comerciante_nivel_riesgo'].map({
-            'bajo': 0, 'medio': 1, 'alto': 2, 'crítico': 3
-        }).fillna(1)  # Medio por defecto
+        df['merchant_risk_encoded'] = (
+            df['comerciante_nivel_riesgo'].astype(object).map(MERCHANT_RISK_LEVELS)
+            .fillna(DEFAULT_MERCHANT_RISK).astype(np.float64)
+        )
         
         # Características de categoría
-        risk_categories = ['Financiero', 'E-commerce', 'Criptomonedas', 'Casinos']
-        df['is_risk_category'] = df['categoria_comerciante'].isin(risk_categories)
+        df['is_risk_category'] = df['categoria_comerciante'].isin(RISK_CATEGORIES)
         
         # Características geográficas
-        risk_countries = ['Nigeria', 'Rusia', 'Malta', 'USA']
-        df['is_risk_country'] = df['pais'].isin(risk_countries)
-        
-        risk_locations = ['Online', 'Desconocida']
-        df['is_online_transaction'] = df['ubicacion'].isin(risk_locations)
+        df['is_risk_country'] = df['pais'].isin(RISK_COUNTRIES)
+        df['is_online_transaction'] = df['ubicacion'].isin(RISK_LOCATIONS)
         
         return df
     
@@ -289,9 +1043,7 @@ class FeatureEngineer:
         """Codificar características categóricas"""
         df = df.copy()
         
-        categorical_columns = ['tipo_tarjeta', 'canal', 'categoria_comerciante', 'pais', 'ciudad']
-        
-        for col in categorical_columns:
+        for col in CATEGORICAL_COLUMNS:
             if col in df.columns:
                 if fit:
                     # Ajustar el encoder durante entrenamiento
@@ -299,22 +1051,29 @@ class FeatureEngineer:
                         self.label_encoders[col] = LabelEncoder()
                     
                     # Asegurar que hay valores no nulos
-                    df[col] = df[col].fillna('unknown')
-                    self.label_encoders[col].fit(df[col].astype(str))
+                    df[col] = _fill_unknown(df[col])
+                    if isinstance(df[col].dtype, pd.CategoricalDtype):
+                        self.label_encoders[col].fit(df[col].cat.remove_unused_categories().cat.categories.astype(str))
+                    else:
+                        self.label_encoders[col].fit(df[col].astype(str))
+                    self.compile_category_codes()
                 
                 # Transformar
-                df[col] = df[col].fillna('unknown')
+                df[col] = _fill_unknown(df[col])
                 
-                if col in self.label_encoders:
-                    # Manejar valores no vistos durante entrenamiento
-                    def safe_transform(value):
-                        try:
-                            return self.label_encoders[col].transform([str(value)])[0]
-                        except ValueError:
-                            # Valor no visto, usar el primer valor conocido
-                            return 0
-                    
-                    df[f'{col}_encoded'] = df[col].astype(str).apply(safe_transform)
+                if col in self.category_codes and isinstance(df[col].dtype, pd.CategoricalDtype):
+                    # Columna categórica: buscar cada categoría una vez y expandir por código
+                    category_codes = (
+                        pd.Series(df[col].cat.categories.astype(str)).map(self.category_codes[col])
+                        .fillna(UNSEEN_CATEGORY_CODE).to_numpy(np.int64)
+                    )
+                    df[f'{col}_encoded'] = category_codes[df[col].cat.codes.to_numpy()]
+                elif col in self.category_codes:
+                    # Una búsqueda hash por columna; valores no vistos reciben el código reservado
+                    df[f'{col}_encoded'] = (
+                        df[col].astype(str).map(self.category_codes[col])
+                        .fillna(UNSEEN_CATEGORY_CODE).astype(np.int64)
+                    )
                 else:
                     df[f'{col}_encoded'] = 0  # Valor por defecto
         
@@ -325,7 +1084,7 @@ class FeatureEngineer:
         
         # Aplicar todas las transformaciones
         df = self.create_time_features(df)
-        df = self.create_amount_features(df)
+        df = self.create_amount_features(df, fit=fit)
         df = self.create_merchant_features(df)
         df = self.encode_categorical_features(df, fit=fit)
         
@@ -347,7 +1106,10 @@ class FeatureEngineer:
             'pais_encoded', 'ciudad_encoded',
             
             # Características adicionales si están disponibles
-            'distancia_ubicacion_usual'
+            'distancia_ubicacion_usual',
+            
+            # Comportamiento de la cuenta (sólo si se agregaron con add_account_features)
+            *ACCOUNT_FEATURE_NAMES
         ]
         
         # Filtrar columnas que existen
@@ -356,10 +1118,19 @@ class FeatureEngineer:
         # Llenar valores faltantes
         feature_df = df[available_features].copy()
         
-        # Rellenar NaN con valores apropiados
+        # Rellenar NaN con valores apropiados (medianas de entrenamiento si existen)
+        if fit:
+            self.feature_stats['medians'] = {}
+        medians = self.feature_stats.get('medians', {})
+        
         for col in feature_df.columns:
-            if feature_df[col].dtype in ['int64', 'float64']:
-                feature_df[col] = feature_df[col].fillna(feature_df[col].median())
+            # Cualquier ancho numérico (la extracción por COPY usa float32/int32), no bool
+            dtype = feature_df[col].dtype
+            if pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype):
+                if fit:
+                    medians[col] = float(feature_df[col].median())
+                median = medians[col] if col in medians else feature_df[col].median()
+                feature_df[col] = feature_df[col].fillna(median)
             else:
                 feature_df[col] = feature_df[col].fillna(0)
         
@@ -375,6 +1146,134 @@ class FeatureEngineer:
         
         return features_scaled, available_features
 
+# =====================================================
+# CONSTRUCTOR DE CARACTERÍSTICAS PARA UNA TRANSACCIÓN
+# =====================================================
+
+def _is_missing(value: Any) -> bool:
+    """None o NaN, sin pasar por pandas"""
+    return value is None or (isinstance(value, float) and value != value)
+
+class SingleRowFeatureBuilder:
+    """
+    Camino rápido sin pandas para /predict_single_transaction
+
+    Reproduce prepare_features(fit=False) sobre un único dict usando los
+    artefactos persistidos (tablas de categorías, estadísticas congeladas y
+    scaler) y escribe el resultado en una fila float32 en el orden de
+    feature_names, que es el dtype con el que opera el Random Forest.
+    """
+    
+    def __init__(self, feature_engineer: FeatureEngineer, feature_names: List[str]):
+        stats = feature_engineer.feature_stats
+        self.feature_names = list(feature_names)
+        self.category_codes = feature_engineer.category_codes
+        self.monto_p95 = stats['monto_p95']
+        self.monto_p05 = stats['monto_p05']
+        self.monto_mean = stats['monto_mean']
+        self.monto_std = stats['monto_std']
+        
+        # Valores de relleno: mediana de entrenamiento para numéricas, 0 para booleanas
+        self.fill_values = [stats['medians'].get(name, 0.0) for name in self.feature_names]
+        
+        scaler = feature_engineer.scaler
+        if feature_engineer.fitted:
+            self.means = [float(v) for v in scaler.mean_]
+            self.scales = [float(v) for v in scaler.scale_]
+        else:
+            self.means = [0.0] * len(self.feature_names)
+            self.scales = [1.0] * len(self.feature_names)
+    
+    @staticmethod
+    def is_supported(feature_engineer: FeatureEngineer) -> bool:
+        """El camino rápido necesita estadísticas congeladas (modelos anteriores no las tienen)"""
+        stats = feature_engineer.feature_stats
+        return 'monto_mean' in stats and 'medians' in stats
+    
+    def compute_features(self, record: Dict[str, Any]) -> Dict[str, Any]:
+        """Calcular las características sin escalar de una transacción"""
+        monto = float(record['monto'])
+        features = {
+            'monto': monto,
+            'monto_log': np.log1p(monto),
+            'is_high_amount': monto > self.monto_p95,
+            'is_low_amount': monto < self.monto_p05,
+            'amount_zscore': (monto - self.monto_mean) / self.monto_std,
+        }
+        
+        # Relación con saldo de cuenta
+        if 'monto_cuenta_origen' in record:
+            balance = record['monto_cuenta_origen']
+            balance = monto * 2 if _is_missing(balance) else float(balance)
+            features['amount_to_balance_ratio'] = monto / (balance + 1)
+            features['is_large_portion_balance'] = features['amount_to_balance_ratio'] > 0.5
+        else:
+            features['amount_to_balance_ratio'] = 0.1
+            features['is_large_portion_balance'] = False
+        
+        # Tiempo
+        if 'horario_transaccion' in record:
+            hour, minute = parse_time_parts(record['horario_transaccion'])
+        else:
+            hour, minute = DEFAULT_HOUR, DEFAULT_MINUTE
+        
+        fecha = record.get('fecha_transaccion')
+        if isinstance(fecha, date):
+            is_weekend = fecha.weekday() >= 5
+        else:
+            fecha = pd.to_datetime(fecha)
+            is_weekend = not pd.isna(fecha) and fecha.dayofweek >= 5
+        
+        features.update({
+            'hour': hour,
+            'minute': minute,
+            'is_weekend': is_weekend,
+            'is_night': hour >= 22 or hour <= 6,
+            'is_business_hours': 9 <= hour <= 18,
+            'hour_sin': np.sin(2 * np.pi * hour / 24),
+            'hour_cos': np.cos(2 * np.pi * hour / 24),
+        })
+        
+        # Comerciante y geografía
+        risk_level = record.get('comerciante_nivel_riesgo')
+        features.update({
+            'merchant_risk_encoded': MERCHANT_RISK_LEVELS.get(risk_level, DEFAULT_MERCHANT_RISK)
+                if isinstance(risk_level, str) else DEFAULT_MERCHANT_RISK,
+            'is_risk_category': record.get('categoria_comerciante') in RISK_CATEGORIES,
+            'is_risk_country': record.get('pais') in RISK_COUNTRIES,
+            'is_online_transaction': record.get('ubicacion') in RISK_LOCATIONS,
+        })
+        
+        # Categóricas
+        for col in CATEGORICAL_COLUMNS:
+            value = record.get(col)
+            value = 'unknown' if _is_missing(value) else str(value)
+            codes = self.category_codes.get(col)
+            features[f'{col}_encoded'] = codes.get(value, UNSEEN_CATEGORY_CODE) if codes is not None else 0
+        
+        distancia = record.get('distancia_ubicacion_usual')
+        features['distancia_ubicacion_usual'] = np.nan if _is_missing(distancia) else float(distancia)
+        
+        # Comportamiento de la cuenta, ya calculado por el almacén
+        for name in ACCOUNT_FEATURE_NAMES:
+            if name in record:
+                features[name] = record[name]
+        
+        return features
+    
+    def build(self, record: Dict[str, Any]) -> np.ndarray:
+        """Construir la fila escalada (1, n_features) en float32"""
+        features = self.compute_features(record)
+        row = np.empty((1, len(self.feature_names)), dtype=np.float32)
+        
+        for i, name in enumerate(self.feature_names):
+            value = features.get(name, np.nan)
+            if value != value:  # NaN
+                value = self.fill_values[i]
+            row[0, i] = (value - self.means[i]) / self.scales[i]
+        
+        return row
+
 # =====================================================
 # DETECTOR DE FRAUDE PRINCIPAL
 # =====================================================
@@ -382,40 +1281,147 @@ class FeatureEngineer:
 class FraudDetector:
     """Detector principal de fraude con ML"""
     
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, db_manager: Optional[DatabaseManager] = None,
+                 account_features: Optional[AccountFeatureStore] = None):
         self.config = config
-        self.db_manager = DatabaseManager(config)
+        self.db_manager = db_manager or DatabaseManager(config)  # Compartido entre versiones al hacer hot-swap
+        # Estado por cuenta en línea (también compartido entre versiones); None si está desactivado
+        if account_features is None and config.ACCOUNT_FEATURES:
+            account_features = AccountFeatureStore()
+        self.account_features = account_features
         self.feature_engineer = FeatureEngineer()
         self.model = None
+        self.model_type: Optional[str] = None
         self.feature_names = []
+        self.single_row_builder: Optional[SingleRowFeatureBuilder] = None
+        self.compiled_forest: Optional[CompiledForest] = None
+        self.model_version: Optional[str] = None  # Clave de las puntuaciones guardadas
+        self.trained_through_id: Optional[int] = None  # Última transacción vista al entrenar (base de la actualización incremental)
+        self.base_version: Optional[str] = None  # Versión de la que salió una actualización incremental
         self.is_trained = False
         
         # Crear directorio de modelos
         os.makedirs(config.MODEL_PATH, exist_ok=True)
+        self.training_snapshot = TrainingSnapshot(
+            os.path.join(config.MODEL_PATH, config.SNAPSHOT_DIR), config.SNAPSHOT_MAX_SEGMENTS
+        )
+    
+    @property
+    def model(self):
+        """
+        Random Forest de sklearn; al cargar un bundle se lee sólo si se usa
+        
+        Con bosque compilado la puntuación no lo necesita: sólo lo cargan la
+        actualización incremental y los modelos sin bosque compilado.
+        """
+        if self._model is None and self._model_source is not None:
+            source, self._model_source = self._model_source, None
+            # Ruta del archivo aparte o, en bundles de formato 1, el pickle embebido
+            self._model = joblib.load(source) if isinstance(source, str) else pickle.loads(source)
+        return self._model
+    
+    @model.setter
+    def model(self, value):
+        self._model = value
+        self._model_source = None
+    
+    def load_training_data(self, rebuild_snapshot: bool = False) -> pd.DataFrame:
+        """
+        Datos de entrenamiento desde el snapshot local (sólo se copian las filas nuevas)
+        
+        Sin snapshot (FRAUDE_TRAINING_SNAPSHOT=false) se consulta la base completa.
+        """
+        if not self.config.TRAINING_SNAPSHOT:
+            return self.db_manager.get_training_transactions()
+        
+        self._refresh_training_snapshot(rebuild_snapshot)
+        return self._snapshot_rows()
+    
+    def load_update_data(self, since_id: int) -> pd.DataFrame:
+        """
+        Datos de la actualización incremental sin cargar la historia completa
+        
+        Las transacciones con id > since_id y, si el modelo usa las características
+        por cuenta, las anteriores dentro de HISTORY_SECONDS de la más vieja de
+        ellas: es lo que hace falta para reproducir sus agregados.
+        """
+        if not self.config.TRAINING_SNAPSHOT:
+            new = self.db_manager.with_merchant_risk(self.db_manager.copy_transactions(since_id=since_id))
+            if not self.uses_account_features or new.empty:
+                return new
+            start = int(transaction_timestamps(new).min()) - HISTORY_SECONDS
+            history = self.db_manager.get_account_activity(datetime.fromtimestamp(start, tz=timezone.utc).date(), since_id)
+            history = history[transaction_timestamps(history) >= start]
+            # En orden de id, como llegaron (add_account_features desempata por id en cualquier caso)
+            return pd.concat([history, new], ignore_index=True)
+        
+        snapshot = self._refresh_training_snapshot()
+        keys = pd.DataFrame({name: snapshot.column(name) for name in ('id', 'fecha_transaccion', 'horario_transaccion')})
+        selected = keys['id'].to_numpy() > since_id
+        if self.uses_account_features and selected.any():
+            timestamps = transaction_timestamps(keys)
+            selected |= timestamps >= timestamps[selected].min() - HISTORY_SECONDS
+        return self._snapshot_rows(selected)
+    
+    def _refresh_training_snapshot(self, rebuild: bool = False) -> TrainingSnapshot:
+        """Copiar al snapshot las transacciones nuevas de la base"""
+        self.training_snapshot.refresh(
+            lambda since_id: self.db_manager.copy_transactions(since_id=since_id),
+            rebuild=rebuild, lookback=self.config.SNAPSHOT_LOOKBACK
+        )
+        return self.training_snapshot
+    
+    def _snapshot_rows(self, selected: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """
+        Filas del snapshot (todas o las de `selected`) en el orden de la consulta a la base
+        
+        Es el orden del que depende la partición train/test. Se ordenan sólo las claves
+        y cada columna se copia una vez de los segmentos, ya en ese orden.
+        """
+        snapshot = self.training_snapshot
+        keys = pd.DataFrame({name: snapshot.column(name) for name in ('fecha_transaccion', 'horario_transaccion')})
+        if selected is not None:
+            keys = keys[selected]
+        order = keys.sort_values(list(keys.columns), ascending=False, kind='stable').index.to_numpy()
+        
+        # El snapshot guarda sólo columnas de `transacciones`; el riesgo del comerciante es el vigente
+        return self.db_manager.with_merchant_risk(snapshot.take(order))
     
-    def train_model(self, force_retrain: bool = False) -> Dict[str, Any]:
-        """Entrenar el modelo de detección de fraude"""
+    def train_model(self, force_retrain: bool = False, rebuild_snapshot: bool = False, publish: bool = True) -> Dict[str, Any]:
+        """
+        Entrenar el modelo de detección de fraude
         
-        model_path = os.path.join(self.config.MODEL_PATH, self.config.FRAUD_MODEL_FILE)
+        Con `publish=False` los artefactos se guardan en su directorio de versión
+        sin marcarla como la versión en servicio (entrenamiento en segundo plano).
+        """
         
         # Verificar si el modelo ya existe y no se fuerza reentrenamiento
-        if os.path.exists(model_path) and not force_retrain:
+        if self.has_saved_model() and not force_retrain:
             logger.info("🔄 Cargando modelo existente...")
             return self.load_model()
         
         logger.info("🤖 Iniciando entrenamiento del modelo de ML...")
         
         # Cargar datos
-        df = self.db_manager.get_all_transactions()
+        loading_start = datetime.now()
+        df = self.load_training_data(rebuild_snapshot=rebuild_snapshot)
+        data_loading_time = (datetime.now() - loading_start).total_seconds()
         
         if len(df) < self.config.MIN_SAMPLES_FOR_TRAINING:
             raise ValueError(f"Insuficientes datos para entrenar. Mínimo: {self.config.MIN_SAMPLES_FOR_TRAINING}, actual: {len(df)}")
         
+        # Comportamiento por cuenta reproducido en orden temporal: cada transacción
+        # sólo ve las anteriores, igual que en inferencia
+        if self.account_features is not None:
+            df = self.add_account_features(df, AccountFeatureStore())
+        
         # Preparar características
         X, feature_names = self.feature_engineer.prepare_features(df, fit=True)
         y = df['es_fraude'].astype(int)
         
         self.feature_names = feature_names
+        self.trained_through_id = int(df['id'].max()) if 'id' in df.columns else None
+        self.base_version = None
         
         logger.info(f"📊 Preparadas {X.shape[0]} muestras con {X.shape[1]} características")
         logger.info(f"🏷️ Distribución de clases: {y.value_counts().to_dict()}")
@@ -440,6 +1446,8 @@ class FraudDetector:
         
         logger.info("🔧 Entrenando modelo Random Forest...")
         self.model.fit(X_train, y_train)
+        self.model_type = type(self.model).__name__
+        self._compile_forest(X_test)
         
         # Evaluar modelo
         y_pred = self.model.predict(X_test)
@@ -455,68 +1463,415 @@ class FraudDetector:
             'feature_importance': dict(zip(feature_names, self.model.feature_importances_)),
             'training_samples': len(X_train),
             'test_samples': len(X_test),
-            'fraud_rate': y.mean()
+            'fraud_rate': y.mean(),
+            'data_loading_time': data_loading_time
         }
         
         logger.info(f"✅ Modelo entrenado - AUC: {auc_score:.3f}")
         
-        # Guardar modelo
+        # Guardar modelo (una versión nueva invalida las puntuaciones guardadas)
+        self.model_version = datetime.now().strftime('%Y%m%d%H%M%S')
         self.save_model()
+        if publish:
+            self.publish_version()
+        self._refresh_single_row_builder()
         self.is_trained = True
         
+        training_results['model_version'] = self.model_version
         return training_results
     
+    def update_model(self, publish: bool = True) -> Dict[str, Any]:
+        """
+        Actualización incremental de la versión cargada con las transacciones nuevas
+        
+        Sólo las transacciones con id > trained_through_id entran al ajuste: con
+        warm_start se agregan INCREMENTAL_TREES árboles entrenados con ellas y se
+        descartan otros tantos de los existentes, así que el bosque conserva su
+        tamaño y el costo depende del volumen nuevo, no de la historia. Las
+        características usan los encoders, el scaler y las medianas de la versión
+        base (el espacio en el que dividen los árboles que se conservan).
+        
+        Una parte estratificada de las transacciones nuevas queda fuera del
+        ajuste como validación: la candidata se guarda (y, con `publish`, se
+        publica) sólo si su AUC ahí no cae más de INCREMENTAL_MAX_AUC_DROP
+        respecto de la versión base. Si no, devuelve `promoted=False` con el motivo.
+        """
+        
+        if not self.is_trained:
+            raise ValueError("Modelo no entrenado. Ejecute train_model() primero.")
+        if self.trained_through_id is None:
+            raise ValueError(f"La versión {self.model_version} no registra hasta qué transacción se entrenó; ejecute un reentrenamiento completo")
+        if not isinstance(self.model, RandomForestClassifier):
+            raise ValueError(f"La actualización incremental requiere un RandomForestClassifier, no {self.model_type}")
+        
+        logger.info(f"🌱 Actualización incremental de la versión {self.model_version} (transacciones con id > {self.trained_through_id})...")
+        start_time = datetime.now()
+        results = {
+            'base_version': self.model_version,
+            'model_version': None,
+            'promoted': False,
+            'reason': None,
+            'new_samples': 0
+        }
+        
+        df = self.load_update_data(self.trained_through_id)
+        new_rows = (df['id'] > self.trained_through_id).to_numpy()
+        results['new_samples'] = int(new_rows.sum())
+        if results['new_samples'] < self.config.INCREMENTAL_MIN_SAMPLES:
+            results['reason'] = f"Insuficientes transacciones nuevas. Mínimo: {self.config.INCREMENTAL_MIN_SAMPLES}, actual: {results['new_samples']}"
+            logger.info(f"ℹ️ {results['reason']}")
+            return results
+        
+        # Comportamiento por cuenta: se reproduce sólo la ventana de historia que
+        # necesitan las transacciones nuevas (load_update_data no trae lo anterior)
+        if self.uses_account_features:
+            df = self.add_account_features(df, AccountFeatureStore())
+        
+        new_df = df[new_rows]
+        X, _ = self.feature_engineer.prepare_features(new_df, fit=False)
+        y = new_df['es_fraude'].astype(int).to_numpy()
+        
+        try:
+            X_fit, X_holdout, y_fit, y_holdout = train_test_split(
+                X, y, test_size=self.config.TEST_SIZE,
+                random_state=self.config.RANDOM_STATE,
+                stratify=y
+            )
+            if len(np.unique(y_fit)) < 2 or len(np.unique(y_holdout)) < 2:
+                raise ValueError("se necesitan fraudes y no fraudes en el ajuste y en la validación")
+        except ValueError as e:
+            results['reason'] = f"Transacciones nuevas insuficientes para validar: {e}"
+            logger.info(f"ℹ️ {results['reason']}")
+            return results
+        
+        # Árboles nuevos con warm_start sobre una copia (la versión base sigue en servicio).
+        # La semilla cambia con los datos: con el mismo tamaño de bosque, warm_start
+        # repetiría las semillas de la actualización anterior
+        base_trees = len(self.model.estimators_)
+        added = self.config.INCREMENTAL_TREES
+        through_id = int(df['id'].max())
+        candidate = copy.deepcopy(self.model)
+        candidate.set_params(
+            warm_start=True, n_estimators=base_trees + added,
+            random_state=(self.config.RANDOM_STATE + through_id) % 2**32
+        )
+        
+        logger.info(f"🔧 Ajustando {added} árboles con {len(X_fit)} transacciones nuevas...")
+        candidate.fit(X_fit, y_fit)
+        
+        dropped = self._trees_to_drop(candidate.estimators_[:base_trees], X_fit, y_fit, added)
+        candidate.estimators_ = [tree for i, tree in enumerate(candidate.estimators_) if i not in dropped]
+        candidate.set_params(warm_start=False, n_estimators=len(candidate.estimators_))
+        
+        # Validación: misma partición para la base y la candidata
+        base_auc = roc_auc_score(y_holdout, self.score(X_holdout))
+        candidate_auc = roc_auc_score(y_holdout, candidate.predict_proba(X_holdout)[:, 1])
+        results.update(
+            trees_added=added,
+            trees_dropped=len(dropped),
+            drop_policy=self.config.INCREMENTAL_DROP_POLICY,
+            training_samples=len(X_fit),
+            holdout_samples=len(X_holdout),
+            base_auc=base_auc,
+            candidate_auc=candidate_auc,
+            update_time=(datetime.now() - start_time).total_seconds()
+        )
+        
+        if candidate_auc < base_auc - self.config.INCREMENTAL_MAX_AUC_DROP:
+            results['reason'] = f"AUC en validación {candidate_auc:.4f} contra {base_auc:.4f} de la versión base"
+            logger.warning(f"⚠️ Actualización incremental descartada: {results['reason']}")
+            return results
+        
+        # Promover: la candidata pasa a ser el modelo de este detector y una versión nueva
+        self.model = candidate
+        self.base_version = self.model_version
+        self.trained_through_id = through_id
+        self._compile_forest(X_holdout)
+        self.model_version = datetime.now().strftime('%Y%m%d%H%M%S')
+        self.save_model()
+        if publish:
+            self.publish_version()
+        self._refresh_single_row_builder()
+        
+        results.update(model_version=self.model_version, promoted=True)
+        logger.info(
+            f"✅ Actualización incremental {self.base_version} → {self.model_version}: "
+            f"+{added}/-{len(dropped)} árboles, AUC {base_auc:.3f} → {candidate_auc:.3f} ({results['update_time']:.1f}s)"
+        )
+        return results
+    
+    def _trees_to_drop(self, trees: List[Any], X: np.ndarray, y: np.ndarray, count: int) -> set:
+        """
+        Posiciones de los árboles existentes a descartar
+        
+        'oldest': los primeros de la lista (los árboles nuevos se agregan al final).
+        'least_useful': los de menor AUC con las transacciones nuevas, que ningún
+        árbol existente vio al entrenar.
+        """
+        count = min(count, len(trees) - 1)
+        if self.config.INCREMENTAL_DROP_POLICY == 'least_useful':
+            scores = [roc_auc_score(y, tree.predict_proba(X)[:, 1]) for tree in trees]
+            return set(np.argsort(scores, kind='stable')[:count].tolist())
+        return set(range(count))
+    
+    def artifact_dir(self, version: str) -> str:
+        """Directorio de artefactos de una versión del modelo"""
+        return os.path.join(self.config.MODEL_PATH, self.config.VERSIONS_DIR, version)
+    
+    def current_version(self) -> Optional[str]:
+        """Versión publicada como la que debe servirse (None si sólo hay artefactos legacy)"""
+        pointer_path = os.path.join(self.config.MODEL_PATH, self.config.CURRENT_VERSION_FILE)
+        if not os.path.exists(pointer_path):
+            return None
+        with open(pointer_path) as f:
+            return json.load(f)['version']
+    
+    def training_lock(self) -> TrainingLock:
+        """Lock compartido por todos los procesos que entrenan sobre este MODEL_PATH"""
+        return TrainingLock(os.path.join(self.config.MODEL_PATH, self.config.TRAINING_LOCK_FILE))
+    
+    def has_saved_model(self) -> bool:
+        """Hay una versión publicada o un modelo legacy en MODEL_PATH"""
+        return self.current_version() is not None or os.path.exists(
+            os.path.join(self.config.MODEL_PATH, self.config.FRAUD_MODEL_FILE)
+        )
+    
     def save_model(self):
-        """Guardar modelo y componentes"""
+        """
+        Guardar el modelo como un único bundle versionado en el directorio de su versión
+        
+        El bundle (joblib sin compresión) incluye un manifiesto, los encoders, el
+        scaler, los nombres y estadísticas de características y los arreglos del
+        bosque compilado. Sin compresión, joblib guarda los arreglos numpy tal
+        cual en el archivo, así que pueden abrirse con mmap_mode='r' y varios
+        workers comparten una sola copia en el page cache. El Random Forest de
+        sklearn va en un archivo aparte: sus árboles se copian a memoria propia
+        al cargarlos y los workers no lo necesitan para puntuar.
+        """
+        directory = self.artifact_dir(self.model_version)
+        staging = f"{directory}.tmp"
         try:
-            # Guardar modelo principal
-            joblib.dump(self.model, os.path.join(self.config.MODEL_PATH, self.config.FRAUD_MODEL_FILE))
+            shutil.rmtree(staging, ignore_errors=True)
+            os.makedirs(staging)
+            
+            bundle = {
+                'manifest': {
+                    'format': self.config.BUNDLE_FORMAT,
+                    'version': self.model_version,
+                    'saved_at': datetime.now().isoformat(),
+                    'model_type': self.model_type,
+                    'sklearn_version': sklearn.__version__,
+                    'feature_count': len(self.feature_names),
+                    'compiled_forest': self.compiled_forest is not None,
+                    'trained_through_id': self.trained_through_id,
+                    'base_version': self.base_version
+                },
+                'label_encoders': self.feature_engineer.label_encoders,
+                'scaler': self.feature_engineer.scaler,
+                'feature_names': self.feature_names,
+                'feature_stats': self.feature_engineer.feature_stats,
+                'compiled_forest': self.compiled_forest.to_arrays() if self.compiled_forest is not None else None
+            }
+            joblib.dump(bundle, os.path.join(staging, self.config.MODEL_BUNDLE_FILE))
+            joblib.dump(self.model, os.path.join(staging, self.config.SKLEARN_MODEL_FILE))
             
-            # Guardar encoders y scaler
-            joblib.dump(self.feature_engineer.label_encoders, os.path.join(self.config.MODEL_PATH, self.config.ENCODERS_FILE))
-            joblib.dump(self.feature_engineer.scaler, os.path.join(self.config.MODEL_PATH, self.config.SCALER_FILE))
-            joblib.dump(self.feature_names, os.path.join(self.config.MODEL_PATH, self.config.FEATURES_FILE))
+            # El directorio aparece completo o no aparece
+            shutil.rmtree(directory, ignore_errors=True)
+            os.replace(staging, directory)
             
-            logger.info("💾 Modelo guardado exitosamente")
+            logger.info(f"💾 Modelo guardado exitosamente (versión {self.model_version})")
         except Exception as e:
+            shutil.rmtree(staging, ignore_errors=True)
             logger.error(f"❌ Error guardando modelo: {e}")
             raise
     
-    def load_model(self) -> Dict[str, Any]:
-        """Cargar modelo existente"""
+    def publish_version(self):
+        """Marcar la versión actual como la que debe servirse y limpiar versiones viejas"""
+        pointer_path = os.path.join(self.config.MODEL_PATH, self.config.CURRENT_VERSION_FILE)
+        with open(f"{pointer_path}.tmp", 'w') as f:
+            json.dump({'version': self.model_version, 'published_at': datetime.now().isoformat()}, f)
+        os.replace(f"{pointer_path}.tmp", pointer_path)
+        
+        versions_path = os.path.join(self.config.MODEL_PATH, self.config.VERSIONS_DIR)
+        versions = sorted(v for v in os.listdir(versions_path) if not v.endswith('.tmp'))
+        for old_version in versions[:-self.config.MODEL_VERSIONS_TO_KEEP]:
+            if old_version != self.model_version:
+                shutil.rmtree(os.path.join(versions_path, old_version), ignore_errors=True)
+        
+        logger.info(f"📌 Versión {self.model_version} publicada")
+    
+    def load_model(self, version: Optional[str] = None) -> Dict[str, Any]:
+        """Cargar un modelo guardado (por defecto la versión publicada)"""
         try:
-            # Cargar modelo principal
-            model_path = os.path.join(self.config.MODEL_PATH, self.config.FRAUD_MODEL_FILE)
-            self.model = joblib.load(model_path)
+            version = version or self.current_version()
+            # Sin versión publicada se usan los artefactos legacy sueltos en MODEL_PATH
+            directory = self.artifact_dir(version) if version else self.config.MODEL_PATH
+            bundle_path = os.path.join(directory, self.config.MODEL_BUNDLE_FILE)
+            
+            if os.path.exists(bundle_path):
+                compiled_arrays = self._load_bundle(bundle_path)
+                verified = True  # El bosque del bundle se verificó contra sklearn al entrenar
+            else:
+                compiled_arrays = self._load_legacy_files(directory)
+                verified = False
             
-            # Cargar componentes auxiliares
-            self.feature_engineer.label_encoders = joblib.load(os.path.join(self.config.MODEL_PATH, self.config.ENCODERS_FILE))
-            self.feature_engineer.scaler = joblib.load(os.path.join(self.config.MODEL_PATH, self.config.SCALER_FILE))
+            self.feature_engineer.compile_category_codes()
             self.feature_engineer.fitted = True
-            self.feature_names = joblib.load(os.path.join(self.config.MODEL_PATH, self.config.FEATURES_FILE))
+            if not self.feature_engineer.feature_stats:
+                logger.warning("⚠️ Modelo sin estadísticas de entrenamiento; se calcularán por lote hasta reentrenar")
             
+            # Bosque compilado: el exportado junto al modelo o, en modelos anteriores, compilado ahora.
+            # Se verifica contra sklearn con filas aleatorias en el espacio escalado (~N(0, 1))
+            probe = np.random.default_rng(self.config.RANDOM_STATE).normal(size=(256, len(self.feature_names)))
+            if self.config.COMPILED_FOREST and compiled_arrays is not None:
+                self.compiled_forest = CompiledForest.from_arrays(compiled_arrays)
+                if not verified:
+                    self._verify_compiled_forest(probe)
+            else:
+                self._compile_forest(probe)
+            
+            self._refresh_single_row_builder()
             self.is_trained = True
-            logger.info("✅ Modelo cargado exitosamente")
+            logger.info(f"✅ Modelo cargado exitosamente (versión {self.model_version})")
             
             return {
                 'model_loaded': True,
                 'feature_count': len(self.feature_names),
-                'model_type': str(type(self.model).__name__)
+                'model_type': self.model_type
             }
         except Exception as e:
             logger.error(f"❌ Error cargando modelo: {e}")
             raise
     
-    def predict_single(self, transaction_data: Dict) -> Dict[str, Any]:
-        """Predecir fraude para una transacción individual"""
+    def _load_bundle(self, bundle_path: str) -> Optional[Dict[str, np.ndarray]]:
+        """Cargar el bundle con memory-map de sus arreglos; devuelve los del bosque compilado"""
+        bundle = joblib.load(bundle_path, mmap_mode='r')
+        manifest = bundle['manifest']
+        if manifest['sklearn_version'] != sklearn.__version__:
+            logger.warning(f"⚠️ Bundle guardado con scikit-learn {manifest['sklearn_version']}, instalado {sklearn.__version__}")
         
-        if not self.is_trained:
-            raise ValueError("Modelo no entrenado. Ejecute train_model() primero.")
+        self.model = None
+        self._model_source = bundle['model_pickle'] if 'model_pickle' in bundle else \
+            os.path.join(os.path.dirname(bundle_path), self.config.SKLEARN_MODEL_FILE)
+        self.model_type = manifest['model_type']
+        self.feature_engineer.label_encoders = bundle['label_encoders']
+        self.feature_engineer.scaler = bundle['scaler']
+        self.feature_names = bundle['feature_names']
+        self.feature_engineer.feature_stats = bundle['feature_stats']
+        self.model_version = manifest['version']
+        # Bundles anteriores a la actualización incremental no registran hasta qué transacción entrenaron
+        self.trained_through_id = manifest.get('trained_through_id')
+        self.base_version = manifest.get('base_version')
+        return bundle['compiled_forest']
+    
+    def _load_legacy_files(self, directory: str) -> Optional[Dict[str, np.ndarray]]:
+        """Cargar los artefactos en archivos separados de versiones anteriores al bundle"""
+        model_path = os.path.join(directory, self.config.FRAUD_MODEL_FILE)
+        self.model = joblib.load(model_path)
+        self.model_type = type(self.model).__name__
+        self.feature_engineer.label_encoders = joblib.load(os.path.join(directory, self.config.ENCODERS_FILE))
+        self.feature_engineer.scaler = joblib.load(os.path.join(directory, self.config.SCALER_FILE))
+        self.feature_names = joblib.load(os.path.join(directory, self.config.FEATURES_FILE))
+        
+        # Estadísticas de entrenamiento (modelos anteriores no las tienen)
+        stats_path = os.path.join(directory, self.config.STATS_FILE)
+        self.feature_engineer.feature_stats = joblib.load(stats_path) if os.path.exists(stats_path) else {}
+        
+        # Versión del modelo (los modelos anteriores se identifican por la fecha del archivo)
+        version_path = os.path.join(directory, self.config.VERSION_FILE)
+        if os.path.exists(version_path):
+            with open(version_path) as f:
+                self.model_version = json.load(f)['version']
+        else:
+            self.model_version = f"legacy-{int(os.path.getmtime(model_path))}"
         
-        # Convertir a DataFrame
-        df = pd.DataFrame([transaction_data])
+        compiled_path = os.path.join(directory, self.config.COMPILED_FOREST_FILE)
+        if not os.path.exists(compiled_path):
+            return None
+        with np.load(compiled_path) as arrays:
+            return {name: arrays[name] for name in arrays.files}
+    
+    def _compile_forest(self, X_check: np.ndarray):
+        """Exportar el bosque a arreglos planos y verificarlo contra sklearn"""
+        self.compiled_forest = None
+        if not self.config.COMPILED_FOREST:
+            return
+        try:
+            self.compiled_forest = CompiledForest.from_sklearn(self.model)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo compilar el bosque, se usará sklearn: {e}")
+            return
+        self._verify_compiled_forest(X_check)
+    
+    def _verify_compiled_forest(self, X_check: np.ndarray):
+        """Descartar el bosque compilado si difiere de sklearn más que la tolerancia"""
+        difference = self.compiled_forest.max_abs_difference(self.model, X_check)
+        if difference > self.config.COMPILED_FOREST_TOLERANCE:
+            logger.error(f"❌ Bosque compilado difiere de sklearn ({difference:.2e}), se usará sklearn")
+            self.compiled_forest = None
+        else:
+            logger.info(f"🌲 Bosque compilado: {self.compiled_forest.n_trees} árboles, {self.compiled_forest.n_nodes} nodos (diferencia máx. {difference:.1e})")
+    
+    @property
+    def uses_account_features(self) -> bool:
+        """El modelo cargado se entrenó con las características por cuenta"""
+        return self.account_features is not None and ACCOUNT_FEATURE_NAMES[0] in self.feature_names
+    
+    @staticmethod
+    def add_account_features(df: pd.DataFrame, store: AccountFeatureStore, update: bool = True) -> pd.DataFrame:
+        """
+        Agregar las columnas de comportamiento por cuenta calculadas (y, con `update`, acumuladas) en `store`
+        
+        Las transacciones sin cuenta no tienen historia: sus columnas valen 0 y no entran al almacén.
+        El almacén desempata por posición las transacciones de una cuenta en el mismo minuto, así
+        que se le pasan en orden de id (el de llegada, como en línea) sea cual sea el orden de `df`;
+        las columnas vuelven en el orden de `df`.
+        """
+        features = np.zeros((len(df), len(ACCOUNT_FEATURE_NAMES)))
+        known = np.flatnonzero(df['cuenta_origen_id'].notna().to_numpy())
+        if len(known):
+            if 'id' in df.columns:
+                known = known[np.argsort(df['id'].to_numpy()[known], kind='stable')]
+            rows = df.iloc[known]
+            features[known] = store.features(
+                rows['cuenta_origen_id'].to_numpy(np.int64),
+                transaction_timestamps(rows),
+                rows['monto'].to_numpy(np.float64),
+                value_bits(rows['comerciante']),
+                value_bits(rows['pais']) if 'pais' in rows.columns else np.zeros(len(rows), dtype=np.uint64),
+                update=update
+            )
+        return df.assign(**{name: features[:, i] for i, name in enumerate(ACCOUNT_FEATURE_NAMES)})
+    
+    def seed_account_features(self):
+        """Sembrar el almacén por cuenta con la última semana de transacciones de la base"""
+        if self.account_features is None:
+            return
+        start_time = datetime.now()
+        df = self.db_manager.get_recent_activity(days=-(-HISTORY_SECONDS // 86400))
+        self.account_features.clear()
+        if len(df):
+            self.add_account_features(df, self.account_features)
+            self.account_features.last_transaction_id = int(df['id'].max())
+        logger.info(
+            f"👤 Almacén por cuenta sembrado: {len(df)} transacciones, {self.account_features.accounts} cuentas "
+            f"({(datetime.now() - start_time).total_seconds():.1f}s)"
+        )
+    
+    def _refresh_single_row_builder(self):
+        """Compilar el camino rápido de predicción individual para los artefactos actuales"""
+        if SingleRowFeatureBuilder.is_supported(self.feature_engineer):
+            self.single_row_builder = SingleRowFeatureBuilder(self.feature_engineer, self.feature_names)
+        else:
+            self.single_row_builder = None
+    
+    def _with_single_defaults(self, transaction_data: Dict) -> Dict[str, Any]:
+        """
+        Completar una transacción de la API con los campos que sólo existen en la base de datos
         
-        # Agregar campos faltantes con valores por defecto
+        Los datos del comerciante salen de la tabla de riesgo en memoria; los
+        comerciantes que no están en ella usan los valores por defecto.
+        """
         default_values = {
             'fecha_transaccion': date.today(),
             'comerciante_nivel_riesgo': 'medio',
@@ -525,16 +1880,147 @@ class FraudDetector:
             'distancia_ubicacion_usual': 10.0,
             'monto_cuenta_origen': transaction_data.get('monto', 0) * 5  # Estimación
         }
+        merchant = self.db_manager.merchant_risk.get(transaction_data.get('comerciante'))
+        if merchant is not None:
+            default_values.update((column, value) for column, value in merchant.items() if value is not None)
+        return {**default_values, **transaction_data}
+    
+    def prepare_single(self, transaction_data: Dict) -> np.ndarray:
+        """
+        Preparar la fila de características (1, n_features) de una transacción individual
         
-        for key, value in default_values.items():
-            if key not in df.columns:
-                df[key] = value
+        La historia por cuenta se lee sin modificar el almacén: la transacción
+        de la API todavía no está en la base y se incorpora cuando llega a ella.
+        """
         
-        # Preparar características
-        X, _ = self.feature_engineer.prepare_features(df, fit=False)
+        if not self.is_trained:
+            raise ValueError("Modelo no entrenado. Ejecute train_model() primero.")
+        
+        # Camino rápido sin pandas si los artefactos lo permiten
+        record = self._with_single_defaults(transaction_data)
+        if self.uses_account_features:
+            cuenta = record.get('cuenta_origen_id')
+            record.update(zip(ACCOUNT_FEATURE_NAMES, np.zeros(len(ACCOUNT_FEATURE_NAMES)) if cuenta is None else
+                              self.account_features.features_one(
+                                  int(cuenta), transaction_timestamp(record), float(record['monto']),
+                                  value_bit(record.get('comerciante')), value_bit(record.get('pais')), update=False
+                              )))
+        if self.single_row_builder is not None:
+            return self.single_row_builder.build(record)
+        
+        X, _ = self.feature_engineer.prepare_features(pd.DataFrame([record]), fit=False)
+        return X
+    
+    def score(self, X: np.ndarray) -> np.ndarray:
+        """Probabilidad de fraude para cada fila de una matriz de características"""
+        if self.compiled_forest is not None:
+            return self.compiled_forest.predict_proba(X)
+        return self.model.predict_proba(X)[:, 1]
+    
+    def explain(self, X: np.ndarray, budget_seconds: Optional[float] = None) -> List[Optional[Dict[str, float]]]:
+        """
+        Contribuciones de las características a la probabilidad de cada fila
         
-        # Predecir
-        fraud_probability = float(self.model.predict_proba(X)[0][1])
+        Por fila, las EXPLAIN_TOP_FEATURES de mayor valor absoluto (de mayor a
+        menor). Se explican bloques de EXPLAIN_BLOCK_ROWS filas hasta agotar
+        `budget_seconds` (el primero siempre); las filas que no entraron quedan
+        en None, igual que todas si no hay bosque compilado.
+        """
+        explained: List[Optional[Dict[str, float]]] = [None] * len(X)
+        forest = self.compiled_forest
+        if forest is None:
+            return explained
+        
+        start_time = datetime.now()
+        names = self.feature_names
+        top_count = min(self.config.EXPLAIN_TOP_FEATURES, len(names))
+        block_rows = self.config.EXPLAIN_BLOCK_ROWS
+        
+        for start in range(0, len(X), block_rows):
+            contributions = forest.contributions(X[start:start + block_rows])
+            top = np.argsort(-np.abs(contributions), axis=1, kind='stable')[:, :top_count]
+            values = np.take_along_axis(contributions, top, axis=1)
+            for offset, (features, row_values) in enumerate(zip(top.tolist(), values.tolist())):
+                explained[start + offset] = {names[feature]: value for feature, value in zip(features, row_values)}
+            if budget_seconds is not None and (datetime.now() - start_time).total_seconds() >= budget_seconds:
+                break
+        
+        if explained and explained[-1] is None:
+            logger.info(f"⏱️ Presupuesto de explicación agotado: {sum(row is not None for row in explained)} de {len(X)} filas explicadas")
+        return explained
+    
+    @property
+    def contribution_base(self) -> Optional[float]:
+        """Probabilidad de partida de las contribuciones (None sin bosque compilado)"""
+        return self.compiled_forest.bias if self.compiled_forest is not None else None
+    
+    @property
+    def rules_active(self) -> bool:
+        return self.config.RULES_ENGINE and len(self.db_manager.fraud_rules) > 0
+    
+    def rule_inputs(self, df: pd.DataFrame) -> RuleInputs:
+        """Columnas de un bloque que leen los predicados de las reglas"""
+        hours, minutes = extract_hour_minute(df['horario_transaccion'])
+        return RuleInputs(
+            monto=pd.to_numeric(df['monto'], errors='coerce').to_numpy(dtype=np.float64),
+            minute_of_day=hours * 60 + minutes,
+            comerciante=df['comerciante'],
+            pais=df['pais'] if 'pais' in df else pd.Series(None, index=df.index, dtype=object),
+            distancia=(
+                pd.to_numeric(df['distancia_ubicacion_usual'], errors='coerce').to_numpy(dtype=np.float64)
+                if 'distancia_ubicacion_usual' in df else np.full(len(df), np.nan)
+            ),
+            comerciante_registrado=self.db_manager.merchant_risk.contains(df['comerciante'])
+        )
+    
+    def evaluate_rules(self, df: pd.DataFrame) -> Optional[RuleMatches]:
+        """Todas las reglas sobre un bloque en una pasada (None si no hay reglas activas)"""
+        if not self.rules_active:
+            return None
+        return self.db_manager.fraud_rules.evaluate(self.rule_inputs(df), len(df))
+    
+    def evaluate_rules_one(self, transaction_data: Dict) -> Tuple[Optional[List[CompiledRule]], float]:
+        """Reglas activadas y puntuación de reglas de una transacción de la API (None si no hay reglas)"""
+        if not self.rules_active:
+            return None, 0.0
+        
+        record = self._with_single_defaults(transaction_data)
+        hour, minute = parse_time_parts(record.get('horario_transaccion'))
+        distance = record.get('distancia_ubicacion_usual')
+        merchants = self.db_manager.merchant_risk
+        return self.db_manager.fraud_rules.evaluate_one(RuleInputs(
+            monto=float(record['monto']),
+            minute_of_day=hour * 60 + minute,
+            comerciante=record.get('comerciante'),
+            pais=record.get('pais'),
+            distancia=float('nan') if _is_missing(distance) else float(distance),
+            comerciante_registrado=not len(merchants) or merchants.get(record.get('comerciante')) is not None
+        ))
+    
+    def short_circuited(self, rule_scores: Any) -> np.ndarray:
+        """Filas que las reglas ya deciden como fraude (sólo con FRAUDE_RULES_SHORT_CIRCUIT=true)"""
+        if not self.config.RULES_SHORT_CIRCUIT:
+            return np.zeros(np.shape(rule_scores), dtype=bool)
+        return np.asarray(rule_scores) >= self.config.RULES_SHORT_CIRCUIT_SCORE
+    
+    def score_with_rules(self, X: np.ndarray, matches: Optional[RuleMatches]) -> np.ndarray:
+        """Como `score`, pero las filas decididas por las reglas toman su puntuación sin pasar por el modelo"""
+        if matches is None:
+            return self.score(X)
+        decided = self.short_circuited(matches.score)
+        if not decided.any():
+            return self.score(X)
+        
+        probabilities = matches.score.copy()
+        undecided = ~decided
+        if undecided.any():
+            probabilities[undecided] = self.score(X[undecided])
+        return probabilities
+    
+    def build_single_result(self, transaction_data: Dict, fraud_probability: float,
+                            matched_rules: Optional[List[CompiledRule]] = None,
+                            contributions: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+        """Armar la respuesta de una predicción individual a partir de su probabilidad"""
         is_fraud = fraud_probability >= 0.5
         
         # Determinar nivel de riesgo
@@ -546,7 +2032,8 @@ class FraudDetector:
             risk_level = "LOW"
         
         # Generar razones de detección
-        reasons = self._generate_detection_reasons(transaction_data, fraud_probability)
+        rule_reasons = None if matched_rules is None else [RulesEngine.describe(rule) for rule in matched_rules]
+        reasons = self._generate_detection_reasons(transaction_data, fraud_probability, rule_reasons, contributions)
         
         return {
             'prediccion_fraude': is_fraud,
@@ -556,63 +2043,184 @@ class FraudDetector:
             'transaccion_enviada': transaction_data,
             'timestamp': datetime.now().isoformat(),
             'razones_deteccion': reasons,
-            'confianza_modelo': float(max(fraud_probability, 1 - fraud_probability))
+            'confianza_modelo': float(max(fraud_probability, 1 - fraud_probability)),
+            'reglas_activadas': [rule.id for rule in matched_rules or []],
+            'contribuciones': contributions,
+            'contribucion_base': self.contribution_base if contributions is not None else None
         }
     
-    def predict_database(self) -> Dict[str, Any]:
-        """Analizar todas las transacciones en la base de datos"""
+    def predict_single(self, transaction_data: Dict, explain: bool = False) -> Dict[str, Any]:
+        """Predecir fraude para una transacción individual (con explain, también las contribuciones)"""
+        X = self.prepare_single(transaction_data)
+        matched_rules, rule_score = self.evaluate_rules_one(transaction_data)
+        decided = self.short_circuited(rule_score)
+        fraud_probability = rule_score if decided else float(self.score(X)[0])
+        contributions = self.explain(X)[0] if explain and not decided else None
+        return self.build_single_result(transaction_data, fraud_probability, matched_rules, contributions)
+    
+    def risk_levels(self, probabilities: np.ndarray) -> np.ndarray:
+        """Nivel de riesgo (LOW/MEDIUM/HIGH) de cada probabilidad, con los umbrales de predict_single"""
+        return np.where(
+            probabilities >= self.config.HIGH_RISK_THRESHOLD, "HIGH",
+            np.where(probabilities >= self.config.MEDIUM_RISK_THRESHOLD, "MEDIUM", "LOW")
+        )
+    
+    def predict_batch(self, transactions: List[Dict], ids: List[Any], include_reasons: bool = False,
+                      explain: bool = False) -> Dict[str, Any]:
+        """
+        Predecir fraude para un lote: una pasada de características y una llamada al modelo
+        
+        Con `explain`, contribuciones por característica dentro de FRAUDE_EXPLAIN_BUDGET_MS
+        (las filas decididas por las reglas no pasan por el modelo y no se explican).
+        """
         
         if not self.is_trained:
             raise ValueError("Modelo no entrenado. Ejecute train_model() primero.")
         
         start_time = datetime.now()
         
-        # Cargar todas las transacciones
-        df = self.db_manager.get_all_transactions()
+        records = pd.DataFrame([self._with_single_defaults(transaction) for transaction in transactions])
+        matches = self.evaluate_rules(records)
+        # Como en prepare_single, el lote lee la historia por cuenta sin incorporarse al almacén
+        X = self.prepare_frame(records, self.account_features, update=False)
+        probabilities = self.score_with_rules(X, matches)
+        
+        contributions = None
+        if explain:
+            contributions = [None] * len(transactions)
+            undecided = np.flatnonzero(~self.short_circuited(matches.score)) if matches is not None else np.arange(len(X))
+            explained = self.explain(X[undecided], self.config.EXPLAIN_BUDGET_MS / 1000)
+            for position, row in zip(undecided.tolist(), explained):
+                contributions[position] = row
+        
+        result = {
+            'total_transacciones': len(transactions),
+            'fraudes_detectados': int((probabilities >= 0.5).sum()),
+            'tiempo_procesamiento': (datetime.now() - start_time).total_seconds(),
+            'timestamp': datetime.now().isoformat(),
+            'ids': ids,
+            'probabilidades': probabilities.tolist(),
+            'niveles_riesgo': self.risk_levels(probabilities).tolist()
+        }
+        
+        if matches is not None:
+            result['reglas_activadas'] = matches.ids_per_row()
         
-        # Preparar características
+        if contributions is not None:
+            result['contribuciones'] = contributions
+            result['contribucion_base'] = self.contribution_base
+        
+        if include_reasons:
+            rule_reasons = matches.reasons_per_row() if matches is not None else [None] * len(transactions)
+            row_contributions = contributions if contributions is not None else [None] * len(transactions)
+            result['razones_deteccion'] = [
+                self._generate_detection_reasons(transaction, probability, reasons, row)
+                for transaction, probability, reasons, row
+                in zip(transactions, result['probabilidades'], rule_reasons, row_contributions)
+            ]
+        
+        return result
+    
+    def prepare_frame(self, df: pd.DataFrame, account_features: Optional[AccountFeatureStore] = None,
+                      update: bool = True) -> np.ndarray:
+        """
+        Matriz de características de un bloque de transacciones
+        
+        Si el modelo usa las características por cuenta, salen de `account_features`
+        (que con `update` además acumula el bloque); sin almacén se usa uno vacío,
+        es decir, se reproduce la historia del bloque como al entrenar.
+        """
+        if self.uses_account_features:
+            df = self.add_account_features(df, account_features if account_features is not None else AccountFeatureStore(),
+                                           update=update)
         X, _ = self.feature_engineer.prepare_features(df, fit=False)
+        return X
+    
+    def _score_frame(self, df: pd.DataFrame, account_features: Optional[AccountFeatureStore] = None) -> pd.DataFrame:
+        """Agregar probabilidad, predicción y nivel de riesgo a un bloque de transacciones"""
+        
+        # Reglas sobre el bloque completo (antes de que las características agreguen columnas)
+        matches = self.evaluate_rules(df)
+        
+        # Preparar características
+        X = self.prepare_frame(df, account_features)
         
-        # Predecir en lotes
-        predictions = self.model.predict_proba(X)[:, 1]
+        # Predecir en lotes (las filas decididas por reglas no pasan por el modelo)
+        predictions = self.score_with_rules(X, matches)
         
         # Agregar predicciones al DataFrame
         df['probabilidad_fraude'] = predictions
         df['prediccion_fraude'] = predictions >= 0.5
         df['nivel_riesgo'] = pd.cut(predictions, 
                                    bins=[0, self.config.MEDIUM_RISK_THRESHOLD, self.config.HIGH_RISK_THRESHOLD, 1],
-                                   labels=['LOW', 'MEDIUM', 'HIGH'])
+                                   labels=['LOW', 'MEDIUM', 'HIGH'], include_lowest=True)
         df['prediccion'] = df['prediccion_fraude'].map({True: 'FRAUDE', False: 'NORMAL'})
         
-        # Filtrar solo transacciones fraudulentas detectadas
-        fraudulent_df = df[df['prediccion_fraude'] == True].copy()
-        
-        # Convertir a formato JSON serializable
-        results = []
-        for _, row in fraudulent_df.iterrows():
-            result = {
-                'id': int(row['id']),
-                'cuenta_origen_id': int(row['cuenta_origen_id']) if pd.notna(row['cuenta_origen_id']) else None,
-                'cuenta_destino_id': int(row['cuenta_destino_id']) if pd.notna(row['cuenta_destino_id']) else None,
-                'monto': float(row['monto']),
-                'comerciante': str(row['comerciante']),
-                'ubicacion': str(row['ubicacion']),
-                'tipo_tarjeta': str(row['tipo_tarjeta']),
-                'fecha_transaccion': str(row['fecha_transaccion']),
-                'horario_transaccion': str(row['horario_transaccion']),
-                'probabilidad_fraude': float(row['probabilidad_fraude']),
-                'nivel_riesgo': str(row['nivel_riesgo']),
-                'prediccion': str(row['prediccion']),
-                'es_fraude_real': bool(row['es_fraude'])  # Para comparación
-            }
-            results.append(result)
+        return df
+    
+    def _flagged_columns(self, fraudulent_df: pd.DataFrame) -> Dict[str, List[Any]]:
+        """Columnas JSON serializables de las transacciones marcadas, con las reglas que activan"""
+        matches = self.evaluate_rules(fraudulent_df) if len(fraudulent_df) else None
+        return result_serializer.flagged_columns(fraudulent_df, matches.ids_per_row() if matches is not None else None)
+    
+    def _serialize_flagged(self, fraudulent_df: pd.DataFrame, columnar: bool = False) -> Union[List[Dict], Dict[str, Any]]:
+        """Transacciones marcadas como lista de registros o, con `columnar`, como {columns, rows}"""
+        columns = self._flagged_columns(fraudulent_df)
+        return result_serializer.to_columnar(columns) if columnar else result_serializer.to_records(columns)
+    
+    @staticmethod
+    def _summary_statistics(total_analyzed: int, fraudulent_detected: int, actual_frauds: int) -> Dict[str, Any]:
+        """Resumen comparando detecciones con los fraudes etiquetados en la base"""
+        return {
+            'fraudes_reales_en_db': int(actual_frauds),
+            'fraudes_detectados': fraudulent_detected,
+            'precision_estimada': f"{(fraudulent_detected / max(actual_frauds, 1) * 100):.1f}%" if actual_frauds > 0 else "N/A",
+            'tasa_deteccion': f"{(fraudulent_detected / max(total_analyzed, 1) * 100):.2f}%"
+        }
+    
+    def predict_database(self, columnar: bool = False, limit: Optional[int] = None, min_probability: float = 0.5,
+                         cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Analizar todas las transacciones en la base de datos
+        
+        Devuelve las transacciones con probabilidad >= min_probability en el orden
+        de la tabla (las más recientes primero). Con `limit` o `cursor` devuelve una
+        página de mayor a menor riesgo sin escribir en la base: si la versión en
+        servicio tiene puntuaciones guardadas, la página sale de su índice con LIMIT;
+        si no, se puntúa la tabla y sólo se ordenan las filas de la página
+        (`top_risk_positions`). Un cursor de otra versión del modelo levanta
+        StaleCursorError.
+        """
+        
+        if not self.is_trained:
+            raise ValueError("Modelo no entrenado. Ejecute train_model() primero.")
+        
+        after = decode_cursor(cursor, self.model_version) if cursor else None
+        paged = limit is not None or after is not None
+        start_time = datetime.now()
+        
+        if paged and self.db_manager.get_scoring_watermark(self.model_version) > 0:
+            return self._scored_page(columnar, limit, min_probability, after, start_time)
+        
+        # Cargar y puntuar todas las transacciones
+        df = self._score_frame(self.db_manager.get_all_transactions())
+        probabilities = df['probabilidad_fraude'].to_numpy()
+        
+        if paged:
+            # Seleccionar las más riesgosas: sólo esas se ordenan y serializan
+            positions, remaining = top_risk_positions(probabilities, df['id'].to_numpy(), min_probability, limit, after)
+            fraudulent_df = df.iloc[positions]
+        else:
+            # Filtrar solo transacciones fraudulentas detectadas
+            fraudulent_df, remaining = df[probabilities >= min_probability], 0
+        results = self._serialize_flagged(fraudulent_df, columnar)
         
         end_time = datetime.now()
         processing_time = (end_time - start_time).total_seconds()
         
         # Estadísticas
         total_analyzed = len(df)
-        fraudulent_detected = len(fraudulent_df)
+        fraudulent_detected = int((probabilities >= min_probability).sum())
         actual_frauds = df['es_fraude'].sum()
         
         return {
@@ -621,16 +2229,243 @@ class FraudDetector:
             'tiempo_procesamiento': processing_time,
             'timestamp': end_time.isoformat(),
             'resultados': results,
-            'resumen_estadisticas': {
-                'fraudes_reales_en_db': int(actual_frauds),
-                'fraudes_detectados': fraudulent_detected,
-                'precision_estimada': f"{(fraudulent_detected / max(actual_frauds, 1) * 100):.1f}%" if actual_frauds > 0 else "N/A",
-                'tasa_deteccion': f"{(fraudulent_detected / total_analyzed * 100):.2f}%"
-            }
+            'resumen_estadisticas': self._summary_statistics(total_analyzed, fraudulent_detected, actual_frauds),
+            'siguiente_cursor': self._next_cursor(fraudulent_df) if remaining else None
+        }
+    
+    def _next_cursor(self, page: pd.DataFrame) -> Optional[str]:
+        """Cursor de la última fila de una página (None si está vacía), atado a la versión del modelo"""
+        if page.empty:
+            return None
+        last = page.iloc[-1]
+        return encode_cursor(last['probabilidad_fraude'], last['id'], self.model_version)
+    
+    def stream_database(self, chunk_size: Optional[int] = None) -> Iterator[bytes]:
+        """
+        Analizar la base de datos en bloques y emitir NDJSON mientras avanza el recorrido
+        
+        Cada transacción marcada es una línea {"tipo": "transaccion", ...}; la última
+        línea es {"tipo": "resumen", ...} con las estadísticas. La memoria queda acotada
+        por el tamaño de bloque, no por el de la tabla.
+        """
+        
+        if not self.is_trained:
+            raise ValueError("Modelo no entrenado. Ejecute train_model() primero.")
+        
+        if 'monto_mean' not in self.feature_engineer.feature_stats:
+            logger.warning("⚠️ Modelo sin estadísticas congeladas: las características dependerán de cada bloque")
+        
+        return self._stream_database(chunk_size or self.config.STREAM_CHUNK_SIZE)
+    
+    def _stream_database(self, chunk_size: int) -> Iterator[bytes]:
+        """Generador de stream_database (se ejecuta a medida que el cliente consume)"""
+        start_time = datetime.now()
+        total_analyzed = fraudulent_detected = actual_frauds = 0
+        
+        # La historia por cuenta se acumula a lo largo del recorrido (en orden de id)
+        replay = AccountFeatureStore()
+        
+        try:
+            for chunk in self.db_manager.iter_transactions(chunk_size):
+                df = self._score_frame(chunk, replay)
+                fraudulent_df = df[df['prediccion_fraude'] == True]
+                
+                total_analyzed += len(df)
+                fraudulent_detected += len(fraudulent_df)
+                actual_frauds += int(df['es_fraude'].sum())
+                
+                lines = result_serializer.to_ndjson(self._flagged_columns(fraudulent_df), prefix={'tipo': 'transaccion'})
+                if lines:
+                    yield lines
+        except Exception as e:
+            # Los encabezados ya se enviaron: el error viaja como último registro
+            logger.error(f"❌ Error en análisis por streaming: {e}")
+            yield result_serializer.dumps({'tipo': 'error', 'detalle': str(e)}) + b"\n"
+            return
+        
+        end_time = datetime.now()
+        summary = {
+            'tipo': 'resumen',
+            'transacciones_fraudulentas_encontradas': fraudulent_detected,
+            'total_transacciones_analizadas': total_analyzed,
+            'tiempo_procesamiento': (end_time - start_time).total_seconds(),
+            'timestamp': end_time.isoformat(),
+            'resumen_estadisticas': self._summary_statistics(total_analyzed, fraudulent_detected, actual_frauds)
+        }
+        logger.info(f"✅ Streaming completado: {fraudulent_detected} fraudes detectados de {total_analyzed} transacciones")
+        yield result_serializer.dumps(summary) + b"\n"
+    
+    def score_incremental(self, chunk_size: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Puntuar sólo las transacciones nuevas para la versión actual del modelo
+        
+        Lee desde el watermark (menos un margen para ids que confirmaron tarde),
+        guarda cada bloque con COPY y avanza el watermark. Una versión nueva del
+        modelo empieza con watermark 0, es decir, con una repuntuación completa.
+        """
+        
+        if not self.is_trained:
+            raise ValueError("Modelo no entrenado. Ejecute train_model() primero.")
+        
+        start_time = datetime.now()
+        version = self.model_version
+        watermark = self.db_manager.get_scoring_watermark(version)
+        since_id = max(watermark - self.config.SCORING_WATERMARK_LOOKBACK, 0)
+        scored = 0
+        
+        # Las transacciones nuevas actualizan el almacén en línea; las que ya estaban
+        # en él (repuntuación tras un modelo nuevo) se reproducen en un almacén aparte
+        replay = AccountFeatureStore()
+        
+        for chunk in self.db_manager.iter_unscored_transactions(version, since_id, chunk_size or self.config.STREAM_CHUNK_SIZE):
+            df = self._score_new_and_seen(chunk, replay)
+            self.db_manager.save_scores(version, self._score_rows(df))
+            scored += len(df)
+        
+        # Tras una repuntuación completa ya no se necesitan las versiones anteriores
+        pruned = self.db_manager.prune_scores(version) if watermark == 0 and scored > 0 else 0
+        
+        result = {
+            'version_modelo': version,
+            'transacciones_puntuadas': scored,
+            'watermark_anterior': watermark,
+            'watermark_actual': self.db_manager.get_scoring_watermark(version),
+            'puntuaciones_obsoletas_eliminadas': pruned,
+            'tiempo_procesamiento': (datetime.now() - start_time).total_seconds()
+        }
+        logger.info(f"🧮 Puntuación incremental: {scored} transacciones nuevas (versión {version})")
+        return result
+    
+    def score_realtime_batch(self, limit: int, replay: AccountFeatureStore) -> Dict[str, Any]:
+        """
+        Puntuar el siguiente lote de transacciones sin puntuación y crear sus alertas
+        
+        Es un paso de `score_incremental` acotado a `limit` filas: mismo watermark y
+        mismo margen para ids que confirmaron tarde, así que el consumidor en tiempo
+        real y la puntuación bajo demanda pueden convivir sin duplicar trabajo.
+        """
+        if not self.is_trained:
+            return {'filas': 0}
+        
+        version = self.model_version
+        since_id = max(self.db_manager.get_scoring_watermark(version) - self.config.SCORING_WATERMARK_LOOKBACK, 0)
+        chunk = self.db_manager.get_unscored_batch(version, since_id, limit)
+        if chunk.empty:
+            return {'filas': 0}
+        
+        ages = chunk.pop('segundos_desde_insercion')
+        df = self._score_new_and_seen(chunk, replay)
+        alerts = self.db_manager.save_scores(
+            version, self._score_rows(df), alert_max_age_seconds=self.config.REALTIME_ALERT_MAX_AGE_SECONDS
+        )
+        
+        # Lote completo: puede haber más detrás (la diferencia de ids es una cota por los huecos del SERIAL)
+        pending = max(self.db_manager.get_max_transaction_id() - int(df['id'].max()), 0) if len(df) >= limit else 0
+        return {
+            'filas': len(df),
+            'alertas': alerts,
+            'retraso_segundos': float(ages.max()) if ages.notna().any() else 0.0,
+            'pendientes': pending
+        }
+    
+    @staticmethod
+    def _score_rows(df: pd.DataFrame) -> pd.DataFrame:
+        """Columnas de `puntuaciones_transacciones` de un bloque ya puntuado"""
+        return pd.DataFrame({
+            'transaccion_id': df['id'].astype(np.int64),
+            'probabilidad_fraude': df['probabilidad_fraude'],
+            'nivel_riesgo': df['nivel_riesgo'].astype(str),
+            'prediccion_fraude': df['prediccion_fraude']
+        })
+    
+    def _score_new_and_seen(self, chunk: pd.DataFrame, replay: AccountFeatureStore) -> pd.DataFrame:
+        """_score_frame de un bloque de la base, separando lo que el almacén en línea ya incorporó"""
+        if not self.uses_account_features:
+            return self._score_frame(chunk)
+        
+        store = self.account_features
+        seen = chunk['id'].to_numpy() <= store.last_transaction_id
+        if seen.all():
+            return self._score_frame(chunk, replay)
+        
+        fresh = self._score_frame(chunk[~seen], store)
+        store.last_transaction_id = max(store.last_transaction_id, int(chunk['id'].max()))
+        if not seen.any():
+            return fresh
+        return pd.concat([self._score_frame(chunk[seen], replay), fresh])
+    
+    def predict_database_incremental(self, columnar: bool = False, limit: Optional[int] = None,
+                                     min_probability: float = 0.5, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Equivalente a predict_database leyendo puntuaciones precalculadas tras puntuar lo nuevo
+        
+        Sólo la primera página puntúa lo nuevo; con `cursor` se leen las puntuaciones
+        tal como están, y un cursor de otra versión del modelo levanta StaleCursorError.
+        """
+        after = decode_cursor(cursor, self.model_version) if cursor else None
+        start_time = datetime.now()
+        
+        if after is None:
+            self.score_incremental()
+        return self._scored_page(columnar, limit, min_probability, after, start_time)
+    
+    def _scored_page(self, columnar: bool, limit: Optional[int], min_probability: float,
+                     after: Optional[Cursor], start_time: datetime) -> Dict[str, Any]:
+        """
+        Página de las puntuaciones guardadas de la versión en servicio (sólo lectura)
+        
+        Sale del índice de puntuaciones con LIMIT (se pide una fila de más para saber
+        si hay página siguiente).
+        """
+        fraudulent_df = self.db_manager.get_scored_flagged(
+            self.model_version, min_probability, None if limit is None else limit + 1, after
+        )
+        has_more = limit is not None and len(fraudulent_df) > limit
+        fraudulent_df = fraudulent_df.iloc[:limit]
+        summary = self.db_manager.get_score_summary(self.model_version, min_probability)
+        
+        end_time = datetime.now()
+        return {
+            'transacciones_fraudulentas_encontradas': summary['detectados'],
+            'total_transacciones_analizadas': summary['total'],
+            'tiempo_procesamiento': (end_time - start_time).total_seconds(),
+            'timestamp': end_time.isoformat(),
+            'resultados': self._serialize_flagged(fraudulent_df, columnar),
+            'resumen_estadisticas': self._summary_statistics(summary['total'], summary['detectados'], summary['fraudes_reales']),
+            'siguiente_cursor': self._next_cursor(fraudulent_df) if has_more else None
         }
     
-    def _generate_detection_reasons(self, transaction_data: Dict, probability: float) -> List[str]:
-        """Generar razones legibles de por qué se detectó como fraude"""
+    def _generate_detection_reasons(self, transaction_data: Dict, probability: float,
+                                    rule_reasons: Optional[List[str]] = None,
+                                    contributions: Optional[Dict[str, float]] = None) -> List[str]:
+        """
+        Generar razones legibles de por qué se detectó como fraude
+        
+        Con reglas cargadas, `rule_reasons` son las reglas activadas; con
+        `contributions`, se agregan las características que más subieron la
+        probabilidad según el bosque. Sin ninguna de las dos (None) se usan las
+        heurísticas fijas.
+        """
+        if rule_reasons is not None or contributions is not None:
+            reasons = list(rule_reasons or [])
+            reasons.extend(
+                f"{feature} aumenta el riesgo (+{value * 100:.1f} p.p.)"
+                for feature, value in (contributions or {}).items() if value > 0
+            )
+        else:
+            reasons = self._heuristic_reasons(transaction_data)
+        
+        if probability > 0.8:
+            reasons.append("Patrón altamente sospechoso detectado por IA")
+        
+        if not reasons:
+            reasons.append("Combinación de factores de riesgo menores")
+        
+        return reasons
+    
+    @staticmethod
+    def _heuristic_reasons(transaction_data: Dict) -> List[str]:
+        """Razones fijas para cuando no hay reglas de `reglas_fraude` cargadas"""
         reasons = []
         
         monto = transaction_data.get('monto', 0)
@@ -654,13 +2489,139 @@ class FraudDetector:
         except:
             pass
         
-        if probability > 0.8:
-            reasons.append("Patrón altamente sospechoso detectado por IA")
+        return reasons
+
+# =====================================================
+# ENTRENAMIENTO EN SEGUNDO PLANO
+# =====================================================
+
+def run_training_job(rebuild_snapshot: bool = False, incremental: bool = False) -> Dict[str, Any]:
+    """
+    Punto de entrada del proceso de entrenamiento: entrena y guarda la versión sin publicarla
+    
+    Con `incremental`, actualiza la versión publicada con las transacciones nuevas.
+    """
+    detector = FraudDetector(Config())
+    try:
+        if incremental:
+            detector.load_model()
+            return detector.update_model(publish=False)
+        return detector.train_model(force_retrain=True, rebuild_snapshot=rebuild_snapshot, publish=False)
+    finally:
+        # El proceso sigue vivo para el próximo trabajo: no dejar conexiones abiertas
+        detector.db_manager.engine.dispose()
+
+class TrainingJobManager:
+    """
+    Reentrenamientos en un proceso aparte con intercambio atómico del detector
+    
+    El ajuste del Random Forest corre en un proceso `spawn` propio, así que no
+    compite por el GIL con el event loop. Ese proceso se crea con el primer
+    trabajo y lo reutilizan los siguientes: importar app.py (y sus globales)
+    se paga una sola vez y no en cada reentrenamiento, que con la actualización
+    periódica es frecuente. Si el proceso muere, el siguiente trabajo crea
+    otro. Al terminar, `on_trained` carga la
+    nueva versión y reemplaza el detector en servicio; las predicciones en curso
+    terminan con la referencia al detector anterior.
+    
+    El trabajo toma el lock de entrenamiento compartido durante toda su
+    duración: si otro worker está entrenando, el pedido se rechaza.
+    """
+    
+    def __init__(self, on_trained: Callable[[str], Awaitable[None]], lock: TrainingLock, max_history: int = 20):
+        self.on_trained = on_trained
+        self.lock = lock
+        self.max_history = max_history
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._active_job_id: Optional[str] = None
+        self._tasks = set()
+        self._executor: Optional[ProcessPoolExecutor] = None
+    
+    @property
+    def active_job(self) -> Optional[Dict[str, Any]]:
+        return self.jobs.get(self._active_job_id) if self._active_job_id else None
+    
+    def submit(self, rebuild_snapshot: bool = False, incremental: bool = False) -> Dict[str, Any]:
+        """Encolar un reentrenamiento completo o incremental (uno a la vez)"""
+        if self._active_job_id:
+            raise RuntimeError(f"Ya hay un entrenamiento en curso: {self._active_job_id}")
+        if not self.lock.acquire(blocking=False):
+            raise RuntimeError("Otro worker está entrenando un modelo")
+        
+        job = {
+            'job_id': uuid.uuid4().hex[:12],
+            'modo': 'incremental' if incremental else 'completo',
+            'estado': 'en_cola',
+            'creado': datetime.now().isoformat(),
+            'iniciado': None,
+            'finalizado': None,
+            'version_modelo': None,
+            'resultados': None,
+            'error': None
+        }
+        self.jobs[job['job_id']] = job
+        self._active_job_id = job['job_id']
         
-        if not reasons:
-            reasons.append("Combinación de factores de riesgo menores")
+        # Conservar sólo los últimos trabajos
+        for old_job_id in list(self.jobs)[:-self.max_history]:
+            del self.jobs[old_job_id]
         
-        return reasons
+        task = asyncio.create_task(self._run(job, rebuild_snapshot, incremental))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+    
+    def _training_executor(self) -> ProcessPoolExecutor:
+        """Proceso de entrenamiento compartido por todos los trabajos (se crea con el primero)"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        return self._executor
+    
+    async def _run(self, job: Dict[str, Any], rebuild_snapshot: bool, incremental: bool):
+        """Entrenar en el proceso hijo y activar la versión resultante (si la hay)"""
+        loop = asyncio.get_running_loop()
+        
+        try:
+            job.update(estado='entrenando', iniciado=datetime.now().isoformat())
+            logger.info(f"🤖 Entrenamiento {job['job_id']} iniciado en segundo plano")
+            try:
+                training = loop.run_in_executor(self._training_executor(), run_training_job, rebuild_snapshot, incremental)
+            except BrokenProcessPool:
+                # El proceso murió mientras esperaba trabajo: arrancar otro
+                self._executor = None
+                training = loop.run_in_executor(self._training_executor(), run_training_job, rebuild_snapshot, incremental)
+            try:
+                results = await training
+            except BrokenProcessPool:
+                # El proceso murió durante el entrenamiento (p. ej. por falta de memoria): el próximo trabajo arranca otro
+                self._executor = None
+                raise
+            
+            # Actualización incremental sin versión nueva (pocos datos o no superó la validación)
+            if not results.get('promoted', True):
+                job.update(estado='descartado', resultados=results)
+                logger.info(f"ℹ️ Entrenamiento {job['job_id']} sin versión nueva: {results['reason']}")
+                return
+            
+            job['estado'] = 'activando'
+            await self.on_trained(results['model_version'])
+            job.update(estado='completado', version_modelo=results['model_version'], resultados=results)
+            logger.info(f"✅ Entrenamiento {job['job_id']} completado - versión {results['model_version']} en servicio")
+        except Exception as e:
+            job.update(estado='error', error=str(e))
+            logger.error(f"❌ Error en entrenamiento {job['job_id']}: {e}")
+        finally:
+            job['finalizado'] = datetime.now().isoformat()
+            self._active_job_id = None
+            self.lock.release()
+    
+    async def shutdown(self):
+        """Cancelar los trabajos pendientes y cerrar el proceso de entrenamiento al detener la aplicación"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
 
 # =====================================================
 # APLICACIÓN FASTAPI
@@ -685,6 +2646,9 @@ app.add_middleware(
 # ✅ Agregar middleware de reporte de métricas a Stats API
 import os
 from stats_reporter import StatsReporterMiddleware
+from micro_batcher import MicroBatcher
+from realtime_scoring import PostgresListener, RealtimeScorer
+from worker_pools import PoolSaturatedError, WorkerPool
 
 STATS_API_URL = os.getenv("STATS_API_URL", "http://stats-api:8003")
 app.add_middleware(
@@ -696,9 +2660,221 @@ app.add_middleware(
 )
 logger.info(f"✅ Stats reporter middleware configurado: fraude → {STATS_API_URL}")
 
-# Instancia global del detector
+# Instancia global del detector (se reemplaza completa al activar una versión nueva)
 fraud_detector = FraudDetector(config)
 
+async def activate_model_version(version: str, publish: bool = True):
+    """Cargar una versión entrenada en segundo plano y ponerla en servicio"""
+    global fraud_detector
+    detector = FraudDetector(config, db_manager=fraud_detector.db_manager, account_features=fraud_detector.account_features)
+    await asyncio.to_thread(detector.load_model, version)
+    if publish:
+        detector.publish_version()
+    fraud_detector = detector  # Asignación atómica: cada petición usa la referencia que tomó
+
+# Reentrenamientos en proceso aparte
+training_jobs = TrainingJobManager(activate_model_version, fraud_detector.training_lock())
+
+def ensure_scoring_schema(detector: FraudDetector):
+    """
+    Crear las tablas de puntuación bajo el lock, para que varios workers no ejecuten el DDL a la vez
+    
+    El trigger de NOTIFY existe sólo con FRAUDE_REALTIME_SCORING=true: si no, cada
+    INSERT en `transacciones` pagaría un pg_notify que nadie escucha.
+    """
+    with detector.training_lock():
+        detector.db_manager.ensure_scoring_tables()
+        if detector.config.REALTIME_SCORING:
+            detector.db_manager.ensure_realtime_trigger()
+        elif detector.db_manager.drop_realtime_trigger():
+            logger.info("📡 Trigger de notificación eliminado (FRAUDE_REALTIME_SCORING desactivado)")
+
+def load_or_train_model(detector: FraudDetector):
+    """
+    Cargar la versión publicada o, si no hay ninguna, entrenarla bajo el lock
+    
+    Con varios workers sólo el primero en tomar el lock entrena; los demás
+    esperan y, al obtenerlo, `train_model` encuentra el modelo ya guardado y
+    sólo lo carga.
+    """
+    try:
+        detector.load_model()
+        logger.info("✅ Modelo cargado desde archivo")
+        return
+    except Exception:
+        logger.info("🔄 Modelo no encontrado, entrenando nuevo modelo...")
+    
+    with detector.training_lock():
+        training_results = detector.train_model()
+    if 'auc_score' in training_results:
+        logger.info(f"✅ Modelo entrenado exitosamente - AUC: {training_results['auc_score']:.3f}")
+
+async def watch_published_version():
+    """
+    Recargar el modelo cuando otro proceso publica una versión nueva
+    
+    Cada worker revisa `current_version.json` cada FRAUDE_MODEL_POLL_SECONDS.
+    Mientras este worker tiene un entrenamiento propio en curso no se revisa:
+    la activación la hace el propio trabajo al terminar.
+    """
+    while True:
+        await asyncio.sleep(config.MODEL_POLL_SECONDS)
+        if training_jobs.active_job:
+            continue
+        try:
+            version = fraud_detector.current_version()
+            if version and version != fraud_detector.model_version:
+                logger.info(f"🔄 Versión {version} publicada por otro proceso, recargando...")
+                await activate_model_version(version, publish=False)
+                logger.info(f"✅ Versión {version} en servicio")
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo recargar la versión publicada: {e}")
+
+async def update_model_periodically():
+    """
+    Lanzar una actualización incremental cada FRAUDE_INCREMENTAL_UPDATE_SECONDS
+    
+    Con varios workers la lanza el que toma el lock de entrenamiento; los demás
+    reciben la versión nueva por `watch_published_version`.
+    """
+    while True:
+        await asyncio.sleep(config.INCREMENTAL_UPDATE_SECONDS)
+        if training_jobs.active_job or not fraud_detector.is_trained:
+            continue
+        try:
+            job = training_jobs.submit(incremental=True)
+            logger.info(f"🌱 Actualización incremental {job['job_id']} programada")
+        except RuntimeError:
+            pass  # Otro worker está entrenando
+
+# Almacén de reproducción del consumidor en tiempo real para la versión en servicio
+# (transacciones que el almacén en línea ya vio, p. ej. al repuntuar tras un modelo nuevo)
+realtime_replay: Dict[str, AccountFeatureStore] = {}
+
+def process_realtime_batch(limit: int) -> Dict[str, Any]:
+    """Lote del consumidor en tiempo real con el modelo que esté en servicio"""
+    detector = fraud_detector
+    replay = realtime_replay.get(detector.model_version)
+    if replay is None:
+        realtime_replay.clear()
+        replay = realtime_replay.setdefault(detector.model_version, AccountFeatureStore())
+    return detector.score_realtime_batch(limit, replay)
+
+async def refresh_fraud_rules_periodically():
+    """Recompilar `reglas_fraude` cada FRAUDE_RULES_REFRESH_SECONDS (activar o editar reglas no requiere reiniciar)"""
+    while True:
+        await asyncio.sleep(config.RULES_REFRESH_SECONDS)
+        try:
+            await asyncio.to_thread(fraud_detector.db_manager.refresh_fraud_rules)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudieron refrescar las reglas de fraude: {e}")
+
+async def refresh_merchant_risk_periodically():
+    """Releer `comerciantes` cada FRAUDE_MERCHANT_REFRESH_SECONDS (el trigger de transacciones la actualiza seguido)"""
+    while True:
+        await asyncio.sleep(config.MERCHANT_REFRESH_SECONDS)
+        try:
+            await asyncio.to_thread(fraud_detector.db_manager.refresh_merchant_risk)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo refrescar la tabla de riesgo de comerciantes: {e}")
+
+# Pools separados: un análisis de tabla completa nunca ocupa los hilos de las predicciones
+light_pool = WorkerPool("light", config.LIGHT_POOL_WORKERS, config.LIGHT_POOL_MAX_IN_FLIGHT, retry_after=1)
+heavy_pool = WorkerPool("heavy", config.HEAVY_POOL_WORKERS, config.HEAVY_POOL_MAX_IN_FLIGHT, config.HEAVY_POOL_RETRY_AFTER)
+
+def toon_report_state() -> Tuple[str, int, int]:
+    """Estado del que depende el reporte TOON: versión en servicio, último id y watermark"""
+    detector = fraud_detector
+    return (detector.model_version, *detector.db_manager.get_scoring_state(detector.model_version))
+
+def build_toon_report(limit: int) -> Tuple[Tuple[str, int, int], bytes]:
+    """
+    Generar el reporte TOON de las `limit` transacciones más riesgosas
+    
+    Puntúa sólo lo nuevo y lee las puntuaciones guardadas (el mismo camino que
+    predict_all_from_db con incremental=true). El estado devuelto toma el último
+    id de antes de puntuar y el watermark de después: lo que llegue mientras se
+    genera dispara otro refresco, lo que puntuó la propia generación no.
+    """
+    detector = fraud_detector
+    version = detector.model_version
+    latest_id = detector.db_manager.get_max_transaction_id()
+    result = detector.predict_database_incremental(limit=limit)
+    state = (version, latest_id, detector.db_manager.get_scoring_watermark(version))
+    
+    # Los ids de reglas como "3|7": una lista JSON metería comas dentro de la fila TOON
+    fraud_transactions = result['resultados']
+    for transaction in fraud_transactions:
+        transaction['reglas_activadas'] = '|'.join(map(str, transaction['reglas_activadas']))
+    toon_data = {"fraud_transactions": fraud_transactions}
+    
+    if fraud_transactions:
+        toon_report = encode(toon_data, delimiter=",", length_marker=True)
+    else:
+        toon_report = "fraud_transactions[0]: (no fraud detected)"
+    savings = estimate_token_savings(toon_data)
+    
+    total = result['total_transacciones_analizadas']
+    found = result['transacciones_fraudulentas_encontradas']
+    logger.info(f"💾 Reporte TOON generado (limit={limit}): {savings['token_savings_approx']} tokens ahorrados ({savings['savings_percent']}%)")
+    
+    payload = {
+        "toon_report": toon_report,
+        "statistics": {
+            "total_analyzed": total,
+            "fraud_detected": found,
+            "fraud_rate": f"{found / total if total else 0.0:.2%}",
+            "processing_time": result['tiempo_procesamiento']
+        },
+        "token_savings": {
+            "json_tokens": savings['json_tokens_approx'],
+            "toon_tokens": savings['toon_tokens_approx'],
+            "tokens_saved": savings['token_savings_approx'],
+            "savings_percent": f"{savings['savings_percent']}%",
+            "compression_ratio": f"{savings['json_chars'] / max(savings['toon_chars'], 1):.2f}x"
+        },
+        "format": "TOON",
+        "usage_note": "Send this TOON report directly to LLMs. Format: fraud_transactions[N]{field1,field2,...}: ...",
+        "generated_at": datetime.now().isoformat(),
+        "model_version": version
+    }
+    return state, result_serializer.dumps(payload)
+
+# Reportes TOON por `limit`; se generan en el pool pesado (puntúan y leen la base)
+toon_reports = ReportCache(build_toon_report, toon_report_state, config.TOON_REPORT_CACHE_ENTRIES, run=heavy_pool.run)
+
+async def refresh_toon_reports_periodically():
+    """Regenerar cada FRAUDE_TOON_REPORT_REFRESH_SECONDS los reportes TOON cuyos datos cambiaron"""
+    while True:
+        await asyncio.sleep(config.TOON_REPORT_REFRESH_SECONDS)
+        if not fraud_detector.is_trained:
+            continue
+        try:
+            refreshed = await toon_reports.refresh()
+            if refreshed:
+                logger.info(f"🔄 {refreshed} reporte(s) TOON regenerado(s)")
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudieron refrescar los reportes TOON: {e}")
+
+# Agrupador de predicciones individuales concurrentes
+micro_batcher = MicroBatcher(config.BATCH_WINDOW_MS, config.BATCH_MAX_SIZE, executor=light_pool.executor)
+
+# Consumidor de LISTEN/NOTIFY (sólo se inicia con FRAUDE_REALTIME_SCORING=true)
+realtime_scorer = RealtimeScorer(
+    lambda: PostgresListener(fraud_detector.db_manager.listener_connect_kwargs(), config.REALTIME_CHANNEL),
+    process_realtime_batch, config.REALTIME_BATCH_SIZE, config.REALTIME_POLL_SECONDS
+)
+
+@app.exception_handler(PoolSaturatedError)
+async def pool_saturated_handler(request: Request, exc: PoolSaturatedError):
+    """Pool lleno: 503 con Retry-After en lugar de encolar sin límite"""
+    logger.warning(f"⏳ {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc), "pool": exc.pool_name},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
 # =====================================================
 # ENDPOINTS DE LA API
 # =====================================================
@@ -712,21 +2888,68 @@ async def startup_event():
     if not fraud_detector.db_manager.test_connection():
         raise Exception("No se pudo conectar a la base de datos")
     
-    # Cargar o entrenar modelo
+    # Tablas de puntuación incremental (bases creadas antes de que existieran).
+    # En un hilo: esperar el lock mientras otro worker entrena no debe bloquear el event loop
     try:
-        fraud_detector.load_model()
-        logger.info("✅ Modelo cargado desde archivo")
-    except:
-        logger.info("🔄 Modelo no encontrado, entrenando nuevo modelo...")
+        await asyncio.to_thread(ensure_scoring_schema, fraud_detector)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudieron crear las tablas de puntuación: {e}")
+    
+    # Riesgo de comerciantes en memoria (si falla, se reintenta al primer uso)
+    try:
+        await asyncio.to_thread(fraud_detector.db_manager.refresh_merchant_risk)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo cargar la tabla de riesgo de comerciantes: {e}")
+    
+    # Reglas de `reglas_fraude` (si falla, se sirve sólo con el modelo hasta el próximo refresco)
+    if config.RULES_ENGINE:
         try:
-            training_results = fraud_detector.train_model()
-            logger.info(f"✅ Modelo entrenado exitosamente - AUC: {training_results['auc_score']:.3f}")
+            await asyncio.to_thread(fraud_detector.db_manager.refresh_fraud_rules)
         except Exception as e:
-            logger.error(f"❌ Error entrenando modelo: {e}")
-            raise
+            logger.warning(f"⚠️ No se pudieron cargar las reglas de fraude: {e}")
+    
+    # Cargar o entrenar modelo (en un hilo: esperar el lock no debe bloquear el event loop)
+    try:
+        await asyncio.to_thread(load_or_train_model, fraud_detector)
+    except Exception as e:
+        logger.error(f"❌ Error entrenando modelo: {e}")
+        raise
+    
+    # Estado por cuenta: última semana de la base (sin SQL por petición después)
+    try:
+        await asyncio.to_thread(fraud_detector.seed_account_features)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo sembrar el almacén por cuenta: {e}")
+    
+    await micro_batcher.start()
+    if config.REALTIME_SCORING:
+        await realtime_scorer.start()
+    version_watcher = asyncio.create_task(watch_published_version())
+    app.state.version_watcher = version_watcher
+    if config.MERCHANT_REFRESH_SECONDS > 0:
+        app.state.merchant_refresher = asyncio.create_task(refresh_merchant_risk_periodically())
+    if config.RULES_ENGINE and config.RULES_REFRESH_SECONDS > 0:
+        app.state.rules_refresher = asyncio.create_task(refresh_fraud_rules_periodically())
+    if config.TOON_REPORT_REFRESH_SECONDS > 0:
+        app.state.toon_refresher = asyncio.create_task(refresh_toon_reports_periodically())
+    if config.INCREMENTAL_UPDATE_SECONDS > 0:
+        app.state.model_updater = asyncio.create_task(update_model_periodically())
     
     logger.info("🎯 API lista para detectar fraudes!")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Liberar recursos al detener la aplicación"""
+    for task_name in ('version_watcher', 'merchant_refresher', 'rules_refresher', 'toon_refresher', 'model_updater'):
+        task = getattr(app.state, task_name, None)
+        if task is not None:
+            task.cancel()
+    await micro_batcher.stop()
+    await realtime_scorer.stop()
+    await training_jobs.shutdown()
+    light_pool.shutdown()
+    heavy_pool.shutdown()
+
 @app.get("/")
 async def root():
     """Endpoint raíz con información de la API"""
@@ -737,8 +2960,14 @@ async def root():
         "model_trained": fraud_detector.is_trained,
         "endpoints": {
             "predict_single": "/predict_single_transaction (POST)",
+            "predict_batch": "/predict_batch (POST, JSON o NDJSON)",
             "predict_database": "/api/fraude/predict_all_from_db (GET)",
-            "train_model": "/train_model (POST)",
+            "predict_database_stream": "/api/fraude/predict_all_from_db/stream (GET, NDJSON)",
+            "score_new_transactions": "/score_new_transactions (POST)",
+            "train_model": "/train_model (POST, en segundo plano)",
+            "training_jobs": "/train_model/jobs/{job_id} (GET)",
+            "batching_metrics": "/metrics/batching (GET)",
+            "pool_metrics": "/metrics/pools (GET)",
             "health": "/health (GET)"
         }
     }
@@ -746,7 +2975,8 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Verificación de estado de salud"""
-    db_ok = fraud_detector.db_manager.test_connection()
+    # Sin admisión: el health check no debe fallar por saturación
+    db_ok = await asyncio.get_running_loop().run_in_executor(light_pool.executor, fraud_detector.db_manager.test_connection)
     
     return {
         "status": "healthy" if db_ok and fraud_detector.is_trained else "unhealthy",
@@ -756,7 +2986,7 @@ async def health_check():
     }
 
 @app.post("/predict_single_transaction", response_model=PredictionResponse)
-async def predict_single_transaction(transaction: TransactionInput):
+async def predict_single_transaction(transaction: TransactionInput, explain: bool = False):
     """
     🔍 Analizar una transacción individual para detectar fraude
     
@@ -764,24 +2994,91 @@ async def predict_single_transaction(transaction: TransactionInput):
     - Probabilidad de fraude (0.0 a 1.0)
     - Clasificación de riesgo (LOW/MEDIUM/HIGH)  
     - Razones de la detección
+    - Con explain=true, contribuciones de las características a la probabilidad
     """
     try:
         # Convertir modelo Pydantic a dict
         transaction_dict = transaction.dict()
         
-        # Predecir
-        result = fraud_detector.predict_single(transaction_dict)
+        # Predecir: la puntuación se agrupa con otras peticiones concurrentes
+        detector = fraud_detector
+        # Las características (con la lectura del almacén por cuenta, que toma su lock) van al pool light
+        features = await light_pool.run(detector.prepare_single, transaction_dict)
+        matched_rules, rule_score = detector.evaluate_rules_one(transaction_dict)
+        contributions = None
+        if detector.short_circuited(rule_score):
+            probability = rule_score
+        else:
+            probability = await micro_batcher.submit(detector.score, features)
+            if explain:
+                contributions = (await light_pool.run(detector.explain, features))[0]
+        result = detector.build_single_result(transaction_dict, probability, matched_rules, contributions)
         
         logger.info(f"🔍 Transacción analizada: ${transaction.monto} - Fraude: {result['prediccion_fraude']} ({result['probabilidad_fraude']:.1%})")
         
         return PredictionResponse(**result)
         
+    except PoolSaturatedError:
+        raise
     except Exception as e:
         logger.error(f"❌ Error prediciendo transacción individual: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
+# Validadores reutilizables para el cuerpo de /predict_batch
+batch_array_adapter = TypeAdapter(List[BatchTransactionInput])
+batch_item_adapter = TypeAdapter(BatchTransactionInput)
+
+def parse_batch_body(body: bytes, content_type: str) -> List[BatchTransactionInput]:
+    """Validar un lote como array JSON o NDJSON (una transacción por línea)"""
+    if 'ndjson' in content_type or 'jsonl' in content_type:
+        return [batch_item_adapter.validate_json(line) for line in body.splitlines() if line.strip()]
+    return batch_array_adapter.validate_json(body)
+
+@app.post("/predict_batch", response_model=BatchPredictionResponse, response_model_exclude_none=True)
+async def predict_batch(request: Request, include_reasons: bool = False, explain: bool = False):
+    """
+    📦 Analizar un lote de transacciones en una sola pasada
+    
+    Acepta un array JSON de transacciones (Content-Type: application/json) o
+    NDJSON (application/x-ndjson). Devuelve columnas paralelas:
+    - ids: identificador enviado o posición en el lote
+    - probabilidades: probabilidad de fraude (0.0 a 1.0)
+    - niveles_riesgo: LOW/MEDIUM/HIGH
+    - razones_deteccion: sólo con include_reasons=true
+    - contribuciones: sólo con explain=true, las filas que entran en FRAUDE_EXPLAIN_BUDGET_MS
+    """
+    try:
+        transactions = parse_batch_body(await request.body(), request.headers.get('content-type', ''))
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=e.errors(include_url=False))
+    
+    if not transactions:
+        raise HTTPException(status_code=400, detail="El lote está vacío")
+    if len(transactions) > config.MAX_BATCH_TRANSACTIONS:
+        raise HTTPException(status_code=413, detail=f"Máximo {config.MAX_BATCH_TRANSACTIONS} transacciones por lote")
+    
+    try:
+        ids, records = [], []
+        for position, transaction in enumerate(transactions):
+            record = transaction.model_dump(exclude={'id'})
+            ids.append(transaction.id if transaction.id is not None else position)
+            records.append(record)
+        
+        result = await light_pool.run(fraud_detector.predict_batch, records, ids, include_reasons=include_reasons, explain=explain)
+        
+        logger.info(f"📦 Lote analizado: {result['total_transacciones']} transacciones, {result['fraudes_detectados']} fraudes ({result['tiempo_procesamiento']:.3f}s)")
+        
+        return BatchPredictionResponse(**result)
+        
+    except PoolSaturatedError:
+        raise
+    except Exception as e:
+        logger.error(f"❌ Error prediciendo lote: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
 @app.get("/predict_all_from_db", response_model=DatabaseAnalysisResponse)
-async def predict_all_from_database():
+async def predict_all_from_database(incremental: bool = False, columnar: bool = False, limit: Optional[int] = None,
+                                    min_probability: float = 0.5, cursor: Optional[str] = None):
     """
     🗄️ Analizar todas las transacciones en la base de datos
     
@@ -789,42 +3086,154 @@ async def predict_all_from_database():
     - Lista de transacciones fraudulentas detectadas
     - Estadísticas del análisis
     - Tiempo de procesamiento
+    
+    Con `incremental=true` sólo se puntúan las transacciones nuevas y el resultado
+    se lee de las puntuaciones guardadas para la versión actual del modelo.
+    Con `columnar=true`, `resultados` es {"columns": [...], "rows": [[...], ...]}
+    en lugar de un objeto por transacción (los nombres no se repiten por fila).
+    
+    `min_probability` fija la probabilidad mínima (0.5 por defecto, las marcadas
+    como fraude). Sin `limit` el análisis completo conserva el orden de la tabla.
+    `limit` devuelve sólo las N más riesgosas, de mayor a menor riesgo, y para la
+    página siguiente se pasa el `siguiente_cursor` de la respuesta como `cursor`.
+    Las páginas no escriben en la base (salvo la primera con `incremental=true`):
+    se leen de las puntuaciones guardadas de la versión en servicio o, si no las
+    hay, de un análisis completo. Un cursor de otra versión del modelo responde 409.
     """
+    if limit is not None and limit <= 0:
+        raise HTTPException(status_code=400, detail="limit debe ser positivo")
+    if not 0.0 <= min_probability <= 1.0:
+        raise HTTPException(status_code=400, detail="min_probability debe estar entre 0 y 1")
+    
+    detector = fraud_detector
+    if cursor:
+        try:
+            decode_cursor(cursor, detector.model_version)
+        except StaleCursorError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
     try:
-        logger.info("📊 Iniciando análisis masivo de base de datos...")
+        logger.info(f"📊 Iniciando análisis masivo de base de datos{' (incremental)' if incremental else ''}...")
         
-        result = fraud_detector.predict_database()
+        analyze = detector.predict_database_incremental if incremental else detector.predict_database
+        
+        def analyze_and_render():
+            # La respuesta se codifica en el pool: serializar cientos de miles de filas
+            # no debe ocupar el event loop (y se evita validarlas de nuevo con pydantic)
+            result = analyze(columnar=columnar, limit=limit, min_probability=min_probability, cursor=cursor)
+            return result, result_serializer.dumps(result)
+        
+        result, body = await heavy_pool.run(analyze_and_render)
         
         logger.info(f"✅ Análisis completado: {result['transacciones_fraudulentas_encontradas']} fraudes detectados de {result['total_transacciones_analizadas']} transacciones")
         
-        return DatabaseAnalysisResponse(**result)
+        return Response(content=body, media_type="application/json")
         
+    except PoolSaturatedError:
+        raise
     except Exception as e:
         logger.error(f"❌ Error analizando base de datos: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
 
+@app.post("/score_new_transactions")
+async def score_new_transactions():
+    """
+    🧮 Puntuar las transacciones nuevas desde el último watermark
+    
+    Pensado para ejecutarse periódicamente (cron) y mantener al día las
+    puntuaciones que lee /predict_all_from_db?incremental=true.
+    """
+    try:
+        return await heavy_pool.run(fraud_detector.score_incremental)
+    except PoolSaturatedError:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"❌ Error en puntuación incremental: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+
+@app.get("/predict_all_from_db/stream")
+async def predict_all_from_database_stream(chunk_size: Optional[int] = None):
+    """
+    🌊 Analizar todas las transacciones en streaming (NDJSON)
+    
+    Recorre la base con un cursor del lado del servidor en bloques de `chunk_size`
+    filas y emite cada transacción marcada como fraude apenas se puntúa su bloque.
+    La última línea es un registro {"tipo": "resumen"} con las estadísticas.
+    """
+    if chunk_size is not None and chunk_size <= 0:
+        raise HTTPException(status_code=400, detail="chunk_size debe ser positivo")
+    
+    # El cupo se reserva antes de responder y se libera al terminar el stream
+    await heavy_pool.admit()
+    try:
+        logger.info("🌊 Iniciando análisis de base de datos por streaming...")
+        stream = fraud_detector.stream_database(chunk_size)
+    except Exception as e:
+        heavy_pool.release()
+        logger.error(f"❌ Error iniciando análisis por streaming: {e}")
+        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+    
+    return StreamingResponse(heavy_pool.iterate(stream), media_type="application/x-ndjson")
+
 @app.post("/train_model")
-async def retrain_model(force: bool = False):
+async def retrain_model(force: bool = False, rebuild_snapshot: bool = False, incremental: bool = False):
     """
     🤖 Reentrenar el modelo de detección de fraude
     
+    El entrenamiento corre en un proceso aparte y la API sigue atendiendo con
+    la versión actual; al terminar, la nueva versión se activa de forma atómica.
+    Devuelve 202 con el trabajo creado (consultar /train_model/jobs/{job_id}).
+    
     Parámetros:
     - force: Si es True, fuerza el reentrenamiento aunque ya exista un modelo
+    - rebuild_snapshot: Si es True, vuelve a copiar todas las transacciones al
+      snapshot local (recoge etiquetas corregidas en filas ya copiadas)
+    - incremental: Si es True, en lugar de reentrenar desde cero agrega árboles
+      ajustados con las transacciones nuevas a la versión en servicio; la
+      versión resultante se activa sólo si supera la validación
     """
-    try:
-        logger.info("🔄 Iniciando reentrenamiento del modelo...")
-        
-        training_results = fraud_detector.train_model(force_retrain=force)
-        
+    if incremental:
+        if not fraud_detector.is_trained:
+            raise HTTPException(status_code=409, detail="No hay un modelo en servicio para actualizar")
+    elif fraud_detector.is_trained and not force:
         return {
-            "message": "✅ Modelo reentrenado exitosamente",
-            "training_results": training_results,
+            "message": "ℹ️ Ya hay un modelo entrenado; use force=true para reentrenar",
+            "model_version": fraud_detector.model_version,
             "timestamp": datetime.now().isoformat()
         }
-        
-    except Exception as e:
-        logger.error(f"❌ Error reentrenando modelo: {e}")
-        raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+    
+    try:
+        job = training_jobs.submit(rebuild_snapshot=rebuild_snapshot, incremental=incremental)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    
+    logger.info(f"🔄 Reentrenamiento {job['job_id']} ({job['modo']}) encolado")
+    return JSONResponse(status_code=202, content={
+        "message": "🔄 Actualización incremental iniciada en segundo plano" if incremental else "🔄 Reentrenamiento iniciado en segundo plano",
+        "job": job,
+        "status_url": f"/train_model/jobs/{job['job_id']}",
+        "timestamp": datetime.now().isoformat()
+    })
+
+@app.get("/train_model/jobs")
+async def list_training_jobs():
+    """Listar los últimos trabajos de entrenamiento"""
+    return {
+        "active_job": training_jobs.active_job,
+        "jobs": list(reversed(list(training_jobs.jobs.values())))
+    }
+
+@app.get("/train_model/jobs/{job_id}")
+async def get_training_job(job_id: str):
+    """Estado de un trabajo de entrenamiento (en_cola, entrenando, activando, completado, error)"""
+    job = training_jobs.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Trabajo no encontrado: {job_id}")
+    return job
 
 @app.get("/model_info")
 async def get_model_info():
@@ -835,6 +3244,15 @@ async def get_model_info():
     return {
         "model_type": "RandomForestClassifier",
         "is_trained": fraud_detector.is_trained,
+        "model_version": fraud_detector.model_version,
+        "worker_pid": os.getpid(),
+        "training_snapshot": fraud_detector.training_snapshot.info(),
+        "account_features": {
+            "en_uso": fraud_detector.uses_account_features,
+            **(fraud_detector.account_features.info() if fraud_detector.account_features is not None else {})
+        },
+        "merchant_risk": fraud_detector.db_manager.merchant_risk.info(),
+        "reglas": fraud_detector.db_manager.fraud_rules.info(),
         "feature_count": len(fraud_detector.feature_names),
         "feature_names": fraud_detector.feature_names,
         "thresholds": {
@@ -843,80 +3261,124 @@ async def get_model_info():
         }
     }
 
+@app.get("/metrics/batching")
+async def get_batching_metrics():
+    """
+    📦 Métricas del micro-batching de predicciones individuales
+    
+    Histogramas de tamaño de lote y espera en cola (ms) para ajustar
+    FRAUDE_BATCH_WINDOW_MS y FRAUDE_BATCH_MAX_SIZE.
+    """
+    return micro_batcher.stats()
+
+@app.get("/metrics/pools")
+async def get_pool_metrics():
+    """
+    🧵 Ocupación de los pools de trabajo bloqueante
+    
+    `rejected` cuenta las peticiones respondidas con 503 por falta de cupo.
+    """
+    return {"light": light_pool.stats(), "heavy": heavy_pool.stats()}
+
+@app.get("/metrics/realtime")
+async def get_realtime_metrics():
+    """
+    📡 Estado del consumidor de puntuación en tiempo real
+    
+    `lag_seconds` es la antigüedad de la transacción más vieja del último lote al
+    leerla y `detection_seconds` el histograma de inserción → alerta por lote.
+    Sólo el worker líder (`leader`) consume; en los demás los contadores quedan en 0.
+    """
+    return {"enabled": config.REALTIME_SCORING, **realtime_scorer.stats()}
+
+@app.get("/metrics/profiles")
+async def get_profile_cache_metrics():
+    """
+    👤 Aciertos y fallos de la caché de perfiles de usuario
+    
+    Cada worker tiene su propia caché; ajustar con FRAUDE_PROFILE_CACHE_SIZE y
+    FRAUDE_PROFILE_CACHE_TTL_SECONDS.
+    """
+    return fraud_detector.db_manager.profile_cache.stats()
+
+@app.get("/metrics/reports")
+async def get_report_cache_metrics():
+    """
+    📄 Uso de la caché de reportes TOON
+    
+    `hits` son peticiones servidas desde memoria; `builds` cuenta las
+    generaciones (primera petición de un `limit` y refrescos por datos nuevos).
+    """
+    return toon_reports.stats()
+
 @app.get("/fraud_report_toon")
-async def get_fraud_report_toon(limit: int = 100):
+async def get_fraud_report_toon(request: Request, limit: int = 100):
     """
     📊 Obtener reporte de fraudes en formato TOON (token-efficient)
     
     Útil para enviar a LLMs para análisis o generación de reportes.
     Ahorra significativamente tokens comparado con JSON.
     
+    El reporte se sirve desde memoria y se regenera en segundo plano cuando
+    llegan o se puntúan transacciones. Responde con ETag: con If-None-Match
+    igual al último recibido, 304 sin cuerpo.
+    
     Args:
         limit: Número máximo de transacciones fraudulentas a incluir
     """
+    if limit <= 0:
+        raise HTTPException(status_code=400, detail="limit debe ser mayor que 0")
+    
     try:
-        logger.info(f"📊 Generando reporte TOON de fraudes (limit={limit})...")
-        
-        # Obtener transacciones fraudulentas de la base de datos
-        result = fraud_detector.predict_database(limit=limit)
-        
-        if not result['transacciones_fraudulentas']:
-            return {
-                "toon_report": "fraud_transactions[0]: (no fraud detected)",
-                "statistics": result,
-                "format": "TOON"
-            }
-        
-        # Convertir a TOON
-        fraud_transactions = result['transacciones_fraudulentas']
-        
-        # Preparar datos para TOON
-        toon_data = {
-            "fraud_transactions": fraud_transactions
-        }
-        
-        # Generar TOON
-        toon_report = encode(toon_data, delimiter=",", length_marker=True)
-        
-        # Calcular ahorro vs JSON
-        json_report = json.dumps(toon_data, indent=2)
-        savings = estimate_token_savings(json_report, toon_report)
-        
-        logger.info(f"💾 Reporte TOON generado: {savings['tokens_saved']} tokens ahorrados ({savings['savings_percent']}%)")
-        
-        return {
-            "toon_report": toon_report,
-            "statistics": {
-                "total_analyzed": result['total_transacciones_analizadas'],
-                "fraud_detected": result['transacciones_fraudulentas_encontradas'],
-                "fraud_rate": f"{result['tasa_fraude_detectado']:.2%}",
-                "processing_time": result['tiempo_procesamiento']
-            },
-            "token_savings": {
-                "json_tokens": savings['json_tokens_approx'],
-                "toon_tokens": savings['toon_tokens_approx'],
-                "tokens_saved": savings['tokens_saved'],
-                "savings_percent": f"{savings['savings_percent']}%",
-                "compression_ratio": f"{savings['compression_ratio']}x"
-            },
-            "format": "TOON",
-            "usage_note": "Send this TOON report directly to LLMs. Format: fraud_transactions[N]{field1,field2,...}: ..."
-        }
-        
+        report = await toon_reports.get(limit)
+    except PoolSaturatedError:
+        raise
     except Exception as e:
         logger.error(f"❌ Error generando reporte TOON: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno: {str(e)}")
+    
+    headers = {"ETag": report.etag, "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get('if-none-match'), report.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=report.body, media_type="application/json", headers=headers)
 
 # =====================================================
 # EJECUCIÓN PRINCIPAL
 # =====================================================
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="API de detección de fraude")
+    parser.add_argument('--train', action='store_true',
+                        help="Entrenar y publicar una versión nueva sin levantar el servidor (los workers la recargan solos)")
+    parser.add_argument('--rebuild-snapshot', action='store_true', help="Reconstruir el snapshot de entrenamiento (con --train)")
+    parser.add_argument('--workers', type=int, default=config.WORKERS, help="Procesos de uvicorn (FRAUDE_WORKERS)")
+    parser.add_argument('--reload', action='store_true', default=config.RELOAD, help="Recarga automática, sólo desarrollo (FRAUDE_RELOAD)")
+    args = parser.parse_args()
+    
+    if args.train:
+        # Proceso dedicado al entrenamiento: los workers sólo cargan la versión publicada
+        lock = fraud_detector.training_lock()
+        if not lock.acquire(blocking=False):
+            logger.error("❌ Otro proceso está entrenando un modelo")
+            sys.exit(1)
+        try:
+            results = fraud_detector.train_model(force_retrain=True, rebuild_snapshot=args.rebuild_snapshot)
+            logger.info(f"✅ Versión {results['model_version']} publicada - AUC: {results['auc_score']:.3f}")
+        finally:
+            lock.release()
+        sys.exit(0)
+    
+    if args.reload and args.workers > 1:
+        logger.warning("⚠️ La recarga automática usa un solo proceso; se ignora --workers")
+    
     # Ejecutar servidor
     uvicorn.run(
         "app:app",
         host="0.0.0.0",
         port=8001,  # Puerto definido en .env para FRAUDE_API_PORT
-        reload=True,
+        reload=args.reload,
+        workers=1 if args.reload else args.workers,
         log_level="info"
     )
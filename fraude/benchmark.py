@@ -0,0 +1,1002 @@
+"""
+⏱️ BENCHMARKS DEL SERVICIO DE DETECCIÓN DE FRAUDE
+================================================
+Mediciones reproducibles de los caminos críticos de app.py sobre datos sintéticos
+con la misma forma que `transacciones ⋈ comerciantes`. No requiere base de datos,
+salvo `extraction`, que usa la configuración DB_* del servicio.
+
+Uso:
+    python benchmark.py time_features --rows 1000000
+    python benchmark.py extraction --repeat 1
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import threading
+import time as timer
+from datetime import time, date, timedelta
+from typing import Callable, Dict, List
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from sklearn.ensemble import RandomForestClassifier
+
+from fastapi.encoders import jsonable_encoder
+
+from app import (
+    Config, DatabaseAnalysisResponse, DatabaseManager, FeatureEngineer, FraudDetector, SingleRowFeatureBuilder,
+    CATEGORICAL_COLUMNS, UNSEEN_CATEGORY_CODE, transaction_timestamps
+)
+from account_features import FEATURE_NAMES as ACCOUNT_FEATURE_NAMES
+from account_features import VARIANCE_RELATIVE_TOLERANCE, AccountFeatureStore, value_bit, value_bits
+from compiled_forest import CompiledForest
+from merchant_risk import MerchantRiskTable
+from micro_batcher import MicroBatcher
+import result_serializer
+from risk_ranking import decode_cursor, top_risk_positions
+from realtime_scoring import RealtimeScorer
+from worker_pools import WorkerPool
+
+# =====================================================
+# DATOS SINTÉTICOS
+# =====================================================
+
+def make_merchants(count: int = 29, seed: int = 5) -> pd.DataFrame:
+    """Filas de `comerciantes` para los códigos COM001.. que usan las transacciones sintéticas"""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'codigo_comerciante': [f'COM{i:03d}' for i in range(1, count + 1)],
+        'nivel_riesgo': rng.choice(['bajo', 'medio', 'alto', 'crítico'], count),
+        'categoria': rng.choice(['Retail', 'Financiero', 'E-commerce', 'Casinos'], count),
+        'tasa_fraude': np.round(rng.random(count) * 0.1, 4),
+    })
+
+def make_merchant_table() -> MerchantRiskTable:
+    table = MerchantRiskTable()
+    table.load(make_merchants())
+    return table
+
+def make_rules() -> pd.DataFrame:
+    """Filas activas de `reglas_fraude` como las que cargan los scripts de inicialización"""
+    rules = [
+        ('Regla Básica 1', 'Detección básica de montos altos', {"monto_minimo": 10000}, 0.50),
+        ('Regla Básica 2', 'Detección básica de horario nocturno', {"horario_riesgo": "nocturno"}, 0.40),
+        ('Monto Extremadamente Alto', 'Transacción superior a $500,000', {"monto_minimo": 500000}, 0.90),
+        ('Monto Muy Alto', 'Transacción superior a $75,000', {"monto_minimo": 75000}, 0.75),
+        ('Monto Alto Sospechoso', 'Transacción superior a $45,000', {"monto_minimo": 45000}, 0.60),
+        ('Horario Muy Inusual', 'Transacciones entre 01:00 y 04:00', {"horario_inicio": "01:00", "horario_fin": "04:00"}, 0.40),
+        ('Comerciante Riesgo Alto', 'Comerciantes con nivel de riesgo alto',
+         {"comerciantes_riesgo": ["COM019", "COM020", "COM021", "COM022", "COM023", "COM024", "COM025"]}, 0.50),
+        ('País de Alto Riesgo', 'Transacciones desde países sancionados', {"paises_riesgo": ["Nigeria", "Rusia", "Malta"]}, 0.65),
+        ('Distancia Extrema', 'Ubicación muy distante de lo habitual', {"distancia_minima": 1000}, 0.45),
+        ('Comerciante Desconocido', 'Comerciantes no registrados previamente', {"comerciante_nuevo": True}, 0.35),
+    ]
+    return pd.DataFrame(
+        [(i, name, description, condition, weight) for i, (name, description, condition, weight) in enumerate(rules, 1)],
+        columns=['id', 'nombre', 'descripcion', 'condicion', 'peso']
+    )
+
+def make_transactions(rows: int, seed: int = 42, time_as_text: bool = False) -> pd.DataFrame:
+    """Generar un DataFrame con las columnas que devuelve get_all_transactions"""
+    rng = np.random.default_rng(seed)
+    seconds = rng.integers(0, 86400, rows)
+
+    if time_as_text:
+        horarios = [f"{s // 3600:02d}:{(s // 60) % 60:02d}:{s % 60:02d}" for s in seconds]
+    else:
+        horarios = [time(s // 3600, (s // 60) % 60, s % 60) for s in seconds]
+
+    base_date = date(2024, 1, 1)
+    df = pd.DataFrame({
+        'id': np.arange(1, rows + 1),
+        'cuenta_origen_id': rng.integers(1, 500, rows),
+        'cuenta_destino_id': rng.integers(1, 500, rows),
+        'monto': np.round(rng.lognormal(8, 1.5, rows), 2),
+        'comerciante': rng.choice([f'COM{i:03d}' for i in range(1, 30)], rows),
+        'categoria_comerciante': rng.choice(['Retail', 'Financiero', 'E-commerce', 'Casinos', 'Varios'], rows),
+        'ubicacion': rng.choice(['Online', 'Centro, CABA', 'Desconocida', 'Norte, CABA'], rows),
+        'ciudad': rng.choice(['Buenos Aires', 'Córdoba', 'Lagos', 'Moscú'], rows),
+        'pais': rng.choice(['Argentina', 'Nigeria', 'Rusia', 'USA'], rows),
+        'tipo_tarjeta': rng.choice(['Débito', 'Crédito', 'Prepaga'], rows),
+        'horario_transaccion': horarios,
+        'fecha_transaccion': [base_date + timedelta(days=int(d)) for d in rng.integers(0, 365, rows)],
+        'es_fraude': rng.random(rows) < 0.08,
+        'canal': rng.choice(['online', 'pos', 'atm', 'telefono', 'mobile'], rows),
+        'monto_cuenta_origen': np.where(rng.random(rows) < 0.1, np.nan, np.round(rng.lognormal(10, 1, rows), 2)),
+        'distancia_ubicacion_usual': np.round(rng.exponential(50, rows), 2),
+    })
+    return make_merchant_table().attach(df)
+
+def make_trained_detector(rows: int = 20_000, seed: int = 7) -> FraudDetector:
+    """Detector con un Random Forest igual al de producción ajustado sobre datos sintéticos"""
+    config = Config()
+    detector = FraudDetector(config)
+    detector.db_manager.merchant_risk.load(make_merchants())
+    detector.db_manager.fraud_rules.load(make_rules())
+    df = make_transactions(rows, seed=seed)
+    if detector.account_features is not None:
+        df = detector.add_account_features(df, AccountFeatureStore())
+    X, detector.feature_names = detector.feature_engineer.prepare_features(df, fit=True)
+    detector.model = RandomForestClassifier(
+        n_estimators=100, max_depth=10, min_samples_split=5, min_samples_leaf=2,
+        random_state=config.RANDOM_STATE, class_weight='balanced', n_jobs=-1
+    ).fit(X, df['es_fraude'])
+    detector.model_type = type(detector.model).__name__
+    detector._compile_forest(X[:256])
+    detector.model_version = 'benchmark'
+    detector._refresh_single_row_builder()
+    detector.is_trained = True
+    return detector
+
+# =====================================================
+# IMPLEMENTACIONES DE REFERENCIA (ANTES)
+# =====================================================
+
+def legacy_time_features(df: pd.DataFrame) -> pd.DataFrame:
+    """create_time_features original: parseo fila a fila con .apply"""
+    df = df.copy()
+
+    def parse_time(time_str):
+        if pd.isna(time_str):
+            return time(14, 30)
+        if isinstance(time_str, time):
+            return time_str
+        try:
+            time_str = str(time_str).strip()
+            if '.' in time_str:
+                time_str = time_str.split('.')[0]
+            parts = time_str.split(':')
+            hour = int(parts[0]) if len(parts) > 0 else 14
+            minute = int(parts[1]) if len(parts) > 1 else 30
+            second = int(parts[2]) if len(parts) > 2 else 0
+            return time(hour, minute, second)
+        except:
+            return time(14, 30)
+
+    df['horario_parsed'] = df['horario_transaccion'].apply(parse_time)
+    df['hour'] = df['horario_parsed'].apply(lambda x: x.hour)
+    df['minute'] = df['horario_parsed'].apply(lambda x: x.minute)
+    df['is_weekend'] = pd.to_datetime(df['fecha_transaccion']).dt.dayofweek >= 5
+    df['is_night'] = (df['hour'] >= 22) | (df['hour'] <= 6)
+    df['is_business_hours'] = (df['hour'] >= 9) & (df['hour'] <= 18)
+    df['hour_sin'] = np.sin(2 * np.pi * df['hour'] / 24)
+    df['hour_cos'] = np.cos(2 * np.pi * df['hour'] / 24)
+    return df
+
+def legacy_encode_categorical(engineer: FeatureEngineer, df: pd.DataFrame) -> pd.DataFrame:
+    """encode_categorical_features original: LabelEncoder.transform por valor"""
+    df = df.copy()
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].fillna('unknown')
+            encoder = engineer.label_encoders[col]
+
+            def safe_transform(value):
+                try:
+                    return encoder.transform([str(value)])[0]
+                except ValueError:
+                    return 0
+
+            df[f'{col}_encoded'] = df[col].astype(str).apply(safe_transform)
+    return df
+
+def legacy_serialize_flagged(fraudulent_df: pd.DataFrame) -> List[Dict]:
+    """_serialize_flagged original: iterrows y un diccionario armado a mano por fila"""
+    results = []
+    for _, row in fraudulent_df.iterrows():
+        results.append({
+            'id': int(row['id']),
+            'cuenta_origen_id': int(row['cuenta_origen_id']) if pd.notna(row['cuenta_origen_id']) else None,
+            'cuenta_destino_id': int(row['cuenta_destino_id']) if pd.notna(row['cuenta_destino_id']) else None,
+            'monto': float(row['monto']),
+            'comerciante': str(row['comerciante']),
+            'ubicacion': str(row['ubicacion']),
+            'tipo_tarjeta': str(row['tipo_tarjeta']),
+            'fecha_transaccion': str(row['fecha_transaccion']),
+            'horario_transaccion': str(row['horario_transaccion']),
+            'probabilidad_fraude': float(row['probabilidad_fraude']),
+            'nivel_riesgo': str(row['nivel_riesgo']),
+            'prediccion': str(row['prediccion']),
+            'es_fraude_real': bool(row['es_fraude'])
+        })
+    return results
+
+# =====================================================
+# UTILIDADES DE MEDICIÓN
+# =====================================================
+
+def measure(fn: Callable, repeat: int) -> float:
+    """Mejor tiempo (segundos) de `repeat` ejecuciones"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = timer.perf_counter()
+        fn()
+        best = min(best, timer.perf_counter() - start)
+    return best
+
+def measure_cpu(fn: Callable, repeat: int) -> float:
+    """Menor tiempo de CPU del proceso (segundos) de `repeat` ejecuciones"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = timer.process_time()
+        fn()
+        best = min(best, timer.process_time() - start)
+    return best
+
+def report(title: str, before: float, after: float):
+    """Imprimir una comparación antes/después"""
+    print(f"{title:<40} antes: {before:8.3f}s  después: {after:8.3f}s  speedup: {before / after:6.1f}x")
+
+# =====================================================
+# BENCHMARKS
+# =====================================================
+
+def bench_time_features(args):
+    """create_time_features: .apply por fila vs extracción vectorizada"""
+    engineer = FeatureEngineer()
+
+    for time_as_text in (False, True):
+        df = make_transactions(args.rows, time_as_text=time_as_text)
+        label = "texto 'HH:MM:SS'" if time_as_text else "datetime.time (psycopg2)"
+
+        expected = legacy_time_features(df)
+        actual = engineer.create_time_features(df)
+        for col in ['hour', 'minute', 'is_night', 'is_business_hours', 'hour_sin', 'hour_cos']:
+            assert np.array_equal(expected[col].to_numpy(), actual[col].to_numpy()), f"Diferencia en {col}"
+
+        before = measure(lambda: legacy_time_features(df), args.repeat)
+        after = measure(lambda: engineer.create_time_features(df), args.repeat)
+        report(f"time_features [{args.rows:,} filas, {label}]", before, after)
+
+def bench_categorical(args):
+    """encode_categorical_features: LabelEncoder.transform por fila vs tablas hash"""
+    engineer = FeatureEngineer()
+    engineer.encode_categorical_features(make_transactions(10_000, seed=7), fit=True)
+
+    df = make_transactions(args.rows)
+    # 1% de valores no vistos para ejercitar el código reservado
+    unseen = np.random.default_rng(1).random(len(df)) < 0.01
+    df.loc[unseen, 'pais'] = 'Atlántida'
+
+    expected = legacy_encode_categorical(engineer, df)
+    actual = engineer.encode_categorical_features(df)
+    for col in CATEGORICAL_COLUMNS:
+        legacy_codes = expected[f'{col}_encoded'].to_numpy()
+        codes = actual[f'{col}_encoded'].to_numpy()
+        seen = codes != UNSEEN_CATEGORY_CODE
+        assert np.array_equal(legacy_codes[seen], codes[seen]), f"Diferencia en {col}"
+        assert (legacy_codes[~seen] == 0).all(), f"Valores no vistos inesperados en {col}"
+
+    before = measure(lambda: legacy_encode_categorical(engineer, df), args.repeat)
+    after = measure(lambda: engineer.encode_categorical_features(df), args.repeat)
+    report(f"categorical [{args.rows:,} filas]", before, after)
+
+def make_api_transactions(count: int, seed: int = 3) -> List[Dict]:
+    """Transacciones con la forma de TransactionInput, incluyendo casos borde"""
+    rng = np.random.default_rng(seed)
+    records = []
+    for i in range(count):
+        records.append({
+            'monto': float(np.round(rng.lognormal(8, 1.5), 2)),
+            'comerciante': f'COM{rng.integers(1, 40):03d}',
+            'ubicacion': str(rng.choice(['Online', 'Centro, CABA', 'Desconocida', 'Rosario'])),
+            'tipo_tarjeta': str(rng.choice(['Débito', 'Crédito', 'Prepaga', 'Virtual'])),
+            'horario_transaccion': f"{rng.integers(0, 24):02d}:{rng.integers(0, 60):02d}:{rng.integers(0, 60):02d}",
+            'cuenta_origen_id': int(rng.integers(1, 500)),
+            'categoria_comerciante': str(rng.choice(['Retail', 'Financiero', 'Casinos', 'Criptomonedas'])),
+            'ciudad': str(rng.choice(['Buenos Aires', 'Córdoba', 'Lagos', 'Springfield'])),
+            'pais': str(rng.choice(['Argentina', 'Nigeria', 'Malta', 'Uruguay'])),
+            'canal': str(rng.choice(['online', 'pos', 'atm', 'kiosco'])),
+        })
+
+    # Casos borde: horarios inválidos, opcionales nulos y montos extremos
+    edge_cases = [
+        {'horario_transaccion': '25:00:00'}, {'horario_transaccion': '7:5'}, {'horario_transaccion': 'tarde'},
+        {'horario_transaccion': '23:59:59.999'}, {'ciudad': None, 'pais': None, 'canal': None},
+        {'categoria_comerciante': None}, {'monto': 0.01}, {'monto': 5_000_000.0},
+    ]
+    for i, overrides in enumerate(edge_cases):
+        records[i % count].update(overrides)
+    return records
+
+def bench_single_row(args):
+    """Predicción individual: DataFrame + prepare_features vs SingleRowFeatureBuilder (con paridad)"""
+    detector = FraudDetector.__new__(FraudDetector)
+    detector.db_manager = DatabaseManager(Config())
+    detector.db_manager.merchant_risk.load(make_merchants())
+    detector.feature_engineer = FeatureEngineer()
+    _, detector.feature_names = detector.feature_engineer.prepare_features(make_transactions(20_000, seed=7), fit=True)
+    builder = SingleRowFeatureBuilder(detector.feature_engineer, detector.feature_names)
+
+    records = [detector._with_single_defaults(r) for r in make_api_transactions(max(args.rows, 16))]
+
+    # Paridad exacta (en float32, el dtype que usa el bosque) contra prepare_features
+    for record in records:
+        expected, names = detector.feature_engineer.prepare_features(pd.DataFrame([record]), fit=False)
+        assert names == detector.feature_names, "Orden de características distinto"
+        actual = builder.build(record)
+        assert np.array_equal(expected.astype(np.float32), actual), f"Diferencia para {record}"
+    print(f"paridad OK en {len(records)} transacciones")
+
+    sample = records[:min(len(records), 1000)]
+    before = measure(lambda: [detector.feature_engineer.prepare_features(pd.DataFrame([r])) for r in sample], args.repeat)
+    after = measure(lambda: [builder.build(r) for r in sample], args.repeat)
+    print(f"por transacción  antes: {before / len(sample) * 1e6:8.1f}µs  después: {after / len(sample) * 1e6:8.1f}µs  "
+          f"speedup: {before / after:6.1f}x")
+
+def _extraction_worker(method: str, results):
+    """Ejecutar una vía de extracción en un proceso limpio y reportar tiempo, RSS y características"""
+    try:
+        db_manager = DatabaseManager(Config())
+        baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        start = timer.perf_counter()
+        df = getattr(db_manager, method)()
+        elapsed = timer.perf_counter() - start
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        # Mismo orden en ambas vías (el ORDER BY por fecha/horario tiene empates)
+        features, _ = FeatureEngineer().prepare_features(df.sort_values('id', kind='stable'), fit=True)
+        results.put((method, elapsed, (peak_kb - baseline_kb) / 1024, df.memory_usage(deep=True).sum() / 2**20, features))
+    except Exception as e:
+        results.put(e)
+
+def bench_extraction(args):
+    """Datos de entrenamiento: pd.read_sql vs COPY ... TO STDOUT (requiere base de datos)"""
+    context = multiprocessing.get_context('spawn')
+    measurements = {}
+
+    # Un proceso por ejecución: el pico de RSS de una vía no contamina a la otra
+    for method in ('get_all_transactions', 'get_training_transactions'):
+        for _ in range(args.repeat):
+            results = context.Queue()
+            worker = context.Process(target=_extraction_worker, args=(method, results))
+            worker.start()
+            outcome = results.get()
+            worker.join()
+            if isinstance(outcome, Exception):
+                raise SystemExit(f"❌ {method}: {outcome}")
+            if method not in measurements or outcome[1] < measurements[method][1]:
+                measurements[method] = outcome
+
+    # Paridad: mismas características salvo el redondeo float32 de las columnas reducidas
+    before, after = measurements['get_all_transactions'], measurements['get_training_transactions']
+    assert before[4].shape == after[4].shape, "Forma de características distinta"
+    assert np.allclose(before[4], after[4], atol=1e-5), "Características distintas entre vías"
+    print(f"paridad OK en {before[4].shape[0]:,} transacciones")
+
+    for method, elapsed, peak_mb, frame_mb, _ in (before, after):
+        print(f"{method:<24} tiempo: {elapsed:8.3f}s  pico RSS: +{peak_mb:8.1f} MB  DataFrame: {frame_mb:8.1f} MB")
+    print(f"speedup: {before[1] / after[1]:6.1f}x")
+
+async def _single_latencies(detector: FraudDetector, batcher: MicroBatcher, records: List[Dict],
+                             heavy: Callable, interval: float = 0.005) -> np.ndarray:
+    """
+    Latencias (ms) de predicciones individuales que llegan cada `interval` segundos
+    mientras corre `heavy`. Se miden desde la hora de llegada programada, así que
+    el tiempo que el event loop pasa bloqueado cuenta como espera del cliente.
+    """
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    async def single(i: int, record: Dict) -> float:
+        arrival = start + i * interval
+        await asyncio.sleep(max(arrival - loop.time(), 0))
+        await batcher.submit(detector.score, detector.prepare_single(record))
+        return (loop.time() - arrival) * 1000
+
+    heavy_task = asyncio.create_task(heavy())
+    latencies = await asyncio.gather(*(single(i, record) for i, record in enumerate(records)))
+    await heavy_task
+    return np.array(latencies)
+
+def bench_concurrency(args):
+    """Latencia individual mientras corre un análisis masivo: en el event loop vs pools separados"""
+    detector = make_trained_detector()
+    records = [detector._with_single_defaults(r) for r in make_api_transactions(300)]
+    scan = make_transactions(args.rows, seed=11)
+
+    async def scenario(name: str, use_pools: bool, with_scan: bool):
+        light = WorkerPool("light", 4, 256, retry_after=1)
+        heavy = WorkerPool("heavy", 2, 2, retry_after=30)
+        batcher = MicroBatcher(2, 64, executor=light.executor if use_pools else None)
+        await batcher.start()
+
+        async def heavy_work():
+            if not with_scan:
+                return
+            if use_pools:
+                await heavy.run(detector._score_frame, scan)
+            else:
+                detector._score_frame(scan)  # Antes: el endpoint bloqueaba el event loop
+
+        latencies = await _single_latencies(detector, batcher, records, heavy_work)
+        await batcher.stop()
+        light.shutdown()
+        heavy.shutdown()
+        print(f"{name:<32} p50: {np.percentile(latencies, 50):8.2f}ms  p99: {np.percentile(latencies, 99):8.2f}ms  "
+              f"máx: {latencies.max():8.2f}ms")
+
+    async def run_all():
+        await scenario("sin análisis masivo", True, False)
+        await scenario(f"análisis {args.rows:,} filas en el loop", False, True)
+        await scenario(f"análisis {args.rows:,} filas en pool", True, True)
+
+    asyncio.run(run_all())
+
+def bench_forest_latency(args):
+    """predict_proba de sklearn vs bosque compilado en arreglos planos, por tamaño de lote"""
+    detector = make_trained_detector()
+    forest = CompiledForest.from_sklearn(detector.model)
+    X = detector.prepare_frame(make_transactions(10_000, seed=13))
+    print(f"{forest.n_trees} árboles, {forest.n_nodes:,} nodos, profundidad {forest.max_depth}")
+
+    for batch_size in (1, 16, 256, 10_000):
+        batch = X[:batch_size]
+        difference = forest.max_abs_difference(detector.model, batch)
+        assert difference <= 1e-6, f"Diferencia {difference:.2e} con {batch_size} filas"
+
+        before = measure(lambda: detector.model.predict_proba(batch), args.repeat)
+        after = measure(lambda: forest.predict_proba(batch), args.repeat)
+        print(f"lote {batch_size:>6,}  sklearn: {before * 1e3:9.3f}ms  compilado: {after * 1e3:9.3f}ms  "
+              f"speedup: {before / after:6.1f}x  diferencia máx: {difference:.1e}")
+
+def bench_explain(args):
+    """Contribuciones por característica vs predicción con el bosque compilado, por tamaño de lote"""
+    detector = make_trained_detector()
+    forest = detector.compiled_forest
+    X = detector.prepare_frame(make_transactions(10_000, seed=13))
+
+    for batch_size in (1, 16, 256, 10_000):
+        batch = X[:batch_size]
+        contributions = forest.contributions(batch)
+        difference = float(np.max(np.abs(forest.bias + contributions.sum(axis=1) - forest.predict_proba(batch))))
+        assert difference <= 1e-9, f"base + Σ contribuciones difiere {difference:.2e} con {batch_size} filas"
+
+        predict = measure(lambda: forest.predict_proba(batch), args.repeat)
+        explain = measure(lambda: forest.contributions(batch), args.repeat)
+        print(f"lote {batch_size:>6,}  predicción: {predict * 1e3:9.3f}ms  contribuciones: {explain * 1e3:9.3f}ms  "
+              f"relación: {explain / predict:5.2f}x  diferencia máx: {difference:.1e}")
+
+    budget = detector.config.EXPLAIN_BUDGET_MS / 1000
+    elapsed = measure(lambda: detector.explain(X, budget), args.repeat)
+    explained = sum(row is not None for row in detector.explain(X, budget))
+    print(f"explain con presupuesto de {budget * 1e3:.0f}ms: {explained:,} de {len(X):,} filas en {elapsed * 1e3:.1f}ms")
+
+def bench_incremental(args):
+    """Reentrenamiento completo vs actualización incremental con el ~2% de transacciones nuevas"""
+    import shutil
+    import tempfile
+
+    history = min(args.rows, 500_000)
+    new = max(history // 50, 2_000)
+    df = make_transactions(history + new, seed=17)
+    # Ids en orden de tiempo, como los asigna la base: las nuevas son las más recientes
+    df = df.iloc[np.argsort(transaction_timestamps(df), kind='stable')].reset_index(drop=True)
+    df['id'] = np.arange(1, len(df) + 1)
+    # Etiqueta con señal (make_transactions la sortea al azar): montos altos, más en la parte nueva
+    rng = np.random.default_rng(17)
+    drift = np.where(df['id'] > history, 0.85, 0.7)
+    df['es_fraude'] = (df['monto'] > df['monto'].quantile(0.9)) & (rng.random(len(df)) < drift) | (rng.random(len(df)) < 0.02)
+
+    config = Config()
+    config.MODEL_PATH = tempfile.mkdtemp(prefix="fraude-incremental-") + '/'
+    config.TRAINING_SNAPSHOT = False
+    try:
+        detector = FraudDetector(config)
+        detector.db_manager.merchant_risk.load(make_merchants())
+        detector.db_manager.get_training_transactions = lambda: df[df['id'] <= history].copy()
+        start = timer.perf_counter()
+        detector.train_model(force_retrain=True)
+        base_time = timer.perf_counter() - start
+
+        # Completo: todo desde cero con la historia más lo nuevo
+        detector.db_manager.get_training_transactions = lambda: df.copy()
+        full = FraudDetector(config, db_manager=detector.db_manager)
+        start = timer.perf_counter()
+        full.train_model(force_retrain=True, publish=False)
+        full_time = timer.perf_counter() - start
+
+        # La actualización lee sólo lo nuevo y la ventana de historia por cuenta que lo precede
+        detector.db_manager.copy_transactions = lambda since_id=None: df[df['id'] > (since_id or 0)].reset_index(drop=True)
+        detector.db_manager.get_account_activity = lambda since_date, until_id: df[
+            (pd.to_datetime(df['fecha_transaccion']).dt.date >= since_date).to_numpy() & (df['id'] <= until_id).to_numpy()
+        ]
+        start = timer.perf_counter()
+        results = detector.update_model(publish=False)
+        update_time = timer.perf_counter() - start
+        loaded = len(detector.load_update_data(history))
+    finally:
+        shutil.rmtree(config.MODEL_PATH, ignore_errors=True)
+
+    print(f"historia: {history:,} filas  nuevas: {new:,} filas  (entrenamiento base {base_time:.1f}s)  "
+          f"leídas por la actualización: {loaded:,}")
+    report("reentrenamiento completo vs incremental", full_time, update_time)
+    print(f"incremental: +{results['trees_added']}/-{results['trees_dropped']} árboles ({results['drop_policy']}), "
+          f"AUC en validación {results['base_auc']:.3f} → {results['candidate_auc']:.3f}, promovida: {results['promoted']}")
+
+def _memory_kb() -> Dict[str, int]:
+    """RSS y PSS del proceso (PSS reparte las páginas compartidas entre los procesos que las usan)"""
+    values = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            key, _, rest = line.partition(':')
+            if key in ('Rss', 'Pss'):
+                values[key.lower()] = int(rest.split()[0])
+    return values
+
+def _model_load_worker(model_path: str, compiled_forest: bool, barrier, results):
+    """Cargar el modelo como lo hace el servicio al arrancar y medir tiempo y memoria"""
+    config = Config()
+    config.MODEL_PATH = model_path
+    config.COMPILED_FOREST = compiled_forest
+    detector = FraudDetector(config)
+    before = _memory_kb()
+
+    start = timer.perf_counter()
+    detector.load_model()
+    elapsed = timer.perf_counter() - start
+    detector.score(np.zeros((1, len(detector.feature_names))))  # Tocar las páginas que usa una predicción
+
+    # Medir con todos los workers vivos para que PSS refleje lo compartido
+    barrier.wait()
+    after = _memory_kb()
+    barrier.wait()
+
+    # Después de un bloque del tamaño de un análisis de la base (el RSS incluye el bloque y su resultado)
+    detector.score(np.random.default_rng(0).normal(size=(10_000, len(detector.feature_names))))
+    barrier.wait()
+    scanned = _memory_kb()
+    results.put((elapsed, (after['rss'] - before['rss']) / 1024, (after['pss'] - before['pss']) / 1024,
+                 (scanned['rss'] - before['rss']) / 1024, (scanned['pss'] - before['pss']) / 1024))
+    barrier.wait()
+
+def bench_model_load(args):
+    """Arranque de N workers: cuatro pickles separados vs bundle único con mmap"""
+    import shutil
+    import tempfile
+
+    detector = make_trained_detector(min(args.rows, 200_000))
+    workdir = tempfile.mkdtemp(prefix="fraude-bundle-")
+    legacy_path, bundle_path = os.path.join(workdir, 'legacy') + '/', os.path.join(workdir, 'bundle') + '/'
+
+    # Formato anterior: cuatro pickles sueltos en MODEL_PATH, sin bosque compilado
+    os.makedirs(legacy_path)
+    joblib.dump(detector.model, os.path.join(legacy_path, Config.FRAUD_MODEL_FILE))
+    joblib.dump(detector.feature_engineer.label_encoders, os.path.join(legacy_path, Config.ENCODERS_FILE))
+    joblib.dump(detector.feature_engineer.scaler, os.path.join(legacy_path, Config.SCALER_FILE))
+    joblib.dump(detector.feature_names, os.path.join(legacy_path, Config.FEATURES_FILE))
+
+    detector.config.MODEL_PATH = bundle_path
+    detector.save_model()
+    detector.publish_version()
+
+    context = multiprocessing.get_context('spawn')
+    try:
+        for label, path, compiled in (("pickles separados", legacy_path, False), ("bundle + mmap", bundle_path, True)):
+            barrier, results = context.Barrier(args.workers), context.Queue()
+            workers = [context.Process(target=_model_load_worker, args=(path, compiled, barrier, results))
+                       for _ in range(args.workers)]
+            for worker in workers:
+                worker.start()
+            measurements = np.array([results.get() for _ in workers])
+            for worker in workers:
+                worker.join()
+
+            elapsed, rss, pss, scan_rss, scan_pss = measurements.mean(axis=0)
+            print(f"{label:<18} [{args.workers} workers]  carga: {elapsed * 1e3:8.1f}ms  "
+                  f"RSS/worker: +{rss:6.1f} MB  PSS/worker: +{pss:6.1f} MB  "
+                  f"tras lote de 10.000 filas: RSS +{scan_rss:6.1f} MB  PSS +{scan_pss:6.1f} MB")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def _serving_worker(model_path: str, duration: float, barrier, results):
+    """Un worker de la API: carga el modelo publicado y atiende predicciones individuales"""
+    config = Config()
+    config.MODEL_PATH = model_path
+    detector = FraudDetector(config)
+    detector.load_model()
+    records = make_api_transactions(256)
+
+    barrier.wait()
+    completed, deadline = 0, timer.perf_counter() + duration
+    while timer.perf_counter() < deadline:
+        detector.predict_single(records[completed % len(records)])
+        completed += 1
+    results.put(completed)
+
+def bench_workers(args):
+    """Throughput de predicciones individuales según la cantidad de procesos worker"""
+    import shutil
+    import tempfile
+
+    detector = make_trained_detector(min(args.rows, 200_000))
+    model_path = tempfile.mkdtemp(prefix="fraude-workers-") + '/'
+    detector.config.MODEL_PATH = model_path
+    detector.save_model()
+    detector.publish_version()
+
+    cores = os.cpu_count() or 1
+    counts = sorted({n for n in (1, 2, 4, 8, 16, cores) if n <= max(args.workers, 1)})
+    print(f"{cores} núcleos disponibles, {args.duration:.0f}s por medición")
+
+    context = multiprocessing.get_context('spawn')
+    baseline = None
+    try:
+        for count in counts:
+            barrier, results = context.Barrier(count), context.Queue()
+            workers = [context.Process(target=_serving_worker, args=(model_path, args.duration, barrier, results))
+                       for _ in range(count)]
+            for worker in workers:
+                worker.start()
+            throughput = sum(results.get() for _ in workers) / args.duration
+            for worker in workers:
+                worker.join()
+
+            baseline = baseline or throughput
+            print(f"{count:>3} workers  {throughput:10,.0f} predicciones/s  escalado: {throughput / baseline:5.2f}x")
+    finally:
+        shutil.rmtree(model_path, ignore_errors=True)
+
+def bench_account_features(args):
+    """Almacén por cuenta: reproducción vectorizada (entrenamiento) vs una transacción a la vez (en línea)"""
+    df = make_transactions(args.rows, seed=21)
+    # Pocas cuentas para que las ventanas cortas tengan historia
+    df['cuenta_origen_id'] = np.random.default_rng(21).integers(1, max(args.rows // 200, 2), args.rows)
+    timestamps = transaction_timestamps(df)
+    accounts = df['cuenta_origen_id'].to_numpy(np.int64)
+    amounts = df['monto'].to_numpy(np.float64)
+    merchants, countries = value_bits(df['comerciante']), value_bits(df['pais'])
+
+    start = timer.perf_counter()
+    replayed = AccountFeatureStore().features(accounts, timestamps, amounts, merchants, countries)
+    vectorized = timer.perf_counter() - start
+
+    # Misma secuencia en orden de tiempo, como llegaría a /predict_single_transaction
+    sample = np.lexsort((np.arange(len(df)), timestamps))[:min(args.rows, 20_000)]
+    store, online = AccountFeatureStore(), np.empty((len(sample), len(ACCOUNT_FEATURE_NAMES)))
+    merchant_bits = [value_bit(value) for value in df['comerciante'].to_numpy()[sample]]
+    country_bits = [value_bit(value) for value in df['pais'].to_numpy()[sample]]
+    start = timer.perf_counter()
+    for position, row in enumerate(sample):
+        online[position] = store.features_one(accounts[row], timestamps[row], amounts[row],
+                                              merchant_bits[position], country_bits[position])
+    per_row = (timer.perf_counter() - start) / len(sample)
+
+    # Una secuencia de una fila suma los mismos buckets que features_one: deben coincidir exactamente
+    for row in sample[-1000:]:
+        single = store.features(accounts[row:row + 1], timestamps[row:row + 1], amounts[row:row + 1],
+                                merchants[row:row + 1], countries[row:row + 1], update=False)
+        assert np.array_equal(single[0], store.features_one(accounts[row], timestamps[row], amounts[row],
+                                                            int(merchants[row]), int(countries[row]), update=False))
+
+    # El recorrido en línea sólo ve el prefijo de la muestra: compararlo con una reproducción del mismo prefijo.
+    # Las sumas van en otro orden, así que la varianza difiere en el redondeo, acotado por
+    # VARIANCE_RELATIVE_TOLERANCE · E[x²] (y E[x²] de los montos desplazados, por el mayor monto de la cuenta)
+    expected = AccountFeatureStore().features(accounts[sample], timestamps[sample], amounts[sample],
+                                              merchants[sample], countries[sample])
+    largest = pd.Series(amounts[sample]).groupby(accounts[sample]).transform('max').to_numpy()
+    tolerance = np.maximum(np.abs(expected), 1.0) * 1e-6
+    variance_columns = [ACCOUNT_FEATURE_NAMES.index(name) for name in ACCOUNT_FEATURE_NAMES if name.startswith('account_amount_var')]
+    tolerance[:, variance_columns] += 2 * VARIANCE_RELATIVE_TOLERANCE * (largest ** 2)[:, None]
+    assert np.all(np.abs(online - expected) <= tolerance), "Diferencia entre reproducción y camino en línea"
+    difference = np.max(np.abs(online - expected) / np.maximum(np.abs(expected), 1.0))
+
+    print(f"reproducción vectorizada: {args.rows:,} filas en {vectorized * 1e3:8.1f}ms "
+          f"({vectorized / args.rows * 1e6:.2f}µs/fila)")
+    print(f"en línea (features_one):  {per_row * 1e6:8.1f}µs por transacción, diferencia relativa máx. {difference:.1e}")
+    print(f"{store.accounts:,} cuentas, {store.info()['memoria_mb']} MB; "
+          f"transacciones con historia en 24h: {(replayed[:, ACCOUNT_FEATURE_NAMES.index('account_tx_count_24h')] > 0).mean():.1%}")
+
+def bench_merchant_risk(args):
+    """Columnas comerciante_*: tabla en memoria vs merge con `comerciantes` (el JOIN hecho en pandas)"""
+    table, merchants = make_merchant_table(), make_merchants()
+    df = make_transactions(args.rows, seed=13).drop(columns=['comerciante_nivel_riesgo', 'comerciante_categoria_real',
+                                                            'comerciante_tasa_fraude'])
+    # Algunos comerciantes que no están en la tabla, como en el LEFT JOIN
+    df.loc[df.index[::97], 'comerciante'] = 'COM999'
+    joined = merchants.rename(columns={
+        'nivel_riesgo': 'comerciante_nivel_riesgo', 'categoria': 'comerciante_categoria_real',
+        'tasa_fraude': 'comerciante_tasa_fraude'
+    })
+
+    def merge():
+        return df.merge(joined, how='left', left_on='comerciante', right_on='codigo_comerciante')
+
+    expected = merge()
+    for label, frame in (('object', df), ('category', df.astype({'comerciante': 'category'}))):
+        actual = table.attach(frame.copy())
+        for column in ('comerciante_nivel_riesgo', 'comerciante_categoria_real'):
+            assert actual[column].astype(object).equals(expected[column].astype(object)), f"Diferencia en {column} ({label})"
+        assert np.allclose(actual['comerciante_tasa_fraude'], expected['comerciante_tasa_fraude'], equal_nan=True), label
+    print(f"paridad OK en {args.rows:,} transacciones ({(expected['codigo_comerciante'].isna()).mean():.1%} sin comerciante)")
+
+    # attach reemplaza las columnas en el mismo DataFrame: se puede repetir sin copiarlo
+    before = measure(merge, args.repeat)
+    after = measure(lambda: table.attach(df), args.repeat)
+    report(f"merchant_risk [{args.rows:,} filas, texto]", before, after)
+
+    categorical = df.astype({'comerciante': 'category'})
+    after = measure(lambda: table.attach(categorical), args.repeat)
+    report(f"merchant_risk [{args.rows:,} filas, category]", before, after)
+
+    codes = df['comerciante'].to_numpy()[:100_000]
+    elapsed = measure(lambda: [table.get(code) for code in codes], args.repeat)
+    print(f"búsqueda individual: {elapsed / len(codes) * 1e9:6.0f}ns por transacción")
+
+def bench_rules(args):
+    """Reglas de `reglas_fraude`: evaluación vectorizada vs fila a fila, y efecto del corte por reglas"""
+    detector = make_trained_detector()
+    df = make_transactions(args.rows, seed=19)
+    # Algunos comerciantes que no están en `comerciantes` (regla 'comerciante_nuevo')
+    df.loc[df.index[::211], 'comerciante'] = 'COM999'
+
+    sample = df.iloc[:min(args.rows, 100_000)]
+    records = sample.to_dict('records')
+    expected = [[rule.id for rule in detector.evaluate_rules_one(record)[0]] for record in records]
+    matches = detector.evaluate_rules(sample)
+    assert matches.ids_per_row() == expected, "Diferencia entre la evaluación vectorizada y la escalar"
+    scalar_scores = np.array([detector.evaluate_rules_one(record)[1] for record in records[:10_000]])
+    assert np.allclose(matches.score[:10_000], scalar_scores), "Diferencia en la puntuación de reglas"
+    print(f"paridad OK en {len(sample):,} transacciones "
+          f"({(matches.matrix.any(axis=1)).mean():.1%} activan al menos una regla)")
+
+    before = measure(lambda: [detector.evaluate_rules_one(record) for record in records], args.repeat)
+    after = measure(lambda: detector.evaluate_rules(sample), args.repeat)
+    report(f"rules [{len(sample):,} filas]", before, after)
+    elapsed = measure(lambda: detector.evaluate_rules(df), args.repeat)
+    print(f"evaluación vectorizada: {args.rows:,} filas en {elapsed * 1e3:8.1f}ms "
+          f"({len(detector.db_manager.fraud_rules)} reglas)")
+
+    config = detector.config
+    config.RULES_SHORT_CIRCUIT = False
+    model_only = detector._score_frame(df.copy())['probabilidad_fraude'].to_numpy()
+    before = measure(lambda: detector._score_frame(df.copy()), args.repeat)
+    config.RULES_SHORT_CIRCUIT = True
+    decided = detector.short_circuited(detector.evaluate_rules(df).score)
+    with_rules = detector._score_frame(df.copy())['probabilidad_fraude'].to_numpy()
+    assert np.array_equal(model_only[~decided], with_rules[~decided]), "El corte cambió filas no decididas"
+    after = measure(lambda: detector._score_frame(df.copy()), args.repeat)
+    report(f"_score_frame con corte ≥ {config.RULES_SHORT_CIRCUIT_SCORE} [{decided.mean():.1%} decididas]", before, after)
+    config.RULES_SHORT_CIRCUIT = False
+
+def bench_serialization(args):
+    """Transacciones marcadas de predict_database: iterrows + pydantic vs columnas + orjson/json, CPU y bytes"""
+    detector = make_trained_detector()
+    rng = np.random.default_rng(23)
+    flagged = make_transactions(args.rows, seed=23)
+    flagged['probabilidad_fraude'] = 0.5 + rng.random(args.rows) / 2
+    flagged['prediccion_fraude'] = True
+    flagged['nivel_riesgo'] = pd.cut(flagged['probabilidad_fraude'], bins=[0, 0.5, 0.8, 1], labels=['LOW', 'MEDIUM', 'HIGH'])
+    flagged['prediccion'] = 'FRAUDE'
+    flagged.loc[flagged.index[::50], 'cuenta_destino_id'] = np.nan
+
+    def response(results) -> Dict:
+        return {
+            'transacciones_fraudulentas_encontradas': args.rows, 'total_transacciones_analizadas': args.rows * 20,
+            'tiempo_procesamiento': 1.0, 'timestamp': '2024-01-01T00:00:00', 'resultados': results,
+            'resumen_estadisticas': detector._summary_statistics(args.rows * 20, args.rows, args.rows)
+        }
+
+    def legacy_body() -> bytes:
+        # Lo que hacía el endpoint: modelo pydantic y, en FastAPI, jsonable_encoder + json.dumps
+        model = DatabaseAnalysisResponse(**response(legacy_serialize_flagged(flagged)))
+        return json.dumps(jsonable_encoder(model), ensure_ascii=False).encode('utf-8')
+
+    def body(columnar: bool) -> bytes:
+        return result_serializer.dumps(response(detector._serialize_flagged(flagged, columnar)))
+
+    def legacy_ndjson() -> bytes:
+        lines = [json.dumps({'tipo': 'transaccion', **result}, ensure_ascii=False)
+                 for result in legacy_serialize_flagged(flagged)]
+        return ("\n".join(lines) + "\n").encode('utf-8')
+
+    def ndjson() -> bytes:
+        return result_serializer.to_ndjson(detector._flagged_columns(flagged), prefix={'tipo': 'transaccion'})
+
+    # Paridad: mismos registros salvo las reglas activadas, que el serializador anterior no tenía
+    expected = json.loads(legacy_body())['resultados']
+    for records in (json.loads(body(False))['resultados'], [json.loads(line) for line in ndjson().splitlines()]):
+        assert [{k: v for k, v in r.items() if k not in ('reglas_activadas', 'tipo')} for r in records] == expected
+    columnar = json.loads(body(True))['resultados']
+    assert [dict(zip(columnar['columns'], row)) for row in columnar['rows']] == json.loads(body(False))['resultados']
+    print(f"paridad OK en {args.rows:,} transacciones marcadas (orjson: {'sí' if result_serializer.orjson else 'no'})")
+
+    encoder = result_serializer.orjson
+    before = measure_cpu(legacy_body, args.repeat)
+    for label, use_orjson in (('orjson', True), ('json', False)):
+        if use_orjson and encoder is None:
+            continue
+        result_serializer.orjson = encoder if use_orjson else None
+        try:
+            for layout, columnar_layout in (('registros', False), ('columnar', True)):
+                after = measure_cpu(lambda: body(columnar_layout), args.repeat)
+                report(f"predict_database [{layout}, {label}]", before, after)
+            ndjson_after = measure_cpu(ndjson, args.repeat)
+        finally:
+            result_serializer.orjson = encoder
+        report(f"stream NDJSON [{label}]", measure_cpu(legacy_ndjson, args.repeat), ndjson_after)
+
+    print(f"bytes de respuesta: anterior {len(legacy_body()):,}  registros {len(body(False)):,}  "
+          f"columnar {len(body(True)):,}  NDJSON {len(ndjson()):,}")
+
+def bench_top_n(args):
+    """predict_all_from_db con limit: página por keyset del índice de puntuaciones (o top-N en memoria) vs todas las marcadas"""
+    import tempfile
+    from sqlalchemy import create_engine, text
+
+    detector = make_trained_detector()
+    rng = np.random.default_rng(29)
+    df = make_transactions(args.rows, seed=29)
+    # ~7% marcadas, con empates (las filas decididas por reglas comparten probabilidad)
+    probabilities = np.where(rng.random(args.rows) < 0.01, 0.99, rng.beta(1, 4, args.rows))
+
+    # La consulta de get_scored_flagged sobre SQLite, con el mismo esquema e índice que en PostgreSQL
+    db_manager = detector.db_manager
+    db_manager.engine = create_engine(f"sqlite:///{tempfile.mkdtemp(prefix='fraude-top-n-')}/scores.db")
+    columns = ['id', 'cuenta_origen_id', 'cuenta_destino_id', 'monto', 'comerciante', 'ubicacion', 'tipo_tarjeta',
+               'fecha_transaccion', 'horario_transaccion', 'es_fraude', 'pais', 'distancia_ubicacion_usual']
+    table = df[columns].assign(horario_transaccion=df['horario_transaccion'].astype(str))
+    table.to_sql('transacciones', db_manager.engine, index=False)
+    with db_manager.engine.begin() as conn:
+        conn.execute(text("CREATE UNIQUE INDEX transacciones_pkey ON transacciones(id)"))
+        for statement in filter(str.strip, DatabaseManager.SCORING_SCHEMA.split(';')):
+            conn.execute(text(statement))
+    pd.DataFrame({
+        'transaccion_id': df['id'], 'version_modelo': 'v1', 'probabilidad_fraude': probabilities,
+        'nivel_riesgo': np.where(probabilities >= 0.8, 'HIGH', np.where(probabilities >= 0.5, 'MEDIUM', 'LOW')),
+        'prediccion_fraude': probabilities >= 0.5,
+    }).to_sql('puntuaciones_transacciones', db_manager.engine, index=False, if_exists='append')
+    with db_manager.engine.connect() as conn:
+        plan = conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT transaccion_id FROM puntuaciones_transacciones "
+            "WHERE version_modelo = 'v1' AND probabilidad_fraude >= 0.5 "
+            "ORDER BY probabilidad_fraude DESC, transaccion_id LIMIT 500"
+        )).fetchall()
+    print("plan:", "; ".join(row[-1] for row in plan))
+
+    def full_ranking() -> bytes:
+        return result_serializer.dumps(detector._serialize_flagged(db_manager.get_scored_flagged('v1')))
+
+    def top_n(limit: int, after=None) -> pd.DataFrame:
+        return db_manager.get_scored_flagged('v1', 0.5, limit, after)
+
+    def render(page: pd.DataFrame) -> bytes:
+        return result_serializer.dumps(detector._serialize_flagged(page))
+
+    everything = json.loads(full_ranking())
+    print(f"{args.rows:,} transacciones puntuadas, {len(everything):,} marcadas")
+    before = measure(full_ranking, args.repeat)
+    for limit in (100, 500, 5000):
+        page = top_n(limit)
+        assert json.loads(render(page)) == everything[:limit], f"Diferencia con limit={limit}"
+        # La página siguiente arranca en el cursor de la última fila, sin OFFSET
+        following = top_n(limit, decode_cursor(detector._next_cursor(page)))
+        assert json.loads(render(following)) == everything[limit:2 * limit], f"Cursor distinto con limit={limit}"
+        after = measure(lambda: render(top_n(limit)), args.repeat)
+        report(f"top-{limit} (consulta + serialización)", before, after)
+        print(f"{'':<40} bytes: {len(full_ranking()):,} -> {len(render(page)):,}")
+
+    # Sin puntuaciones guardadas: la misma página elegida en memoria tras puntuar la tabla
+    ids = df['id'].to_numpy()
+    positions, _ = top_risk_positions(probabilities, ids, 0.5, 500)
+    assert ids[positions].tolist() == [row['id'] for row in everything[:500]], "Diferencia en la selección en memoria"
+    elapsed = measure(lambda: top_risk_positions(probabilities, ids, 0.5, 500), args.repeat)
+    print(f"selección top-500 en memoria (argpartition) sobre {args.rows:,} filas: {elapsed * 1e3:.1f}ms")
+
+class PipeListener:
+    """Sustituto de PostgresListener: cada byte escrito en el pipe es un NOTIFY"""
+
+    leader = True
+
+    def __init__(self):
+        self.read_fd, self.write_fd = os.pipe()
+        os.set_blocking(self.read_fd, False)
+
+    def notify(self):
+        os.write(self.write_fd, b'.')
+
+    def fileno(self) -> int:
+        return self.read_fd
+
+    def drain(self) -> int:
+        try:
+            return len(os.read(self.read_fd, 65536))
+        except BlockingIOError:
+            return 0
+
+    def close(self):
+        os.close(self.read_fd)
+        os.close(self.write_fd)
+
+def bench_realtime(args):
+    """Consumidor LISTEN/NOTIFY: retraso inserción → detección a distintas tasas de llegada (sin base de datos)"""
+    detector = make_trained_detector()
+    source = make_transactions(args.rows, seed=17).sort_values('id', ignore_index=True)
+    print(f"{'tasa (tx/s)':>12} {'puntuadas':>10} {'lotes':>7} {'lote medio':>11} {'p50 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'máx (ms)':>9} {'pendientes':>11}")
+
+    for rate in (1_000, 5_000, 20_000, 50_000):
+        total = min(int(rate * args.duration), len(source))
+        inserted_at = np.full(total, np.nan)
+        detected_at = np.full(total, np.nan)
+        state = {'inserted': 0, 'cursor': 0}
+        listener = PipeListener()
+        replay = AccountFeatureStore()
+
+        def process_batch(limit: int) -> Dict:
+            # Mismo trabajo que score_realtime_batch salvo la lectura y escritura en la base
+            start, end = state['cursor'], min(state['inserted'], state['cursor'] + limit)
+            if end == start:
+                return {'filas': 0}
+            df = detector._score_new_and_seen(source.iloc[start:end].copy(), replay)
+            detector._score_rows(df)
+            detected_at[start:end] = timer.perf_counter()
+            state['cursor'] = end
+            return {'filas': end - start, 'alertas': int(df['prediccion_fraude'].sum()),
+                    'retraso_segundos': timer.perf_counter() - inserted_at[start], 'pendientes': state['inserted'] - end}
+
+        def produce():
+            # Un INSERT (y su NOTIFY) por milisegundo con las filas que tocan a esta tasa
+            started = timer.perf_counter()
+            while state['inserted'] < total:
+                due = min(int((timer.perf_counter() - started) * rate) + 1, total)
+                if due > state['inserted']:
+                    inserted_at[state['inserted']:due] = timer.perf_counter()
+                    state['inserted'] = due
+                    listener.notify()
+                timer.sleep(0.001)
+
+        async def scenario():
+            scorer = RealtimeScorer(lambda: listener, process_batch, batch_size=5000, poll_seconds=1)
+            await scorer.start()
+            producer = threading.Thread(target=produce, daemon=True)
+            producer.start()
+            while producer.is_alive() or state['cursor'] < total:
+                await asyncio.sleep(0.05)
+                if not producer.is_alive() and timer.perf_counter() - inserted_at[total - 1] > 10:
+                    break
+            await scorer.stop()
+            return scorer
+
+        scorer = asyncio.run(scenario())
+        latencies = (detected_at - inserted_at)[:state['cursor']] * 1000
+        print(f"{rate:>12,} {state['cursor']:>10,} {scorer.batches:>7,} {state['cursor'] / max(scorer.batches, 1):>11.1f} "
+              f"{np.percentile(latencies, 50):>9.1f} {np.percentile(latencies, 99):>9.1f} {latencies.max():>9.1f} "
+              f"{total - state['cursor']:>11,}")
+
+BENCHMARKS: Dict[str, Callable] = {
+    'time_features': bench_time_features,
+    'categorical': bench_categorical,
+    'single_row': bench_single_row,
+    'extraction': bench_extraction,
+    'concurrency': bench_concurrency,
+    'forest_latency': bench_forest_latency,
+    'explain': bench_explain,
+    'incremental': bench_incremental,
+    'model_load': bench_model_load,
+    'workers': bench_workers,
+    'account_features': bench_account_features,
+    'merchant_risk': bench_merchant_risk,
+    'rules': bench_rules,
+    'serialization': bench_serialization,
+    'top_n': bench_top_n,
+    'realtime': bench_realtime,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks del servicio de fraude")
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS.keys()))
+    parser.add_argument('--rows', type=int, default=1_000_000, help="Filas del DataFrame sintético")
+    parser.add_argument('--repeat', type=int, default=3, help="Repeticiones por medición (se reporta la mejor)")
+    parser.add_argument('--workers', type=int, default=4, help="Procesos simultáneos en model_load (máximo en workers)")
+    parser.add_argument('--duration', type=float, default=5.0, help="Segundos de carga por medición en workers")
+    args = parser.parse_args()
+
+    BENCHMARKS[args.benchmark](args)
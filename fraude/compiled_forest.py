@@ -0,0 +1,202 @@
+"""
+Random Forest compilado en arreglos planos
+==========================================
+Exporta los árboles de un RandomForestClassifier de sklearn a arreglos numpy
+contiguos (feature, threshold, left, right, value por nodo) y los evalúa para
+un lote completo a la vez: cada iteración avanza un nivel en todos los árboles
+y todas las filas con operaciones vectorizadas. Evita el despacho por árbol y
+el overhead de joblib de `predict_proba`, que dominan con una o pocas filas.
+
+Las hojas apuntan a sí mismas, así que basta con iterar `max_depth` veces.
+Las características nunca llegan con NaN (prepare_features las imputa), por
+lo que no se replica el manejo de valores faltantes de sklearn.
+
+Contribuciones por característica (Saabas): al bajar de un nodo a su hijo la
+probabilidad del árbol cambia en value[hijo] - value[padre], y ese cambio se
+atribuye a la característica con la que se dividió el padre. Los deltas y la
+característica del padre de cada nodo se calculan al compilar y se guardan
+con el bosque, así que explicar una fila es el mismo recorrido que predecirla
+más una suma por nivel. Para cada fila, base + Σ contribuciones = probabilidad.
+"""
+
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+# Filas por bloque de evaluación: acota la matriz (filas x árboles) para que quepa en caché
+EVAL_BLOCK_ROWS = 1024
+
+class CompiledForest:
+    """Bosque de clasificación binaria evaluado sobre arreglos planos"""
+
+    ARRAYS = ('feature', 'threshold', 'left', 'right', 'value', 'roots')
+
+    # Arreglos derivados que se persisten para no recalcularlos al cargar
+    DERIVED_ARRAYS = ('children', 'delta', 'split_feature')
+
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray,
+                 right: np.ndarray, value: np.ndarray, roots: np.ndarray, max_depth: int,
+                 children: Optional[np.ndarray] = None, delta: Optional[np.ndarray] = None,
+                 split_feature: Optional[np.ndarray] = None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+
+        # Hijos intercalados: el siguiente nodo es children[2 * nodo + (x > umbral)]
+        if children is None:
+            children = np.empty(2 * len(left), dtype=np.intp)
+            children[0::2] = left
+            children[1::2] = right
+        self.children = children
+
+        # Cambio de probabilidad al llegar a cada nodo y característica que lo decidió (0 en las raíces)
+        if delta is None or split_feature is None:
+            delta, split_feature = self._path_deltas(feature, left, right, value)
+        self.delta = delta
+        self.split_feature = split_feature
+
+        # Copias para evaluar (chicas, no se persisten): características en intp para que `take`
+        # no convierta índices en cada nivel, y umbrales en float32 redondeados hacia abajo; para x
+        # float32, x > umbral equivale a x > el mayor float32 <= umbral, así que el resultado es el mismo
+        self._eval_feature = feature.astype(np.intp)
+        self._eval_threshold = threshold.astype(np.float32)
+        rounded_up = self._eval_threshold.astype(np.float64) > threshold
+        self._eval_threshold[rounded_up] = np.nextafter(self._eval_threshold[rounded_up], np.float32(-np.inf))
+
+    @staticmethod
+    def _path_deltas(feature: np.ndarray, left: np.ndarray, right: np.ndarray,
+                     value: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        node_ids = np.arange(len(left), dtype=np.int32)
+        internal = left != node_ids  # Las hojas apuntan a sí mismas
+        parent = node_ids.copy()
+        parent[left[internal]] = node_ids[internal]
+        parent[right[internal]] = node_ids[internal]
+        return value - value[parent], feature[parent].astype(np.int32)
+
+    @property
+    def bias(self) -> float:
+        """Probabilidad esperada antes de mirar la fila (promedio de las raíces)"""
+        return float(self.value[self.roots].mean())
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    @classmethod
+    def from_sklearn(cls, model) -> 'CompiledForest':
+        """Compilar un RandomForestClassifier binario ya entrenado"""
+        if list(model.classes_) != [0, 1] and list(model.classes_) != [False, True]:
+            raise ValueError(f"Sólo se soportan bosques binarios, clases: {list(model.classes_)}")
+
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        offset, max_depth = 0, 0
+
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count, dtype=np.int32)
+            is_leaf = tree.children_left < 0
+
+            # Hojas: comparar contra +inf siempre va a la izquierda, que apunta a la misma hoja
+            features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold).astype(np.float64))
+            lefts.append((np.where(is_leaf, node_ids, tree.children_left) + offset).astype(np.int32))
+            rights.append((np.where(is_leaf, node_ids, tree.children_right) + offset).astype(np.int32))
+
+            # Probabilidad de la clase positiva en cada nodo (como DecisionTreeClassifier.predict_proba)
+            class_weights = tree.value[:, 0, :]
+            totals = class_weights.sum(axis=1)
+            values.append(np.divide(class_weights[:, 1], totals, out=np.zeros(tree.node_count), where=totals > 0))
+
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(
+            np.concatenate(features), np.concatenate(thresholds), np.concatenate(lefts),
+            np.concatenate(rights), np.concatenate(values), np.array(roots, dtype=np.int32), max_depth
+        )
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Probabilidad de la clase positiva por fila (equivalente a predict_proba(X)[:, 1])"""
+        # sklearn compara en float32 contra umbrales float64
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        result = np.empty(X.shape[0], dtype=np.float64)
+
+        for start in range(0, X.shape[0], EVAL_BLOCK_ROWS):
+            block = X[start:start + EVAL_BLOCK_ROWS]
+            result[start:start + len(block)] = self._predict_block(block)
+        return result
+
+    def _predict_block(self, X: np.ndarray) -> np.ndarray:
+        n_rows, n_features = X.shape
+        values = X.ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.intp) * n_features)[:, None]
+        nodes = np.repeat(self.roots[None, :].astype(np.intp), n_rows, axis=0)
+
+        # Un nivel por iteración en todos los árboles y filas (take es más rápido que el indexado fancy)
+        for _ in range(self.max_depth):
+            x = values.take(row_offsets + self._eval_feature.take(nodes))
+            nodes = self.children.take(2 * nodes + (x > self._eval_threshold.take(nodes)))
+
+        return self.value.take(nodes).sum(axis=1) / self.n_trees
+
+    def contributions(self, X: np.ndarray) -> np.ndarray:
+        """
+        Contribución de cada característica a la probabilidad de cada fila (filas x características)
+
+        Sumadas a `bias` dan `predict_proba(X)`.
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        result = np.empty(X.shape, dtype=np.float64)
+
+        for start in range(0, X.shape[0], EVAL_BLOCK_ROWS):
+            block = X[start:start + EVAL_BLOCK_ROWS]
+            result[start:start + len(block)] = self._contributions_block(block)
+        return result
+
+    def _contributions_block(self, X: np.ndarray) -> np.ndarray:
+        n_rows, n_features = X.shape
+        values = X.ravel()
+        row_offsets = (np.arange(n_rows, dtype=np.intp) * n_features)[:, None]
+        nodes = np.repeat(self.roots[None, :].astype(np.intp), n_rows, axis=0)
+        totals = np.zeros(n_rows * n_features, dtype=np.float64)
+
+        # El mismo recorrido que _predict_block; cada paso suma el delta del nodo al que se
+        # bajó en la característica del padre (las filas que ya están en una hoja no se mueven)
+        for _ in range(self.max_depth):
+            x = values.take(row_offsets + self._eval_feature.take(nodes))
+            next_nodes = self.children.take(2 * nodes + (x > self._eval_threshold.take(nodes)))
+            deltas = self.delta.take(next_nodes)
+            deltas[next_nodes == nodes] = 0.0
+            totals += np.bincount(
+                (row_offsets + self.split_feature.take(next_nodes)).ravel(),
+                weights=deltas.ravel(), minlength=len(totals)
+            )
+            nodes = next_nodes
+
+        return totals.reshape(n_rows, n_features) / self.n_trees
+
+    def max_abs_difference(self, model, X: np.ndarray) -> float:
+        """Máxima diferencia contra sklearn sobre una matriz de prueba"""
+        return float(np.max(np.abs(self.predict_proba(X) - model.predict_proba(X)[:, 1]), initial=0.0))
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Arreglos para persistir (incluye los derivados para no recalcularlos al cargar)"""
+        arrays = {name: getattr(self, name) for name in self.ARRAYS + self.DERIVED_ARRAYS}
+        arrays['max_depth'] = np.array(self.max_depth)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays) -> 'CompiledForest':
+        """Reconstruir desde los arreglos guardados (dict, NpzFile o memmaps de joblib)"""
+        # Los bosques guardados antes de que existiera un derivado lo recalculan
+        derived = {name: arrays[name] if name in arrays else None for name in cls.DERIVED_ARRAYS}
+        return cls(*(arrays[name] for name in cls.ARRAYS), max_depth=int(arrays['max_depth']), **derived)
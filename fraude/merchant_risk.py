@@ -0,0 +1,129 @@
+"""
+Riesgo de comerciantes en memoria
+=================================
+Copia de `comerciantes` (nivel de riesgo, categoría y tasa de fraude) indexada
+por `codigo_comerciante`. Reemplaza el LEFT JOIN que hacían todas las
+consultas de transacciones: las columnas `comerciante_*` se agregan después de
+leer, con una búsqueda vectorizada sobre arreglos (por categoría cuando la
+columna ya es categórica), y la predicción individual las obtiene con un
+acceso a diccionario en lugar de valores fijos.
+
+La tabla se reemplaza completa en cada refresco (una sola asignación), así que
+los lectores nunca ven un estado a medio cargar.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+# Columnas que agrega a las transacciones (mismos nombres que usaba el JOIN)
+RISK_LEVEL_COLUMN = 'comerciante_nivel_riesgo'
+CATEGORY_COLUMN = 'comerciante_categoria_real'
+FRAUD_RATE_COLUMN = 'comerciante_tasa_fraude'
+COLUMNS = (RISK_LEVEL_COLUMN, CATEGORY_COLUMN, FRAUD_RATE_COLUMN)
+
+class _Snapshot(NamedTuple):
+    codes: pd.Index             # codigo_comerciante, posición = fila
+    risk_levels: pd.Categorical
+    categories: pd.Categorical
+    fraud_rates: np.ndarray     # float32, NaN si falta
+    rows: Dict[str, Dict[str, Any]]  # Camino escalar: código -> columnas comerciante_*
+    loaded_at: Optional[str]
+
+def _empty_snapshot() -> _Snapshot:
+    return _Snapshot(
+        pd.Index([], dtype=str), pd.Categorical([]), pd.Categorical([]),
+        np.empty(0, dtype=np.float32), {}, None
+    )
+
+class MerchantRiskTable:
+    """Tabla de riesgo por comerciante respaldada por arreglos"""
+
+    def __init__(self):
+        self._snapshot = _empty_snapshot()
+        self.refreshes = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot.loaded_at is not None
+
+    def __len__(self) -> int:
+        return len(self._snapshot.codes)
+
+    def load(self, merchants: pd.DataFrame):
+        """
+        Reemplazar el contenido con las filas de `comerciantes`
+
+        `merchants` debe tener codigo_comerciante, nivel_riesgo, categoria y tasa_fraude.
+        """
+        merchants = merchants.drop_duplicates('codigo_comerciante', keep='last')
+        codes = pd.Index(merchants['codigo_comerciante'].astype(str))
+        risk_levels = pd.Categorical(merchants['nivel_riesgo'].to_numpy())
+        categories = pd.Categorical(merchants['categoria'].to_numpy())
+        fraud_rates = pd.to_numeric(merchants['tasa_fraude'], errors='coerce').to_numpy(dtype=np.float64)
+
+        rows = {
+            code: {
+                RISK_LEVEL_COLUMN: None if pd.isna(risk) else risk,
+                CATEGORY_COLUMN: None if pd.isna(category) else category,
+                FRAUD_RATE_COLUMN: None if np.isnan(rate) else float(rate)
+            }
+            for code, risk, category, rate in zip(codes, risk_levels, categories, fraud_rates)
+        }
+
+        self._snapshot = _Snapshot(
+            codes, risk_levels, categories, fraud_rates.astype(np.float32), rows, datetime.now().isoformat()
+        )
+        self.refreshes += 1
+
+    def get(self, code: Any) -> Optional[Dict[str, Any]]:
+        """Columnas comerciante_* de un comerciante (None si no está en la tabla)"""
+        return self._snapshot.rows.get(code if isinstance(code, str) else str(code))
+
+    def attach(self, df: pd.DataFrame, column: str = 'comerciante') -> pd.DataFrame:
+        """Agregar (o reemplazar) las columnas comerciante_* buscando `df[column]` en la tabla"""
+        snapshot = self._snapshot
+        positions = self._positions(snapshot.codes, df[column])
+        known = positions >= 0
+        positions = np.where(known, positions, 0)
+
+        if len(snapshot.codes):
+            df[RISK_LEVEL_COLUMN] = self._take(snapshot.risk_levels, positions, known)
+            df[CATEGORY_COLUMN] = self._take(snapshot.categories, positions, known)
+            df[FRAUD_RATE_COLUMN] = np.where(known, snapshot.fraud_rates[positions], np.float32(np.nan))
+        else:
+            df[RISK_LEVEL_COLUMN] = pd.Categorical.from_codes(np.full(len(df), -1), categories=[])
+            df[CATEGORY_COLUMN] = pd.Categorical.from_codes(np.full(len(df), -1), categories=[])
+            df[FRAUD_RATE_COLUMN] = np.full(len(df), np.nan, dtype=np.float32)
+        return df
+
+    def contains(self, values: pd.Series) -> np.ndarray:
+        """Máscara de comerciantes registrados; sin tabla cargada se consideran todos registrados"""
+        snapshot = self._snapshot
+        if not len(snapshot.codes):
+            return np.ones(len(values), dtype=bool)
+        return self._positions(snapshot.codes, values) >= 0
+
+    @staticmethod
+    def _positions(codes: pd.Index, values: pd.Series) -> np.ndarray:
+        """Fila de cada valor en la tabla (-1 si no está); las categóricas se buscan una vez por categoría"""
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            category_positions = codes.get_indexer(values.cat.categories.astype(str))
+            value_codes = values.cat.codes.to_numpy()
+            return np.where(value_codes >= 0, category_positions[value_codes], -1)
+        return codes.get_indexer(values)
+
+    @staticmethod
+    def _take(column: pd.Categorical, positions: np.ndarray, known: np.ndarray) -> pd.Categorical:
+        return pd.Categorical.from_codes(
+            np.where(known, column.codes[positions], -1), categories=column.categories
+        )
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "comerciantes": len(self),
+            "cargada": self._snapshot.loaded_at,
+            "refrescos": self.refreshes
+        }
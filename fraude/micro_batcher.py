@@ -0,0 +1,176 @@
+"""
+Micro-batching de predicciones concurrentes
+===========================================
+Agrupa las peticiones de /predict_single_transaction que llegan casi al mismo
+tiempo para puntuarlas con una sola llamada a predict_proba, amortizando el
+costo fijo por llamada del Random Forest.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Función de puntuación: matriz de características -> probabilidad de fraude por fila
+Scorer = Callable[[np.ndarray], np.ndarray]
+
+class Histogram:
+    """Histograma acumulativo de buckets fijos (mismo formato que Prometheus)"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = sorted(buckets)
+        self.bucket_counts = [0] * len(self.buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        """Registrar una observación"""
+        self.count += 1
+        self.total += value
+        for i, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado actual con conteos acumulados por límite superior"""
+        cumulative, running = {}, 0
+        for upper_bound, bucket_count in zip(self.buckets, self.bucket_counts):
+            running += bucket_count
+            cumulative[f"le_{upper_bound:g}"] = running
+        cumulative["le_inf"] = self.count
+
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "mean": round(self.total / self.count, 3) if self.count else 0.0,
+            "buckets": cumulative
+        }
+
+class MicroBatcher:
+    """
+    Planificador asyncio que acumula filas durante una ventana corta
+
+    Cada lote se cierra al cumplirse `window_ms` desde la primera petición en
+    espera o al alcanzar `max_batch_size`, se puntúa en un hilo del executor
+    (el event loop sigue aceptando peticiones) y cada llamador recibe su
+    probabilidad a través de su propio future.
+    """
+
+    def __init__(self, window_ms: float, max_batch_size: int, executor=None):
+        self.window = max(window_ms, 0.0) / 1000
+        self.max_batch_size = max(max_batch_size, 1)
+        self.executor = executor
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        size_buckets = [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024]
+        self.batch_size_histogram = Histogram([b for b in size_buckets if b < self.max_batch_size] + [self.max_batch_size])
+        self.queue_wait_histogram = Histogram([0.5, 1, 2, 5, 10, 20, 50, 100, 250, 500, 1000])  # ms
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        """Iniciar el bucle de agrupación en el event loop actual"""
+        if self.running:
+            return
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"📦 Micro-batching activo: ventana {self.window * 1000:g}ms, lote máximo {self.max_batch_size}")
+
+    async def stop(self):
+        """Detener el bucle; las peticiones pendientes reciben un error"""
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+        while not self._queue.empty():
+            _, _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Micro-batcher detenido"))
+        self._task = None
+
+    async def submit(self, scorer: Scorer, row: np.ndarray) -> float:
+        """Encolar una fila (1, n_features) y esperar su probabilidad de fraude"""
+        if not self.running:
+            # Sin bucle activo (p. ej. fuera del servidor) se puntúa directamente
+            return float(scorer(row)[0])
+
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((scorer, row, future, time.perf_counter()))
+        return await future
+
+    def stats(self) -> Dict[str, Any]:
+        """Histogramas de tamaño de lote y espera en cola para ajustar la ventana"""
+        return {
+            "running": self.running,
+            "window_ms": self.window * 1000,
+            "max_batch_size": self.max_batch_size,
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "batch_size": self.batch_size_histogram.snapshot(),
+            "queue_wait_ms": self.queue_wait_histogram.snapshot()
+        }
+
+    async def _run(self):
+        """Bucle principal: formar lotes y puntuarlos"""
+        while True:
+            batch = [await self._queue.get()]
+            deadline = batch[0][3] + self.window
+
+            while len(batch) < self.max_batch_size:
+                # Primero lo que ya está en cola, luego esperar hasta la ventana
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            try:
+                await self._score(batch)
+            except Exception as e:
+                logger.error(f"❌ Error puntuando lote de {len(batch)} transacciones: {e}")
+
+    async def _score(self, batch: List[Tuple[Scorer, np.ndarray, asyncio.Future, float]]):
+        """Puntuar un lote con una llamada por scorer y resolver los futures"""
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        self.batch_size_histogram.observe(len(batch))
+
+        # Agrupar por scorer: durante un hot-swap pueden convivir dos versiones del modelo
+        groups: Dict[Scorer, List[Tuple[np.ndarray, asyncio.Future]]] = {}
+        for scorer, row, future, enqueued in batch:
+            self.queue_wait_histogram.observe((started - enqueued) * 1000)
+            groups.setdefault(scorer, []).append((row, future))
+
+        for scorer, items in groups.items():
+            pending = [(row, future) for row, future in items if not future.done()]
+            if not pending:
+                continue
+
+            try:
+                X = np.vstack([row for row, _ in pending])
+                probabilities = await loop.run_in_executor(self.executor, scorer, X)
+            except Exception as e:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            for (_, future), probability in zip(pending, probabilities):
+                if not future.done():
+                    future.set_result(float(probability))
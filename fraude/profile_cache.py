@@ -0,0 +1,101 @@
+"""
+Caché de perfiles de usuario
+============================
+LRU acotado con expiración por TTL delante de `perfiles_usuario`. Los perfiles
+cambian poco (se recalculan por lotes), así que una copia de unos minutos evita
+una consulta por cuenta en cada puntuación. También se guardan las cuentas sin
+perfil para no volver a consultarlas hasta que expiren.
+
+Cada worker tiene su propia caché; es segura para los hilos de los pools.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
+
+# Marca de cuenta consultada sin perfil (distinta de "no está en caché")
+_MISSING = object()
+
+class ProfileCache:
+    """LRU con TTL y contadores de aciertos, fallos, expiraciones y desalojos"""
+
+    def __init__(self, max_size: int, ttl_seconds: float, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max(int(max_size), 0)
+        self.ttl = float(ttl_seconds)
+        self._clock = clock
+        self._entries: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and self.ttl > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get_many(self, keys: Iterable[Hashable]) -> Tuple[Dict[Hashable, Optional[Dict]], List[Hashable]]:
+        """Separar claves en encontradas (perfil o None si no tiene) y faltantes"""
+        found: Dict[Hashable, Optional[Dict]] = {}
+        missing: List[Hashable] = []
+        now = self._clock()
+
+        with self._lock:
+            for key in dict.fromkeys(keys):
+                entry = self._entries.get(key)
+                if entry is not None and entry[0] <= now:
+                    del self._entries[key]
+                    self.expired += 1
+                    entry = None
+
+                if entry is None:
+                    self.misses += 1
+                    missing.append(key)
+                    continue
+
+                self._entries.move_to_end(key)
+                self.hits += 1
+                found[key] = None if entry[1] is _MISSING else entry[1]
+
+        return found, missing
+
+    def put_many(self, values: Dict[Hashable, Optional[Dict]]):
+        """Guardar perfiles (None = la cuenta no tiene perfil) desalojando los menos usados"""
+        if not self.enabled:
+            return
+
+        expires_at = self._clock() + self.ttl
+        with self._lock:
+            for key, value in values.items():
+                self._entries[key] = (expires_at, _MISSING if value is None else value)
+                self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+
+    def invalidate(self, keys: Optional[Iterable[Hashable]] = None):
+        """Olvidar algunas cuentas o, sin argumentos, toda la caché"""
+        with self._lock:
+            if keys is None:
+                self._entries.clear()
+                return
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expired": self.expired,
+            "evicted": self.evicted
+        }
@@ -0,0 +1,233 @@
+"""
+Puntuación en tiempo real con LISTEN/NOTIFY
+===========================================
+Un trigger por sentencia sobre `transacciones` emite un NOTIFY sin payload en
+cada INSERT (PostgreSQL agrupa las notificaciones iguales de una misma
+transacción). El consumidor escucha ese canal desde el event loop, sin
+consultar periódicamente, y al despertar drena las transacciones nuevas en
+lotes de hasta `batch_size` filas: cada lote se lee, se puntúa y se guarda en
+un hilo propio, así que nunca hay más de un lote en memoria. Si las
+transacciones llegan más rápido de lo que se puntúan, los lotes se llenan y el
+retraso crece (y se ve en las métricas) en lugar de acumular trabajo sin
+límite.
+
+Con varios workers o réplicas sólo uno consume: el que obtiene un advisory
+lock de sesión en la conexión de escucha. Si esa conexión se cae, el lock se
+libera y otro worker toma el relevo en su siguiente intento.
+"""
+
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+import psycopg2
+
+from micro_batcher import Histogram
+
+logger = logging.getLogger(__name__)
+
+# Clave del advisory lock que elige al único consumidor
+REALTIME_LOCK_KEY = 0x66726175  # "frau"
+
+# Puntúa y guarda el siguiente lote; devuelve al menos 'filas' y, si hay filas,
+# 'retraso_segundos' (antigüedad de la fila más vieja al leerla) y 'pendientes'
+BatchProcessor = Callable[[int], Dict[str, Any]]
+
+class PostgresListener:
+    """Conexión dedicada (autocommit) con LISTEN activo y el advisory lock del consumidor"""
+
+    def __init__(self, connect_kwargs: Dict[str, Any], channel: str, lock_key: int = REALTIME_LOCK_KEY):
+        self.connection = psycopg2.connect(**connect_kwargs)
+        self.connection.autocommit = True
+        with self.connection.cursor() as cur:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (lock_key,))
+            self.leader = bool(cur.fetchone()[0])
+            if self.leader:
+                cur.execute(f'LISTEN "{channel}"')
+
+    def fileno(self) -> int:
+        return self.connection.fileno()
+
+    def drain(self) -> int:
+        """Leer las notificaciones recibidas (levanta excepción si la conexión se cayó)"""
+        self.connection.poll()
+        received = len(self.connection.notifies)
+        self.connection.notifies.clear()
+        return received
+
+    def close(self):
+        # Cerrar la sesión libera el advisory lock
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+
+class RealtimeScorer:
+    """
+    Consumidor asyncio de notificaciones de transacciones nuevas
+
+    `connect` abre un listener (PostgresListener u otro con la misma interfaz) y
+    `process_batch(limit)` puntúa el siguiente lote. Sin notificaciones, cada
+    `poll_seconds` se drena igual por si alguna se perdió (p. ej. durante una
+    reconexión); el mismo intervalo se usa para reintentar el liderazgo.
+    """
+
+    def __init__(self, connect: Callable[[], Any], process_batch: BatchProcessor,
+                 batch_size: int, poll_seconds: float):
+        self.connect = connect
+        self.process_batch = process_batch
+        self.batch_size = max(int(batch_size), 1)
+        self.poll_seconds = max(float(poll_seconds), 0.1)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fraude-realtime")
+
+        self._listener = None
+        self._listening = False
+        self._fd: Optional[int] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.notifications = 0
+        self.batches = 0
+        self.rows = 0
+        self.alerts = 0
+        self.errors = 0
+        self.lag_seconds = 0.0
+        self.pending = 0
+        self.last_batch_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+
+        size_buckets = [1, 8, 64, 256, 1024, 4096, 16384]
+        self.batch_size_histogram = Histogram([b for b in size_buckets if b < self.batch_size] + [self.batch_size])
+        self.detection_histogram = Histogram([0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60])  # s desde la inserción
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def leader(self) -> bool:
+        return self._listener is not None and self._listener.leader
+
+    async def start(self):
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"📡 Puntuación en tiempo real activa: lotes de hasta {self.batch_size} transacciones")
+
+    async def stop(self):
+        if not self.running:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    if self._listener is None:
+                        await self._open_listener(loop)
+                    if not self.leader:
+                        # Otro worker consume: reintentar el liderazgo más tarde
+                        self._close_listener(loop)
+                        await asyncio.sleep(self.poll_seconds)
+                        continue
+
+                    self._wakeup.clear()
+                    await self._drain(loop)
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), self.poll_seconds)
+                    except asyncio.TimeoutError:
+                        pass
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    self.errors += 1
+                    self.last_error = str(e)
+                    logger.warning(f"⚠️ Error en la puntuación en tiempo real, reintentando: {e}")
+                    self._close_listener(loop)
+                    await asyncio.sleep(self.poll_seconds)
+        finally:
+            self._close_listener(loop)
+
+    async def _open_listener(self, loop: asyncio.AbstractEventLoop):
+        listener = await loop.run_in_executor(self.executor, self.connect)
+        self._listener = listener
+        if listener.leader:
+            self._fd = listener.fileno()
+            loop.add_reader(self._fd, self._on_readable)
+            self._listening = True
+            logger.info("📡 Este worker consume las notificaciones de transacciones nuevas")
+
+    def _close_listener(self, loop: asyncio.AbstractEventLoop):
+        if self._listener is None:
+            return
+        if self._listening:
+            loop.remove_reader(self._fd)
+            self._listening = False
+        self._listener.close()
+        self._listener = None
+
+    def _on_readable(self):
+        """Callback del event loop: hay datos en el socket de la conexión de escucha"""
+        try:
+            self.notifications += self._listener.drain()
+        except Exception as e:
+            # Conexión caída: el bucle lo detecta en el próximo lote y reconecta
+            self.last_error = str(e)
+            asyncio.get_running_loop().remove_reader(self._fd)
+            self._listening = False
+        self._wakeup.set()
+
+    async def _drain(self, loop: asyncio.AbstractEventLoop):
+        """Puntuar lotes hasta que uno venga incompleto (no queda nada pendiente)"""
+        while True:
+            if not self._listening:
+                raise ConnectionError(f"Se perdió la conexión de escucha: {self.last_error}")
+
+            started = time.perf_counter()
+            result = await loop.run_in_executor(self.executor, self.process_batch, self.batch_size)
+            rows = int(result.get('filas', 0))
+            if rows == 0:
+                self.lag_seconds, self.pending = 0.0, 0
+                return
+
+            # Tiempo desde la inserción hasta la detección de la fila más vieja del lote
+            elapsed = time.perf_counter() - started
+            self.lag_seconds = float(result.get('retraso_segundos', 0.0))
+            self.pending = int(result.get('pendientes', 0))
+            self.detection_histogram.observe(self.lag_seconds + elapsed)
+            self.batch_size_histogram.observe(rows)
+            self.batches += 1
+            self.rows += rows
+            self.alerts += int(result.get('alertas', 0))
+            self.last_batch_at = time.time()
+
+            if rows < self.batch_size:
+                return
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "leader": self.leader,
+            "batch_size": self.batch_size,
+            "notifications": self.notifications,
+            "batches": self.batches,
+            "transactions": self.rows,
+            "alerts": self.alerts,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "lag_seconds": round(self.lag_seconds, 3),
+            "pending_transactions": self.pending,
+            "last_batch_at": self.last_batch_at,
+            "batch_size_histogram": self.batch_size_histogram.snapshot(),
+            "detection_seconds": self.detection_histogram.snapshot()
+        }
@@ -0,0 +1,112 @@
+"""
+Caché de reportes
+=================
+Guarda el último cuerpo ya codificado de un reporte por parámetro (p. ej. el
+`limit` del reporte TOON) junto con su ETag y el estado de los datos con el
+que se generó. Las peticiones se sirven desde memoria; un refresco periódico
+compara el estado actual (una consulta barata) con el de cada entrada y sólo
+regenera las que quedaron desactualizadas. Peticiones simultáneas por una
+entrada que falta comparten una sola generación.
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+
+# Ejecuta una función bloqueante fuera del event loop (asyncio.to_thread, WorkerPool.run, ...)
+Runner = Callable[..., Awaitable]
+
+class CachedReport(NamedTuple):
+    body: bytes
+    etag: str
+    state: Hashable
+    built_at: float
+
+def make_etag(body: bytes) -> str:
+    """ETag fuerte: hash del contenido"""
+    return f'"{hashlib.sha1(body).hexdigest()}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Evaluar un encabezado If-None-Match (lista de ETags, débiles incluidos, o *)"""
+    if not if_none_match:
+        return False
+    candidates = [candidate.strip() for candidate in if_none_match.split(',')]
+    return '*' in candidates or any(candidate.removeprefix('W/') == etag for candidate in candidates)
+
+class ReportCache:
+    """
+    Reportes codificados por clave, regenerados cuando cambia el estado de los datos
+
+    `state()` devuelve un valor comparable que cambia cuando el reporte puede
+    haber cambiado y `build(key)` genera el cuerpo junto con el estado que
+    refleja (el generador sabe mejor qué datos leyó). Ambos son bloqueantes y
+    se ejecutan con `run`.
+    """
+
+    def __init__(self, build: Callable[[Hashable], Tuple[Hashable, bytes]], state: Callable[[], Hashable],
+                 max_entries: int, run: Runner = asyncio.to_thread):
+        self.build = build
+        self.state = state
+        self.max_entries = max(int(max_entries), 1)
+        self.run = run
+        self._entries: 'OrderedDict[Hashable, CachedReport]' = OrderedDict()
+        self._building: Dict[Hashable, asyncio.Future] = {}
+        self.hits = 0
+        self.builds = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def get(self, key: Hashable) -> CachedReport:
+        """Reporte desde memoria o, si no está, generado ahora (una vez aunque lo pidan varios)"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        return await self._rebuild(key)
+
+    async def refresh(self) -> int:
+        """Regenerar las entradas cuyo estado cambió; devuelve cuántas se regeneraron"""
+        if not self._entries:
+            return 0
+        state = await self.run(self.state)
+        stale = [key for key, entry in self._entries.items() if entry.state != state]
+        for key in stale:
+            await self._rebuild(key)
+        return len(stale)
+
+    async def _rebuild(self, key: Hashable) -> CachedReport:
+        pending = self._building.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        pending = asyncio.get_running_loop().create_future()
+        self._building[key] = pending
+        try:
+            state, body = await self.run(self.build, key)
+            self.builds += 1
+            entry = CachedReport(body, make_etag(body), state, time.time())
+            self._store(key, entry)
+            pending.set_result(entry)
+            return entry
+        except asyncio.CancelledError:
+            pending.cancel()
+            raise
+        except Exception as e:
+            pending.set_exception(e)
+            pending.exception()  # Marcada como leída si nadie más la esperaba
+            raise
+        finally:
+            del self._building[key]
+
+    def _store(self, key: Hashable, entry: CachedReport):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "hits": self.hits, "builds": self.builds}
@@ -0,0 +1,108 @@
+"""
+Serialización de resultados por columnas
+========================================
+Convierte las transacciones marcadas de un análisis masivo en listas de
+valores Python nativos columna por columna (un cast vectorizado por columna,
+sin `iterrows`) y las escribe como bytes JSON o NDJSON. Con `orjson` instalado
+se usa para codificar; si no (p. ej. ppc64le sin wheel), `json` de la
+biblioteca estándar con la misma salida compacta.
+
+Dos formas de entregar las filas:
+    registros   [{"id": 1, "monto": ...}, ...] (la respuesta histórica)
+    columnar    {"columns": ["id", "monto", ...], "rows": [[1, ...], ...]}
+"""
+
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:  # Dependencia opcional
+    orjson = None
+
+# Campos de cada transacción marcada: nombre en la respuesta -> (columna, tipo)
+FLAGGED_FIELDS: Dict[str, Tuple[str, str]] = {
+    'id': ('id', 'int'),
+    'cuenta_origen_id': ('cuenta_origen_id', 'nullable_int'),
+    'cuenta_destino_id': ('cuenta_destino_id', 'nullable_int'),
+    'monto': ('monto', 'float'),
+    'comerciante': ('comerciante', 'str'),
+    'ubicacion': ('ubicacion', 'str'),
+    'tipo_tarjeta': ('tipo_tarjeta', 'str'),
+    'fecha_transaccion': ('fecha_transaccion', 'str'),
+    'horario_transaccion': ('horario_transaccion', 'str'),
+    'probabilidad_fraude': ('probabilidad_fraude', 'float'),
+    'nivel_riesgo': ('nivel_riesgo', 'str'),
+    'prediccion': ('prediccion', 'str'),
+    'es_fraude_real': ('es_fraude', 'bool'),  # Para comparación
+}
+
+def _with_nulls(values: List[Any], missing: np.ndarray) -> List[Any]:
+    for position in np.flatnonzero(missing).tolist():
+        values[position] = None
+    return values
+
+def _ints(series: pd.Series) -> List[int]:
+    return pd.to_numeric(series).to_numpy(dtype=np.int64).tolist()
+
+def _nullable_ints(series: pd.Series) -> List[Optional[int]]:
+    numbers = pd.to_numeric(series, errors='coerce')
+    missing = numbers.isna().to_numpy()
+    return _with_nulls(numbers.fillna(0).to_numpy(dtype=np.int64).tolist(), missing)
+
+def _floats(series: pd.Series) -> List[Optional[float]]:
+    numbers = pd.to_numeric(series, errors='coerce').to_numpy(dtype=np.float64)
+    return _with_nulls(numbers.tolist(), np.isnan(numbers))
+
+def _strings(series: pd.Series) -> List[Optional[str]]:
+    # Un str() por valor distinto (fechas, horarios y códigos se repiten mucho);
+    # el código -1 (nulo) toma el último elemento, None
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+    else:
+        codes, uniques = pd.factorize(series)
+    labels = [str(value) for value in uniques] + [None]
+    return [labels[code] for code in codes.tolist()]
+
+def _bools(series: pd.Series) -> List[bool]:
+    return series.fillna(False).to_numpy(dtype=bool).tolist()
+
+_CASTS = {'int': _ints, 'nullable_int': _nullable_ints, 'float': _floats, 'str': _strings, 'bool': _bools}
+
+def flagged_columns(df: pd.DataFrame, rule_ids: Optional[List[List[int]]] = None) -> Dict[str, List[Any]]:
+    """Columnas de las transacciones marcadas como listas de valores nativos (nulos como None)"""
+    columns = {name: _CASTS[kind](df[column]) for name, (column, kind) in FLAGGED_FIELDS.items()}
+    columns['reglas_activadas'] = rule_ids if rule_ids is not None else [[] for _ in range(len(df))]
+    return columns
+
+def to_records(columns: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+    """Una lista de diccionarios (la forma de `resultados` por defecto)"""
+    names = list(columns)
+    return [dict(zip(names, row)) for row in zip(*columns.values())]
+
+def to_columnar(columns: Dict[str, List[Any]]) -> Dict[str, Any]:
+    """{"columns": nombres, "rows": filas como listas}: los nombres no se repiten por fila"""
+    return {'columns': list(columns), 'rows': list(zip(*columns.values()))}
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+def dumps(payload: Any) -> bytes:
+    """JSON compacto en UTF-8"""
+    if orjson is not None:
+        return orjson.dumps(payload, default=_json_default, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=_json_default).encode('utf-8')
+
+def to_ndjson(columns: Dict[str, List[Any]], prefix: Optional[Dict[str, Any]] = None) -> bytes:
+    """Una línea JSON por fila (con los campos de `prefix` primero), terminada en salto de línea"""
+    if not columns or not len(next(iter(columns.values()))):
+        return b""
+    names = list((prefix or {}).keys()) + list(columns)
+    fixed = tuple((prefix or {}).values())
+    lines = [dumps(dict(zip(names, fixed + row))) for row in zip(*columns.values())]
+    return b"\n".join(lines) + b"\n"
@@ -0,0 +1,78 @@
+"""
+Ranking de transacciones por riesgo
+===================================
+Orden de los resultados de los análisis masivos: probabilidad de fraude
+descendente y, a igual probabilidad, id ascendente (el mismo orden que el
+índice idx_puntuaciones_version_probabilidad). Con puntuaciones guardadas la
+página se lee de ese índice con LIMIT; sin ellas se puntúa la tabla y se eligen
+las N filas con `np.argpartition` en lugar de ordenar todas las marcadas. En
+ambos casos el costo de ordenar y serializar depende de N y no de la tabla.
+
+La paginación es por cursor (keyset): el cursor identifica la última fila de
+una página, (probabilidad, id), y la página siguiente empieza justo después en
+ese orden, sin OFFSET. El cursor lleva además la versión del modelo que
+produjo esas probabilidades: con otra versión el orden es otro y se rechaza.
+"""
+
+import base64
+from typing import Optional, Tuple
+
+import numpy as np
+
+# Última fila de una página: (probabilidad_fraude, id de la transacción)
+Cursor = Tuple[float, int]
+
+class StaleCursorError(ValueError):
+    """El cursor es de otra versión del modelo: hay que volver a pedir la primera página"""
+
+def encode_cursor(probability: float, transaction_id: int, version: str) -> str:
+    """Cursor opaco de la fila (repr conserva la probabilidad exacta)"""
+    raw = f"{float(probability)!r}:{int(transaction_id)}:{version}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor: str, version: Optional[str] = None) -> Cursor:
+    """
+    Inverso de `encode_cursor`; ValueError si el cursor no es válido
+
+    Con `version`, StaleCursorError si el cursor es de otra versión del modelo.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        probability, transaction_id, cursor_version = raw.split(':', 2)
+        after = float(probability), int(transaction_id)
+    except Exception as e:
+        raise ValueError(f"cursor inválido: {cursor!r}") from e
+    if version is not None and cursor_version != version:
+        raise StaleCursorError(
+            f"el cursor es de la versión {cursor_version} del modelo y la versión en servicio es {version}: "
+            f"pedir de nuevo la primera página"
+        )
+    return after
+
+def top_risk_positions(probabilities: np.ndarray, ids: np.ndarray, min_probability: float,
+                       limit: Optional[int] = None, after: Optional[Cursor] = None) -> Tuple[np.ndarray, int]:
+    """
+    Posiciones de las filas a devolver, en orden de riesgo, y cuántas quedan después
+
+    Filtra por `min_probability` y por el cursor `after`; con `limit` selecciona
+    las `limit` más riesgosas en O(n) y ordena sólo esas (más los empates en el
+    borde, para que el desempate por id sea determinista).
+    """
+    selected = probabilities >= min_probability
+    if after is not None:
+        after_probability, after_id = after
+        selected &= (probabilities < after_probability) | ((probabilities == after_probability) & (ids > after_id))
+    positions = np.flatnonzero(selected)
+
+    remaining = 0
+    if limit is not None and len(positions) > limit:
+        remaining = len(positions) - limit
+        candidates = probabilities[positions]
+        # Las `limit` más altas (sin orden) fijan el umbral; los empates en el borde se desempatan por id
+        top = np.argpartition(candidates, len(candidates) - limit)[len(candidates) - limit:]
+        positions = positions[candidates >= candidates[top].min()]
+
+    order = np.lexsort((ids[positions], -probabilities[positions]))
+    if limit is not None:
+        order = order[:limit]
+    return positions[order], remaining
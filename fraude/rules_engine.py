@@ -0,0 +1,191 @@
+"""
+Motor de reglas de `reglas_fraude`
+==================================
+Compila cada regla activa (su `condicion` JSONB) a un predicado vectorizado
+sobre el lote completo y a un predicado escalar para la predicción individual.
+Todas las reglas se evalúan en una pasada: el resultado es una matriz
+(filas x reglas) de coincidencias y una puntuación por fila que combina los
+pesos de las reglas activadas como noisy-or, 1 - Π(1 - peso).
+
+Claves de condición soportadas (varias en una regla se combinan con AND):
+    monto_minimo         monto >= valor
+    horario_riesgo       "nocturno": hora >= 22 o <= 6 (como is_night)
+    horario_inicio/fin   "HH:MM": minuto del día en [inicio, fin), cruzando medianoche si fin < inicio
+    comerciantes_riesgo  lista de códigos de comerciante
+    paises_riesgo        lista de países
+    distancia_minima     distancia_ubicacion_usual >= valor
+    comerciante_nuevo    true: el comerciante no está en `comerciantes`
+
+Una regla con una clave desconocida no se compila (se informa en el log y en
+`info()`), en lugar de evaluarse a medias.
+"""
+
+import json
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Peso máximo efectivo: un peso 1.0 haría log(0) en la combinación
+_MAX_WEIGHT = 1 - 1e-9
+
+class RuleInputs(NamedTuple):
+    """Columnas que leen los predicados (arreglos de un lote o escalares de una transacción)"""
+    monto: Any
+    minute_of_day: Any
+    comerciante: Any
+    pais: Any
+    distancia: Any
+    comerciante_registrado: Any
+
+VectorPredicate = Callable[[RuleInputs], np.ndarray]
+ScalarPredicate = Callable[[RuleInputs], bool]
+
+def _parse_minute_of_day(value: str) -> int:
+    hour, minute = str(value).split(':')[:2]
+    return int(hour) * 60 + int(minute)
+
+def _minute_window(start: int, end: int) -> Tuple[VectorPredicate, ScalarPredicate]:
+    if start <= end:
+        return (lambda x: (x.minute_of_day >= start) & (x.minute_of_day < end),
+                lambda x: start <= x.minute_of_day < end)
+    return (lambda x: (x.minute_of_day >= start) | (x.minute_of_day < end),
+            lambda x: x.minute_of_day >= start or x.minute_of_day < end)
+
+def _compile_condition(condition: Dict[str, Any]) -> List[Tuple[VectorPredicate, ScalarPredicate]]:
+    """Un par (vectorizado, escalar) por clave de la condición; ValueError si hay claves no soportadas"""
+    condition = dict(condition)
+    predicates = []
+
+    if 'horario_inicio' in condition or 'horario_fin' in condition:
+        start = _parse_minute_of_day(condition.pop('horario_inicio', '00:00'))
+        end = _parse_minute_of_day(condition.pop('horario_fin', '24:00'))
+        predicates.append(_minute_window(start, end))
+
+    for key, value in condition.items():
+        if key == 'monto_minimo':
+            threshold = float(value)
+            predicates.append((lambda x, t=threshold: x.monto >= t, lambda x, t=threshold: x.monto >= t))
+        elif key == 'distancia_minima':
+            threshold = float(value)
+            predicates.append((lambda x, t=threshold: x.distancia >= t, lambda x, t=threshold: x.distancia >= t))
+        elif key == 'horario_riesgo' and value == 'nocturno':
+            predicates.append(_minute_window(22 * 60, 7 * 60))
+        elif key == 'comerciantes_riesgo':
+            codes = frozenset(map(str, value))
+            predicates.append((lambda x, c=codes: x.comerciante.isin(c).to_numpy(),
+                               lambda x, c=codes: x.comerciante in c))
+        elif key == 'paises_riesgo':
+            countries = frozenset(map(str, value))
+            predicates.append((lambda x, c=countries: x.pais.isin(c).to_numpy(),
+                               lambda x, c=countries: x.pais in c))
+        elif key == 'comerciante_nuevo':
+            expected = not bool(value)
+            predicates.append((lambda x, e=expected: x.comerciante_registrado == e,
+                               lambda x, e=expected: x.comerciante_registrado == e))
+        else:
+            raise ValueError(f"condición no soportada: {key}={value!r}")
+
+    if not predicates:
+        raise ValueError("condición vacía")
+    return predicates
+
+class CompiledRule(NamedTuple):
+    id: int
+    nombre: str
+    descripcion: str
+    peso: float
+    predicates: List[Tuple[VectorPredicate, ScalarPredicate]]
+
+class RuleMatches:
+    """Coincidencias de un lote: matriz (filas x reglas) y puntuación noisy-or por fila"""
+
+    def __init__(self, rules: Sequence[CompiledRule], matrix: np.ndarray, log_complements: np.ndarray):
+        self.rules = rules
+        self.matrix = matrix
+        self.score = -np.expm1(matrix.astype(np.float64) @ log_complements) if len(rules) else np.zeros(len(matrix))
+
+    def ids_per_row(self) -> List[List[int]]:
+        """Ids de las reglas activadas en cada fila"""
+        return self._per_row([rule.id for rule in self.rules])
+
+    def reasons_per_row(self) -> List[List[str]]:
+        """Descripción legible de las reglas activadas en cada fila"""
+        return self._per_row([RulesEngine.describe(rule) for rule in self.rules])
+
+    def _per_row(self, values: List[Any]) -> List[List[Any]]:
+        # Coincidencias en orden de fila: cada fila es un tramo contiguo de la lista plana
+        rows, columns = np.nonzero(self.matrix)
+        flat = [values[column] for column in columns.tolist()]
+        bounds = np.searchsorted(rows, np.arange(len(self.matrix) + 1)).tolist()
+        return [flat[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+
+class RulesEngine:
+    """Reglas compiladas; `load` reemplaza el conjunto completo de una vez"""
+
+    def __init__(self):
+        self._state: Tuple[Tuple[CompiledRule, ...], np.ndarray] = ((), np.empty(0))
+        self.skipped: Dict[str, str] = {}
+        self.loaded_at: Optional[str] = None
+
+    def __len__(self) -> int:
+        return len(self._state[0])
+
+    @property
+    def rules(self) -> Tuple[CompiledRule, ...]:
+        return self._state[0]
+
+    def load(self, rows: pd.DataFrame):
+        """Compilar las filas de `reglas_fraude` (id, nombre, descripcion, condicion, peso)"""
+        compiled, skipped = [], {}
+        for row in rows.itertuples(index=False):
+            try:
+                condition = row.condicion if isinstance(row.condicion, dict) else json.loads(row.condicion)
+                predicates = _compile_condition(condition)
+            except Exception as e:
+                skipped[row.nombre] = str(e)
+                logger.warning(f"⚠️ Regla '{row.nombre}' ignorada: {e}")
+                continue
+            weight = min(max(float(row.peso if row.peso is not None else 0.5), 0.0), _MAX_WEIGHT)
+            compiled.append(CompiledRule(int(row.id), row.nombre, row.descripcion or row.nombre, weight, predicates))
+
+        # Un solo estado nuevo: los lectores ven el conjunto anterior o el nuevo completo
+        log_complements = np.log1p(-np.array([rule.peso for rule in compiled], dtype=np.float64))
+        self._state = (tuple(compiled), log_complements)
+        self.skipped = skipped
+        self.loaded_at = datetime.now().isoformat()
+
+    def evaluate(self, inputs: RuleInputs, n_rows: int) -> RuleMatches:
+        """Evaluar todas las reglas sobre un lote"""
+        rules, log_complements = self._state
+        matrix = np.ones((n_rows, len(rules)), dtype=bool)
+        for column, rule in enumerate(rules):
+            for vector_predicate, _ in rule.predicates:
+                matrix[:, column] &= np.asarray(vector_predicate(inputs), dtype=bool)
+        return RuleMatches(rules, matrix, log_complements)
+
+    def evaluate_one(self, inputs: RuleInputs) -> Tuple[List[CompiledRule], float]:
+        """Reglas activadas y puntuación noisy-or de una transacción"""
+        matched = [
+            rule for rule in self._state[0]
+            if all(scalar_predicate(inputs) for _, scalar_predicate in rule.predicates)
+        ]
+        complement = 1.0
+        for rule in matched:
+            complement *= 1 - rule.peso
+        return matched, 1 - complement
+
+    @staticmethod
+    def describe(rule: CompiledRule) -> str:
+        return f"Regla '{rule.nombre}': {rule.descripcion}"
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "reglas": [{"id": rule.id, "nombre": rule.nombre, "peso": rule.peso} for rule in self.rules],
+            "ignoradas": self.skipped,
+            "cargadas": self.loaded_at
+        }
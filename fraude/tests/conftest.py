@@ -0,0 +1,61 @@
+"""
+Fixtures compartidas de los tests del servicio de fraude
+
+app.py crea `models/` en el directorio actual al importarse, así que los
+tests corren desde un directorio temporal. No requieren base de datos.
+"""
+
+import os
+import sys
+import tempfile
+from datetime import date, time, timedelta
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.chdir(tempfile.mkdtemp(prefix="fraude-tests-"))
+
+import app  # noqa: E402
+
+MERCHANTS = pd.DataFrame({
+    'codigo_comerciante': [f'COM{i:03d}' for i in range(1, 21)],
+    'nivel_riesgo': ['bajo', 'medio', 'alto', 'medio'] * 5,
+    'categoria': ['Retail', 'Financiero', 'Casinos', 'E-commerce'] * 5,
+    'tasa_fraude': np.linspace(0.01, 0.2, 20),
+})
+
+def make_transactions(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Transacciones sintéticas con las columnas que devuelve get_all_transactions"""
+    rng = np.random.default_rng(seed)
+    seconds = rng.integers(0, 86400, rows)
+    return pd.DataFrame({
+        'id': np.arange(1, rows + 1),
+        'cuenta_origen_id': rng.integers(1, 200, rows),
+        'monto': np.round(rng.lognormal(8, 1.5, rows), 2),
+        'comerciante': rng.choice(MERCHANTS['codigo_comerciante'], rows),
+        'categoria_comerciante': rng.choice(['Retail', 'Financiero', 'Casinos', 'Varios'], rows),
+        'ubicacion': rng.choice(['Online', 'Centro, CABA', 'Desconocida', 'Norte, CABA'], rows),
+        'ciudad': rng.choice(['Buenos Aires', 'Córdoba', 'Lagos'], rows),
+        'pais': rng.choice(['Argentina', 'Nigeria', 'USA'], rows),
+        'tipo_tarjeta': rng.choice(['Débito', 'Crédito', 'Prepaga'], rows),
+        'canal': rng.choice(['online', 'pos', 'atm'], rows),
+        'horario_transaccion': [time(s // 3600, (s // 60) % 60, s % 60) for s in seconds],
+        'fecha_transaccion': [date(2024, 1, 1) + timedelta(days=int(d)) for d in rng.integers(0, 120, rows)],
+        'es_fraude': rng.random(rows) < 0.08,
+        'monto_cuenta_origen': np.where(rng.random(rows) < 0.1, np.nan, np.round(rng.lognormal(10, 1, rows), 2)),
+        'distancia_ubicacion_usual': np.round(rng.exponential(50, rows), 2),
+    })
+
+@pytest.fixture(scope="session")
+def detector() -> 'app.FraudDetector':
+    """Detector con los artefactos de características ajustados (sin modelo) y las columnas por cuenta"""
+    detector = app.FraudDetector(app.Config())
+    detector.db_manager.merchant_risk.load(MERCHANTS)
+    df = detector.db_manager.with_merchant_risk(make_transactions(5_000))
+    df = detector.add_account_features(df, app.AccountFeatureStore())
+    _, detector.feature_names = detector.feature_engineer.prepare_features(df, fit=True)
+    assert app.ACCOUNT_FEATURE_NAMES[0] in detector.feature_names
+    return detector
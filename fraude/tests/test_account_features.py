@@ -0,0 +1,85 @@
+"""Paridad entre la reproducción vectorizada (entrenamiento) y features_one (en línea) del almacén por cuenta"""
+
+from datetime import time
+
+import numpy as np
+import pytest
+
+from account_features import (
+    FEATURE_NAMES, VARIANCE_RELATIVE_TOLERANCE, AccountFeatureStore, value_bit, value_bits
+)
+
+VARIANCE_COLUMNS = [FEATURE_NAMES.index(name) for name in FEATURE_NAMES if name.startswith('account_amount_var')]
+
+def make_sequence(rows: int, seed: int = 0):
+    """Transacciones en orden de tiempo de pocas cuentas, con montos de magnitudes muy distintas"""
+    rng = np.random.default_rng(seed)
+    accounts = rng.integers(1, 40, rows)
+    timestamps = np.sort(rng.integers(0, 10 * 86400, rows))
+    amounts = np.round(rng.lognormal(8, 2.5, rows), 2)
+    merchants = rng.choice([f'COM{i:03d}' for i in range(30)], rows)
+    countries = rng.choice(['Argentina', 'Nigeria', 'USA', 'Malta'], rows)
+    return accounts, timestamps, amounts, merchants, countries
+
+def replay_online(accounts, timestamps, amounts, merchants, countries) -> np.ndarray:
+    store, online = AccountFeatureStore(), np.empty((len(accounts), len(FEATURE_NAMES)))
+    for row in range(len(accounts)):
+        online[row] = store.features_one(accounts[row], timestamps[row], amounts[row],
+                                         value_bit(merchants[row]), value_bit(countries[row]))
+    return online
+
+def test_replay_matches_online_within_rounding():
+    accounts, timestamps, amounts, merchants, countries = make_sequence(3_000)
+    online = replay_online(accounts, timestamps, amounts, merchants, countries)
+    replayed = AccountFeatureStore().features(accounts, timestamps, amounts, value_bits(merchants), value_bits(countries))
+
+    tolerance = np.maximum(np.abs(replayed), 1.0) * 1e-9
+    # E[x²] de los montos desplazados queda acotado por el cuadrado del mayor monto de la cuenta
+    largest = np.array([amounts[accounts == account].max() for account in accounts])
+    tolerance[:, VARIANCE_COLUMNS] += 2 * VARIANCE_RELATIVE_TOLERANCE * (largest ** 2)[:, None]
+    assert np.all(np.abs(online - replayed) <= tolerance)
+
+def test_single_transaction_window_has_zero_variance():
+    """Una ventana con una sola transacción lejos del desplazamiento de la cuenta: 0 en ambos caminos"""
+    accounts = np.array([7, 7])
+    timestamps = np.array([0, 2 * 86400])      # La primera sólo queda en la ventana de 7 días
+    amounts = np.array([12.5, 30496.07])
+    merchants, countries = np.array(['COM001', 'COM002']), np.array(['Argentina', 'Argentina'])
+
+    online = replay_online(accounts, timestamps, amounts, merchants, countries)
+    store = AccountFeatureStore()
+    store.features(accounts[:1], timestamps[:1], amounts[:1], value_bits(merchants[:1]), value_bits(countries[:1]))
+    replayed = store.features(accounts[1:], timestamps[1:], amounts[1:], value_bits(merchants[1:]),
+                              value_bits(countries[1:]), update=False)
+    np.testing.assert_array_equal(online[1], replayed[0])
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_single_row_sequence_matches_features_one_exactly(seed):
+    accounts, timestamps, amounts, merchants, countries = make_sequence(2_000, seed)
+    store = AccountFeatureStore()
+    store.update(accounts[:-200], timestamps[:-200], amounts[:-200], value_bits(merchants[:-200]), value_bits(countries[:-200]))
+    for row in range(len(accounts) - 200, len(accounts)):
+        single = store.features(accounts[row:row + 1], timestamps[row:row + 1], amounts[row:row + 1],
+                                value_bits(merchants[row:row + 1]), value_bits(countries[row:row + 1]), update=False)
+        online = store.features_one(accounts[row], timestamps[row], amounts[row],
+                                    value_bit(merchants[row]), value_bit(countries[row]), update=False)
+        np.testing.assert_array_equal(single[0], online)
+
+def test_replay_order_does_not_change_account_columns():
+    """Mismo resultado en orden de id y en el de la consulta de entrenamiento (fecha y hora descendentes)"""
+    from conftest import make_transactions
+    from app import ACCOUNT_FEATURE_NAMES, FraudDetector
+
+    df = make_transactions(3_000, seed=5)
+    # Una cuenta con dos transacciones en el mismo minuto: la primera (menor id) no debe ver la segunda
+    df.loc[[10, 11], 'cuenta_origen_id'] = 999
+    df.loc[11, 'fecha_transaccion'] = df.at[10, 'fecha_transaccion']
+    df.loc[[10, 11], 'horario_transaccion'] = [time(14, 30, 10), time(14, 30, 50)]
+    df.loc[[10, 11], 'monto'] = [100.0, 90_000.0]
+    descending = df.sort_values(['fecha_transaccion', 'horario_transaccion'], ascending=False, kind='stable')
+
+    by_id = FraudDetector.add_account_features(df, AccountFeatureStore())
+    by_date = FraudDetector.add_account_features(descending, AccountFeatureStore()).sort_values('id')
+    np.testing.assert_array_equal(by_id[ACCOUNT_FEATURE_NAMES].to_numpy(), by_date[ACCOUNT_FEATURE_NAMES].to_numpy())
+    assert by_id.at[10, 'account_tx_count_1h'] == 0 and by_id.at[10, 'account_amount_mean_1h'] == 0
+    assert by_id.at[11, 'account_tx_count_1h'] == 1
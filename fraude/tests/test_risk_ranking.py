@@ -0,0 +1,64 @@
+"""Orden por riesgo, selección top-N en memoria y cursores de los análisis masivos"""
+
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from risk_ranking import StaleCursorError, decode_cursor, encode_cursor, top_risk_positions
+
+def make_scores(rows: int = 5_000, seed: int = 0):
+    """Probabilidades con muchos empates (como las filas decididas por reglas) e ids desordenados"""
+    rng = np.random.default_rng(seed)
+    probabilities = np.where(rng.random(rows) < 0.05, 0.99, np.round(rng.random(rows), 2))
+    ids = rng.permutation(rows) + 1
+    return probabilities, ids
+
+def full_ranking(probabilities, ids, min_probability):
+    flagged = np.flatnonzero(probabilities >= min_probability)
+    return flagged[np.lexsort((ids[flagged], -probabilities[flagged]))]
+
+def test_cursor_round_trip_keeps_exact_probability():
+    probability = 0.1 + 0.2
+    assert decode_cursor(encode_cursor(probability, 42, 'v20260101_000000'), 'v20260101_000000') == (probability, 42)
+
+def test_cursor_from_another_model_version_is_rejected():
+    cursor = encode_cursor(0.9, 7, 'v1')
+    with pytest.raises(StaleCursorError):
+        decode_cursor(cursor, 'v2')
+    assert decode_cursor(cursor) == (0.9, 7)
+
+@pytest.mark.parametrize("cursor", ["", "no-es-un-cursor", encode_cursor(0.5, 1, 'v1')[:-4]])
+def test_malformed_cursor_is_a_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+@pytest.mark.parametrize("limit", [1, 37, 500])
+def test_pages_walk_the_full_ranking(limit):
+    probabilities, ids = make_scores()
+    expected = full_ranking(probabilities, ids, 0.5)
+
+    walked, after = [], None
+    while True:
+        positions, remaining = top_risk_positions(probabilities, ids, 0.5, limit, after)
+        walked.extend(positions)
+        if not remaining:
+            break
+        after = decode_cursor(encode_cursor(probabilities[positions[-1]], ids[positions[-1]], 'v1'), 'v1')
+    np.testing.assert_array_equal(walked, expected)
+
+def test_incremental_pages_after_the_first_do_not_score():
+    """Con cursor se leen las puntuaciones guardadas sin puntuar lo nuevo (la página no cambia bajo el cursor)"""
+    from app import FraudDetector
+
+    calls = []
+    detector = SimpleNamespace(
+        model_version='v1',
+        score_incremental=lambda: calls.append('score'),
+        _scored_page=lambda *args: calls.append(('page', args[3])) or {},
+    )
+    FraudDetector.predict_database_incremental(detector, limit=10)
+    FraudDetector.predict_database_incremental(detector, limit=10, cursor=encode_cursor(0.8, 3, 'v1'))
+    assert calls == ['score', ('page', None), ('page', (0.8, 3))]
+    with pytest.raises(StaleCursorError):
+        FraudDetector.predict_database_incremental(detector, limit=10, cursor=encode_cursor(0.8, 3, 'v0'))
@@ -0,0 +1,99 @@
+"""Paridad de SingleRowFeatureBuilder.build con prepare_features(fit=False), fila por fila"""
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import app
+
+BASE_TRANSACTION = {
+    'monto': 1500.0,
+    'comerciante': 'COM001',
+    'ubicacion': 'Online',
+    'tipo_tarjeta': 'Crédito',
+    'horario_transaccion': '14:30:00',
+    'cuenta_origen_id': 17,
+    'categoria_comerciante': 'Retail',
+    'ciudad': 'Buenos Aires',
+    'pais': 'Argentina',
+    'canal': 'online',
+}
+
+def assert_parity(detector, transaction, account_values=None):
+    """La fila del builder es idéntica (en float32) a la de prepare_features"""
+    record = detector._with_single_defaults(transaction)
+    record.update(zip(app.ACCOUNT_FEATURE_NAMES, account_values if account_values is not None
+                      else np.zeros(len(app.ACCOUNT_FEATURE_NAMES))))
+    builder = app.SingleRowFeatureBuilder(detector.feature_engineer, detector.feature_names)
+
+    expected, names = detector.feature_engineer.prepare_features(pd.DataFrame([record]), fit=False)
+    actual = builder.build(record)
+
+    assert names == detector.feature_names
+    np.testing.assert_array_equal(actual, expected.astype(np.float32))
+
+def test_regular_transaction(detector):
+    assert_parity(detector, BASE_TRANSACTION)
+
+@pytest.mark.parametrize("overrides", [
+    {'comerciante': 'COM999'},
+    {'tipo_tarjeta': 'Virtual'},
+    {'pais': 'Malta', 'ciudad': 'Springfield'},
+    {'canal': 'kiosco', 'ubicacion': 'Rosario'},
+    {'categoria_comerciante': 'Criptomonedas'},
+], ids=['comerciante', 'tipo_tarjeta', 'pais_ciudad', 'canal_ubicacion', 'categoria'])
+def test_unseen_categories(detector, overrides):
+    assert_parity(detector, {**BASE_TRANSACTION, **overrides})
+
+@pytest.mark.parametrize("missing", [
+    ('ciudad', 'pais', 'canal'),
+    ('categoria_comerciante',),
+    ('cuenta_origen_id',),
+], ids=['ubicacion', 'categoria', 'cuenta'])
+def test_missing_optional_fields(detector, missing):
+    """Los campos opcionales omitidos toman los valores por defecto de TransactionInput, como en la API"""
+    transaction = app.TransactionInput(**{key: value for key, value in BASE_TRANSACTION.items() if key not in missing})
+    assert_parity(detector, transaction.model_dump())
+
+@pytest.mark.parametrize("missing", ['ciudad', 'pais', 'canal', 'categoria_comerciante', 'cuenta_origen_id'])
+def test_null_optional_fields(detector, missing):
+    assert_parity(detector, {**BASE_TRANSACTION, missing: None})
+
+@pytest.mark.parametrize("fecha, horario", [
+    (date(2024, 3, 1), '00:00:00'),   # Viernes, medianoche
+    (date(2024, 3, 1), '23:59:59'),
+    (date(2024, 3, 2), '00:00:00'),   # Sábado
+    (date(2024, 3, 3), '23:59:59'),   # Domingo, último segundo del fin de semana
+    (date(2024, 3, 4), '00:00:00'),   # Lunes
+    (date(2024, 3, 4), '06:59:59'),   # Límite del horario nocturno
+    (date(2024, 3, 4), '07:00:00'),
+    (date(2024, 3, 4), '22:00:00'),
+])
+def test_midnight_and_weekend_boundaries(detector, fecha, horario):
+    assert_parity(detector, {**BASE_TRANSACTION, 'fecha_transaccion': fecha, 'horario_transaccion': horario})
+
+@pytest.mark.parametrize("horario", ['25:00:00', '7:5', 'tarde', '23:59:59.999'])
+def test_malformed_times(detector, horario):
+    assert_parity(detector, {**BASE_TRANSACTION, 'horario_transaccion': horario})
+
+@pytest.mark.parametrize("monto", [0.01, 5_000_000.0])
+def test_extreme_amounts(detector, monto):
+    assert_parity(detector, {**BASE_TRANSACTION, 'monto': monto})
+
+def test_account_feature_columns(detector):
+    """Las columnas por cuenta llegan del almacén en línea, como en prepare_single"""
+    store = app.AccountFeatureStore()
+    transaction = {**BASE_TRANSACTION, 'fecha_transaccion': date(2024, 3, 4)}
+    for minute in range(0, 50, 7):
+        record = {**transaction, 'horario_transaccion': f'14:{minute:02d}:00', 'monto': 100.0 + minute}
+        values = store.features_one(
+            17, app.transaction_timestamp(record), record['monto'],
+            app.value_bit(record['comerciante']), app.value_bit(record['pais'])
+        )
+        assert_parity(detector, record, values)
+
+def test_account_feature_columns_missing(detector):
+    """Sin valores por cuenta (NaN) se rellenan con las medianas de entrenamiento en ambos caminos"""
+    assert_parity(detector, BASE_TRANSACTION, np.full(len(app.ACCOUNT_FEATURE_NAMES), np.nan))
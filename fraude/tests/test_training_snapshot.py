@@ -0,0 +1,81 @@
+"""Refrescos del snapshot de entrenamiento con ids que confirman fuera de orden"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from training_snapshot import TrainingSnapshot
+
+def make_table(rows: int, seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'id': np.arange(1, rows + 1, dtype=np.int32),
+        'monto': np.round(rng.lognormal(8, 1.5, rows), 2),
+        'pais': pd.Categorical(rng.choice(['Argentina', 'Nigeria', 'USA'], rows)),
+        'fecha_transaccion': pd.Categorical(rng.choice(['2024-03-01', '2024-03-02', '2024-03-03'], rows)),
+        'horario_transaccion': pd.Categorical([f'{h:02d}:00:00' for h in rng.integers(0, 24, rows)]),
+        'es_fraude': rng.random(rows) < 0.1,
+    })
+
+class Table:
+    """Tabla de origen en la que sólo algunas filas están confirmadas"""
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.visible = np.zeros(len(df), dtype=bool)
+
+    def fetch(self, since_id: int) -> pd.DataFrame:
+        rows = self.df[self.visible & (self.df['id'] > since_id).to_numpy()]
+        return rows.reset_index(drop=True)
+
+@pytest.fixture
+def table():
+    return Table(make_table(3_000))
+
+def test_late_commits_inside_lookback_are_added_once(tmp_path, table):
+    snapshot = TrainingSnapshot(str(tmp_path))
+    table.visible[:1_000] = True
+    table.visible[[990, 995]] = False      # Confirman después que ids mayores
+    snapshot.refresh(table.fetch, lookback=100)
+
+    table.visible[:2_000] = True
+    added = snapshot.refresh(table.fetch, lookback=100)
+
+    ids = snapshot.load()['id'].to_numpy()
+    assert added == 1_002
+    assert len(ids) == len(np.unique(ids)) == 2_000
+    assert {991, 996} <= set(ids.tolist())
+
+def test_late_commits_beyond_lookback_are_lost_until_rebuild(tmp_path, table):
+    snapshot = TrainingSnapshot(str(tmp_path))
+    table.visible[:1_000] = True
+    table.visible[10] = False
+    snapshot.refresh(table.fetch, lookback=100)
+    table.visible[10] = True
+    assert snapshot.refresh(table.fetch, lookback=100) == 0
+    assert snapshot.refresh(table.fetch, rebuild=True) == 1_000
+
+def test_take_matches_concatenated_segments(tmp_path, table):
+    snapshot = TrainingSnapshot(str(tmp_path), max_segments=100)
+    for end in (700, 1_500, 2_200, 3_000):
+        table.visible[:end] = True
+        table.visible[end - 5:end - 2] = False
+        snapshot.refresh(table.fetch, lookback=50)
+    table.visible[:] = True
+    snapshot.refresh(table.fetch, lookback=50)
+    assert len(snapshot.manifest['segments']) == 5
+
+    # Concatenar los segmentos y ordenar con pandas da lo mismo que tomar en ese orden
+    concatenated = pd.concat([snapshot.take(np.arange(start, start + segment['rows']))
+                              for start, segment in zip(np.cumsum([0] + [s['rows'] for s in snapshot.manifest['segments']]),
+                                                        snapshot.manifest['segments'])], ignore_index=True)
+    expected = concatenated.sort_values(['fecha_transaccion', 'horario_transaccion'], ascending=False, kind='stable')
+    keys = pd.DataFrame({name: snapshot.column(name) for name in ('fecha_transaccion', 'horario_transaccion')})
+    order = keys.sort_values(list(keys.columns), ascending=False, kind='stable').index.to_numpy()
+    pd.testing.assert_frame_equal(snapshot.take(order), expected.reset_index(drop=True))
+
+    snapshot.compact()
+    compacted = snapshot.load()
+    assert len(snapshot.manifest['segments']) == 1
+    assert compacted['id'].is_monotonic_increasing
+    pd.testing.assert_frame_equal(compacted, table.df.astype({'pais': compacted['pais'].dtype}), check_categorical=False)
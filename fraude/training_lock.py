@@ -0,0 +1,62 @@
+"""
+Lock de entrenamiento compartido entre workers
+==============================================
+Con varios workers de uvicorn cada proceso ejecuta su propio `startup_event`
+y tiene su propio gestor de reentrenamientos. Un `flock` exclusivo sobre un
+archivo en MODEL_PATH asegura que sólo un proceso entrene a la vez: los demás
+esperan (al arrancar) o reciben un rechazo (al pedir un reentrenamiento) y
+cargan la versión publicada en modo sólo lectura.
+
+El kernel libera el lock si el proceso que lo tiene muere, así que no quedan
+locks huérfanos tras un reinicio.
+"""
+
+import fcntl
+import os
+from typing import IO, Optional
+
+class TrainingLock:
+    """Lock exclusivo entre procesos basado en flock"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[IO] = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self, blocking: bool = True) -> bool:
+        """Tomar el lock; con `blocking=False` devuelve False si otro proceso lo tiene"""
+        if self._file is not None:
+            raise RuntimeError(f"El lock {self.path} ya está tomado por esta instancia")
+
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        lock_file = open(self.path, 'a+')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+
+        # Dejar el pid del dueño para diagnóstico (no se usa para decidir nada)
+        lock_file.seek(0)
+        lock_file.truncate()
+        lock_file.write(str(os.getpid()))
+        lock_file.flush()
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        fcntl.flock(self._file, fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+    def __enter__(self) -> 'TrainingLock':
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
@@ -0,0 +1,248 @@
+"""
+Snapshot columnar local de los datos de entrenamiento
+=====================================================
+Guarda en disco (bajo models/) las columnas que usa el entrenamiento como
+archivos .npy por segmento, con las categóricas como códigos int32 y un
+diccionario de categorías compartido. El snapshot registra el id máximo que
+contiene: cada refresco sólo trae de la base las transacciones con id mayor
+(más `lookback` ids por debajo, por si alguna transacción confirmó después de
+otra con id mayor; las que ya estaban se descartan) y las agrega como un
+segmento nuevo. Cada segmento queda ordenado por id. Al entrenar, los
+segmentos se abren con memory-map en lugar de volver a consultar PostgreSQL, y
+`take` copia las filas pedidas directamente en el orden final: una sola copia
+en memoria, sin concatenar los segmentos antes de ordenar.
+
+Las actualizaciones de filas ya copiadas (p. ej. una etiqueta es_fraude
+corregida tras una investigación) no se detectan: para recogerlas hay que
+reconstruir el snapshot (`rebuild=True`).
+"""
+
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+
+# Devuelve las transacciones con id > since_id ordenadas por id
+Fetcher = Callable[[int], pd.DataFrame]
+
+class TrainingSnapshot:
+    """Snapshot append-only de transacciones en formato columnar .npy"""
+
+    def __init__(self, directory: str, max_segments: int = 16):
+        self.directory = directory
+        self.max_segments = max(max_segments, 1)
+        self.manifest = self._read_manifest()
+
+    @property
+    def max_id(self) -> int:
+        return self.manifest['max_id'] if self.manifest else 0
+
+    @property
+    def rows(self) -> int:
+        return sum(segment['rows'] for segment in self.manifest['segments']) if self.manifest else 0
+
+    def info(self) -> Dict[str, Any]:
+        """Resumen del snapshot para logs y respuestas de la API"""
+        return {
+            'rows': self.rows,
+            'max_id': self.max_id,
+            'segments': len(self.manifest['segments']) if self.manifest else 0,
+            'updated_at': self.manifest['updated_at'] if self.manifest else None
+        }
+
+    def refresh(self, fetch: Fetcher, rebuild: bool = False, lookback: int = 0) -> int:
+        """Traer las transacciones posteriores al id máximo (menos `lookback`) que falten y agregarlas como segmento"""
+        if rebuild:
+            self.clear()
+
+        since_id = max(self.max_id - lookback, 0) if self.manifest else 0
+        new_rows = fetch(since_id)
+        if len(new_rows) and self.manifest:
+            new_rows = new_rows[~np.isin(new_rows['id'].to_numpy(), self._ids_above(since_id))]
+        if len(new_rows) == 0:
+            logger.info(f"📦 Snapshot de entrenamiento al día ({self.rows} filas, id máximo {self.max_id})")
+            return 0
+
+        # Trabajar sobre una copia: el manifiesto en memoria sólo cambia al confirmar
+        manifest = json.loads(json.dumps(self.manifest)) if self.manifest else self._empty_manifest(new_rows)
+        if list(new_rows.columns) != list(manifest['columns']):
+            # Cambió el conjunto de columnas de entrenamiento: empezar de cero
+            logger.warning("⚠️ Columnas del snapshot distintas a las actuales, reconstruyendo...")
+            self.clear()
+            return self.refresh(fetch, lookback=lookback)
+
+        if not new_rows['id'].is_monotonic_increasing:
+            new_rows = new_rows.sort_values('id', kind='stable')
+        segment = self._write_segment(manifest, new_rows)
+        manifest['segments'].append(segment)
+        manifest['max_id'] = max(manifest['max_id'], segment['max_id'])
+        self._commit(manifest)
+
+        if len(manifest['segments']) > self.max_segments:
+            self.compact()
+
+        logger.info(f"📦 Snapshot de entrenamiento: +{len(new_rows)} filas (total {self.rows}, id máximo {self.max_id})")
+        return len(new_rows)
+
+    def load(self) -> pd.DataFrame:
+        """Abrir el snapshot con memory-map y devolverlo como DataFrame (sin copiar si tiene un solo segmento)"""
+        return self.take()
+
+    def column(self, name: str) -> Union[np.ndarray, pd.Categorical]:
+        """Una columna completa, en el orden de los segmentos (p. ej. las claves para ordenar o filtrar)"""
+        return self._decode(name, self._gather(name, self._segment_parts(None)))
+
+    def take(self, positions: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """
+        Filas en las posiciones dadas (de la concatenación de los segmentos) y en ese orden
+
+        Cada columna se copia una sola vez, de los memory-maps al arreglo final.
+        Sin `positions` devuelve todas las filas; con un solo segmento, sin copiar.
+        """
+        parts = self._segment_parts(positions)
+        return pd.DataFrame({name: self._decode(name, self._gather(name, parts)) for name in self.manifest['columns']})
+
+    def compact(self):
+        """Unir todos los segmentos en uno solo, ordenado por id"""
+        df = self.take(np.argsort(self.column('id'), kind='stable'))
+        manifest = {**self.manifest, 'segments': []}
+        manifest['segments'].append(self._write_segment(manifest, df, encode=False))
+        old_segments = [segment['name'] for segment in self.manifest['segments']]
+        self._commit(manifest)
+
+        for name in old_segments:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+        logger.info(f"🗜️ Snapshot compactado en un segmento ({self.rows} filas)")
+
+    def clear(self):
+        """Eliminar el snapshot completo"""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        self.manifest = None
+
+    def _segment_parts(self, positions: Optional[np.ndarray]) -> List[tuple]:
+        """(segmento, filas del segmento, posiciones en el resultado) de cada segmento que aporta filas"""
+        if not self.manifest:
+            raise ValueError("Snapshot de entrenamiento vacío")
+
+        segments = self.manifest['segments']
+        starts = np.cumsum([0] + [segment['rows'] for segment in segments])
+        if positions is None:
+            return [(segment['name'], slice(None), slice(start, end))
+                    for segment, start, end in zip(segments, starts[:-1], starts[1:])]
+
+        positions = np.asarray(positions, dtype=np.int64)
+        owner = np.searchsorted(starts, positions, side='right') - 1
+        parts = []
+        for index, segment in enumerate(segments):
+            targets = np.flatnonzero(owner == index)
+            if len(targets):
+                parts.append((segment['name'], positions[targets] - starts[index], targets))
+        return parts
+
+    def _gather(self, column: str, parts: List[tuple]) -> np.ndarray:
+        """Copiar las filas de cada segmento (memory-map) a su lugar en un único arreglo"""
+        arrays = [np.load(self._column_path(segment, column), mmap_mode='r') for segment, _, _ in parts]
+        if len(parts) == 1 and isinstance(parts[0][1], slice):
+            return arrays[0]
+        length = sum(len(array) if isinstance(rows, slice) else len(rows) for array, (_, rows, _) in zip(arrays, parts))
+        dtype = arrays[0].dtype if arrays else np.load(self._column_path(self.manifest['segments'][0]['name'], column), mmap_mode='r').dtype
+        result = np.empty(length, dtype=dtype)
+        for array, (_, rows, targets) in zip(arrays, parts):
+            result[targets] = array[rows]
+        return result
+
+    def _decode(self, name: str, values: np.ndarray) -> Union[np.ndarray, pd.Categorical]:
+        if self.manifest['columns'][name] != 'category':
+            return values
+        categories = self.manifest['categories'][name]
+        # Categorías en orden lexicográfico, como las deja read_csv
+        return pd.Categorical.from_codes(values, categories).reorder_categories(sorted(categories))
+
+    def _ids_above(self, since_id: int) -> np.ndarray:
+        """Ids del snapshot mayores a `since_id` (cada segmento está ordenado por id)"""
+        found = []
+        for segment in self.manifest['segments']:
+            if segment['max_id'] > since_id:
+                ids = np.load(self._column_path(segment['name'], 'id'), mmap_mode='r')
+                found.append(np.asarray(ids[np.searchsorted(ids, since_id, side='right'):]))
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def _empty_manifest(self, df: pd.DataFrame) -> Dict[str, Any]:
+        # Todo lo que no es numérico ni booleano (categóricas y texto) se guarda como códigos
+        columns = {
+            name: 'numeric' if pd.api.types.is_numeric_dtype(df[name].dtype) else 'category'
+            for name in df.columns
+        }
+        return {
+            'columns': columns,
+            'categories': {name: [] for name, kind in columns.items() if kind == 'category'},
+            'segments': [],
+            'max_id': 0
+        }
+
+    def _write_segment(self, manifest: Dict[str, Any], df: pd.DataFrame, encode: bool = True) -> Dict[str, Any]:
+        """Escribir un segmento en un directorio temporal y renombrarlo al terminar"""
+        name = f"segment_{datetime.now().strftime('%Y%m%d%H%M%S%f')}"
+        staging = os.path.join(self.directory, f".{name}.tmp")
+        os.makedirs(staging, exist_ok=True)
+
+        for column, kind in manifest['columns'].items():
+            if kind == 'category':
+                values = self._encode_category(manifest['categories'][column], df[column]) if encode else (
+                    self._recode(manifest['categories'][column], df[column])
+                )
+            else:
+                values = df[column].to_numpy()
+            np.save(os.path.join(staging, f"{column}.npy"), values)
+
+        os.replace(staging, os.path.join(self.directory, name))
+        return {'name': name, 'rows': len(df), 'max_id': int(df['id'].max())}
+
+    @staticmethod
+    def _encode_category(categories: List[str], values: pd.Series) -> np.ndarray:
+        """Códigos estables: las categorías nuevas se agregan al final del diccionario"""
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(str).where(values.notna()).astype('category')
+        known = {category: code for code, category in enumerate(categories)}
+        for category in values.cat.categories:
+            if category not in known:
+                known[category] = len(categories)
+                categories.append(category)
+
+        lookup = np.array([known[category] for category in values.cat.categories], dtype=np.int32)
+        codes = values.cat.codes.to_numpy()
+        return np.where(codes >= 0, lookup[codes] if len(lookup) else -1, -1).astype(np.int32)
+
+    @staticmethod
+    def _recode(categories: List[str], values: pd.Series) -> np.ndarray:
+        """Códigos de una columna ya cargada del snapshot respecto del diccionario guardado"""
+        return values.cat.set_categories(categories).cat.codes.to_numpy().astype(np.int32)
+
+    def _column_path(self, segment: str, column: str) -> str:
+        return os.path.join(self.directory, segment, f"{column}.npy")
+
+    def _read_manifest(self):
+        path = os.path.join(self.directory, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def _commit(self, manifest: Dict[str, Any]):
+        """Publicar el manifiesto de forma atómica: es el punto de confirmación del snapshot"""
+        manifest['updated_at'] = datetime.now().isoformat()
+        os.makedirs(self.directory, exist_ok=True)
+        staging = os.path.join(self.directory, f".{MANIFEST_FILE}.tmp")
+        with open(staging, 'w') as f:
+            json.dump(manifest, f)
+        os.replace(staging, os.path.join(self.directory, MANIFEST_FILE))
+        self.manifest = manifest
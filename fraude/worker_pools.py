@@ -0,0 +1,104 @@
+"""
+Pools acotados para el trabajo bloqueante de los endpoints
+==========================================================
+Los endpoints son `async def` pero llaman a SQLAlchemy, pandas y sklearn de
+forma síncrona. Cada tipo de trabajo se ejecuta en su propio ThreadPoolExecutor
+con un semáforo de admisión: las predicciones individuales no compiten por
+hilos con los análisis de tabla completa, y cuando un pool está lleno la
+petición se rechaza de inmediato (503 + Retry-After) en lugar de encolarse
+sin límite.
+"""
+
+import asyncio
+import functools
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Dict, Iterator
+
+logger = logging.getLogger(__name__)
+
+_EXHAUSTED = object()
+
+class PoolSaturatedError(Exception):
+    """No hay cupo en el pool; el cliente debe reintentar más tarde"""
+
+    def __init__(self, pool_name: str, retry_after: int):
+        super().__init__(f"Servicio saturado ({pool_name}), reintente en {retry_after}s")
+        self.pool_name = pool_name
+        self.retry_after = retry_after
+
+class WorkerPool:
+    """
+    ThreadPoolExecutor con un máximo de trabajos admitidos (en ejecución + en espera)
+
+    `max_in_flight` igual a `max_workers` significa que no hay cola: si todos los
+    hilos están ocupados la petición se rechaza.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_in_flight: int, retry_after: int):
+        self.name = name
+        self.max_workers = max(max_workers, 1)
+        self.max_in_flight = max(max_in_flight, self.max_workers)
+        self.retry_after = retry_after
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"fraude-{name}")
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self.in_flight = 0
+        self.rejected = 0
+        self.completed = 0
+
+    async def admit(self):
+        """Reservar un cupo o fallar de inmediato si no hay"""
+        if self._semaphore.locked():
+            self.rejected += 1
+            raise PoolSaturatedError(self.name, self.retry_after)
+        await self._semaphore.acquire()
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self.completed += 1
+        self._semaphore.release()
+
+    async def run(self, fn: Callable, *args, **kwargs) -> Any:
+        """Ejecutar una función bloqueante en el pool"""
+        await self.admit()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(fn, *args, **kwargs))
+        finally:
+            self.release()
+
+    async def iterate(self, iterator: Iterator) -> AsyncIterator:
+        """
+        Consumir un iterador bloqueante en el pool, un elemento a la vez
+
+        El cupo debe haberse reservado con `admit()` antes de crear la respuesta
+        (así la saturación se reporta como 503 y no a mitad del stream); se
+        libera cuando el iterador termina o el cliente se desconecta.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                item = await loop.run_in_executor(self.executor, next, iterator, _EXHAUSTED)
+                if item is _EXHAUSTED:
+                    break
+                yield item
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                try:
+                    close()
+                except ValueError:
+                    pass  # El hilo todavía está dentro de next(); el generador se cerrará al recolectarse
+            self.release()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_workers": self.max_workers,
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "completed": self.completed,
+            "rejected": self.rejected
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)